@@ -16,9 +16,11 @@ INCLUDING THE WARRANTIES OF DESIGN, MERCHANTABILITY AND FITNESS FOR A PARTICULAR
 For further Information see LICENSE file that comes with this distribution.
 """
 
-from fastapi import FastAPI, Body, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.websockets import WebSocketState
 import jwt
 from datetime import datetime
 from pydantic import BaseModel
@@ -31,13 +33,23 @@ import json
 import msgpack
 import configparser
 import base64
+import asyncio
 from source.device_manager.database import get_redis_pool
 from source.device_manager.data_directories import DATA_DIRECTORY
+from source.device_manager.device_manager import ASYNC_CALL_TIMEOUT
+from source.device_manager.device_status import DEVICE_STATUS_CHANNEL
+from source.device_manager.last_value_cache import get_latest_values_channel
+from source.device_manager.live_data import LiveDataClient, get_live_data_hub, parse_filter
+from source.device_manager.recording_filter import RECORDING_MODES
+from source.device_manager.time_series_sink import SINKS, parse_sink_names
+from source.device_manager.experiment_data import EXPORT_ARROW, EXPORT_MEDIA_TYPES, arrow_available
 
 from source.backend.device_manager_service import DeviceManagerService, DeviceInfoModel, NewDeviceModel, BookingModel, \
     ExperimentBookingModel, ScriptInfoModel, ScriptModel, DeviceCommandParameters, \
-    NewDatabaseModel, DatabaseInfoModel, DeviceCommandParameter
+    NewDatabaseModel, DatabaseInfoModel, DeviceCommandParameter, DeviceBatchModel, \
+    DeviceCallModel, DeviceGroupModel
 import source.device_manager.user as user
+import source.device_manager.array_store as array_store
 from source.device_manager.experiment import get_experiment_user, start_experiment, stop_experiment, receive_experiment_status
 
 
@@ -376,9 +388,10 @@ def delete_device(uuid: str, username: str = Depends(decode_token)):
 
 
 @app.get('/api/deviceStatus/{uuid}')
-def device_status(uuid: str, username: str = Depends(decode_token)):
+async def device_status(uuid: str, username: str = Depends(decode_token)):
     """
-    Get the availability status of the device by pinging the device server and retrieving the booking information
+    Get the availability status of the device stored by the device status monitor. The device server is only pinged
+    if the monitor has not stored a status.
 
     :param uuid: Internally assigned device uuid
     :type uuid: str
@@ -388,11 +401,67 @@ def device_status(uuid: str, username: str = Depends(decode_token)):
     :rtype: DeviceStatus
     """
     device_manager_service = DeviceManagerService()
-    return device_manager_service.get_status(uuid)
+    return await device_manager_service.get_status_async(uuid)
+
+
+@app.get('/api/devices/{uuid}/latest')
+async def device_latest_values(uuid: str, username: str = Depends(decode_token)):
+    """
+    Get the last value of every command and property the data handler records for the device, with the time it was
+    received and the latency of the call. The values are served from the last value cache, the device is not called.
+
+    :param uuid: Internally assigned device uuid
+    :type uuid: str
+    :param username: The name of the executing user
+    :type username: str
+    :return: A list of entries with feature, item, values, time in nanoseconds since the epoch and latency in seconds
+    """
+    device_manager_service = DeviceManagerService()
+    return {'data': await device_manager_service.get_latest_values_async(uuid)}
+
+
+@app.get('/api/devices/{uuid}/arrays')
+def get_device_arrays(uuid: str, feature: str, item: str, field: str, start: int, end: int, format: str = 'npy',
+                      username: str = Depends(decode_token)):
+    """
+    Get the arrays the data handler stored for a list response of a device, like a spectrum, within a time range. The
+    arrays are memory mapped from the block files of the array store, the time-series database only holds a reference
+    to them.
+
+    :param uuid: Internally assigned device uuid
+    :type uuid: str
+    :param feature: The identifier of the feature
+    :type feature: str
+    :param item: The identifier of the command or property
+    :type item: str
+    :param field: The response, as stored in the time-series database, e.g. spectrum/list
+    :type field: str
+    :param start: Nanoseconds since the epoch of the first sample
+    :type start: int
+    :param end: Nanoseconds since the epoch of the last sample
+    :type end: int
+    :param format: 'npy' for a NumPy array with the samples as first dimension or 'arrow' for an Arrow IPC stream with
+        the time and the flattened values of every sample
+    :type format: str
+    :param username: The name of the executing user
+    :type username: str
+    :return: The chunked arrays
+    """
+    if format not in array_store.EXPORT_MEDIA_TYPES:
+        raise HTTPException(400, f'Unknown format {format}, expected one of {", ".join(array_store.EXPORT_MEDIA_TYPES)}')
+    if format == array_store.EXPORT_ARROW and not array_store.arrow_available():
+        raise HTTPException(501, 'The Arrow export requires pyarrow to be installed')
+    device_manager_service = DeviceManagerService()
+    try:
+        chunks = device_manager_service.get_array_slice(uuid, feature, item, field, start, end, format)
+    except array_store.ArrayStoreError as e:
+        raise HTTPException(400, str(e))
+    return StreamingResponse(chunks, media_type=array_store.EXPORT_MEDIA_TYPES[format],
+                             headers={'Content-Disposition': f'attachment; filename="{item}-{start}-{end}.{format}"'})
 
 
 @app.get('/api/deviceFeatures/{uuid}')
-def device_features(uuid: str, username: str = Depends(decode_token)):
+async def device_features(uuid: str, username: str = Depends(decode_token)):
     """
     Get all features and associated information of the requested device.
 
@@ -403,7 +472,7 @@ def device_features(uuid: str, username: str = Depends(decode_token)):
     :return: List of SiLA feature objects that include all associated information
     """
     device_manager_service = DeviceManagerService()
-    return {'data': device_manager_service.get_features(uuid)}
+    return {'data': await device_manager_service.get_features_async(uuid)}
 
 
 @app.get('/api/deviceFeaturesDataHandler/{uuid}')
@@ -421,14 +490,15 @@ def device_features_for_datahandler(uuid: str, username: str = Depends(decode_to
     return {'data': device_manager_service.get_features_for_data_handler(uuid)}
 
 @app.post('/api/device/{uuid}/qualifiedFeatureIdentifier/{feature_originator}/{feature_category}/{feature_identifier}/v{feature_version_major}/command/{command_id}')
-def call_feature_command(uuid: str,
-                         feature_originator: str,
-                         feature_category: str,
-                         feature_identifier: str,
-                         feature_version_major: str,
-                         command_id: str,
-                         parameterList: DeviceCommandParameters,
-                         username: str = Depends(decode_token)):
+async def call_feature_command(uuid: str,
+                               feature_originator: str,
+                               feature_category: str,
+                               feature_identifier: str,
+                               feature_version_major: str,
+                               command_id: str,
+                               parameterList: DeviceCommandParameters,
+                               timeout: float = Query(ASYNC_CALL_TIMEOUT, gt=0),
+                               username: str = Depends(decode_token)):
     """
     Executes the specified command and returns the response
 
@@ -446,6 +516,8 @@ def call_feature_command(uuid: str,
     :type command_id: str
     :param parameterList: A list of parameters required by the command
     :type parameterList: DeviceCommandParameters
+    :param timeout: Seconds after which the call is cancelled and 504 is returned
+    :type timeout: float
     :param username: The name of the executing user
     :type username: str
     :return: The response of the call
@@ -453,19 +525,24 @@ def call_feature_command(uuid: str,
     qualified_feature_identifier = feature_originator + '/' + feature_category + '/' + feature_identifier + '/v' + \
                                    feature_version_major
     device_manager_service = DeviceManagerService()
-    return device_manager_service.call_feature_command(uuid, qualified_feature_identifier,
-                                                       command_id,
-                                                       parameterList.params)
+    try:
+        return await device_manager_service.call_feature_command_async(uuid, qualified_feature_identifier,
+                                                                       command_id,
+                                                                       parameterList.params,
+                                                                       timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, f'Command {command_id} did not finish within {timeout} s')
 
 @app.get('/api/device/{uuid}/qualifiedFeatureIdentifier/{feature_originator}/{feature_category}/{feature_identifier}/v'
          '{feature_version_major}/property/{property_id}')
-def get_feature_property(uuid: str,
-                         feature_originator: str,
-                         feature_category: str,
-                         feature_identifier: str,
-                         feature_version_major: str,
-                         property_id: str,
-                         username: str = Depends(decode_token)):
+async def get_feature_property(uuid: str,
+                               feature_originator: str,
+                               feature_category: str,
+                               feature_identifier: str,
+                               feature_version_major: str,
+                               property_id: str,
+                               timeout: float = Query(ASYNC_CALL_TIMEOUT, gt=0),
+                               username: str = Depends(decode_token)):
     """
     Requests the specified property and returns the response
 
@@ -481,6 +558,8 @@ def get_feature_property(uuid: str,
     :type feature_version_major: str
     :param property_id: The id of the property
     :type property_id: str
+    :param timeout: Seconds after which the call is cancelled and 504 is returned
+    :type timeout: float
     :param username: The name of the executing user
     :type username: str
     :return: The response of the call
@@ -488,8 +567,140 @@ def get_feature_property(uuid: str,
     qualified_feature_identifier = feature_originator + '/' + feature_category + '/' + feature_identifier + '/v' + \
                                    feature_version_major
     device_manager_service = DeviceManagerService()
-    return device_manager_service.get_feature_property(uuid, qualified_feature_identifier,
-                                                       property_id)
+    try:
+        return await device_manager_service.get_feature_property_async(uuid, qualified_feature_identifier,
+                                                                       property_id, timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, f'Property {property_id} could not be read within {timeout} s')
+
+
+@app.post('/api/device/{uuid}/batch')
+async def call_batch(uuid: str,
+                     batch: DeviceBatchModel,
+                     timeout: float = Query(ASYNC_CALL_TIMEOUT, gt=0),
+                     username: str = Depends(decode_token)):
+    """
+    Executes several commands and property reads on one device and returns all responses. Commands are executed in
+    the given order, the property reads between two commands are sent to the device at the same time.
+
+    :param uuid: Internally assigned device uuid
+    :type uuid: str
+    :param batch: The commands and properties to call, identified by their qualified feature identifier
+    :type batch: DeviceBatchModel
+    :param timeout: Seconds after which all unfinished calls are cancelled, also on the device
+    :type timeout: float
+    :param username: The name of the executing user
+    :type username: str
+    :return: The response or the error of every call, in the order of the calls
+    """
+    device_manager_service = DeviceManagerService()
+    return {'data': await device_manager_service.call_batch_async(uuid, batch.calls, timeout)}
+
+
+@app.get('/api/deviceGroups')
+def get_device_groups(username: str = Depends(decode_token)):
+    """
+    Get all device groups
+
+    :param username: The name of the executing user
+    :type username: str
+    :return: A list of all device groups with the uuids of their devices
+    """
+    device_manager_service = DeviceManagerService()
+    return {'data': device_manager_service.get_device_groups()}
+
+
+@app.post('/api/deviceGroups')
+def add_device_group(group: DeviceGroupModel, username: str = Depends(decode_token)):
+    """
+    Add a new device group
+
+    :param group: The name of the group and the uuids of its devices
+    :type group: DeviceGroupModel
+    :param username: The name of the executing user
+    :type username: str
+    :return: The id of the new group
+    """
+    device_manager_service = DeviceManagerService()
+    return {'id': device_manager_service.add_device_group(group)}
+
+
+@app.get('/api/deviceGroups/{id}')
+def get_device_group(id: int, username: str = Depends(decode_token)):
+    """
+    Get a device group
+
+    :param id: The id of the device group
+    :type id: int
+    :param username: The name of the executing user
+    :type username: str
+    :return: The device group with the uuids of its devices
+    """
+    device_manager_service = DeviceManagerService()
+    group = device_manager_service.get_device_group(id)
+    if group is None:
+        raise HTTPException(404, f'Device group {id} does not exist')
+    return group
+
+
+@app.put('/api/deviceGroups/{id}')
+def set_device_group(id: int, group: DeviceGroupModel, username: str = Depends(decode_token)):
+    """
+    Change the name and the devices of a device group
+
+    :param id: The id of the device group
+    :type id: int
+    :param group: The name of the group and the uuids of its devices
+    :type group: DeviceGroupModel
+    :param username: The name of the executing user
+    :type username: str
+    :return: None
+    """
+    device_manager_service = DeviceManagerService()
+    if not device_manager_service.set_device_group(id, group):
+        raise HTTPException(404, f'Device group {id} does not exist')
+    return
+
+
+@app.delete('/api/deviceGroups/{id}')
+def delete_device_group(id: int, username: str = Depends(decode_token)):
+    """
+    Delete a device group, the devices themselves are not affected
+
+    :param id: The id of the device group
+    :type id: int
+    :param username: The name of the executing user
+    :type username: str
+    :return: None
+    """
+    device_manager_service = DeviceManagerService()
+    device_manager_service.delete_device_group(id)
+    return
+
+
+@app.post('/api/deviceGroups/{id}/broadcast')
+async def broadcast_to_device_group(id: int,
+                                    call: DeviceCallModel,
+                                    timeout: float = Query(ASYNC_CALL_TIMEOUT, gt=0),
+                                    username: str = Depends(decode_token)):
+    """
+    Executes the same command or property read on all devices of a group in parallel
+
+    :param id: The id of the device group
+    :type id: int
+    :param call: The command or property to call, identified by its qualified feature identifier
+    :type call: DeviceCallModel
+    :param timeout: Seconds after which the calls to all devices that have not answered are cancelled
+    :type timeout: float
+    :param username: The name of the executing user
+    :type username: str
+    :return: The response or the error of every device, keyed by device uuid
+    """
+    device_manager_service = DeviceManagerService()
+    results = await device_manager_service.broadcast_async(id, call, timeout)
+    if results is None:
+        raise HTTPException(404, f'Device group {id} does not exist')
+    return {'data': results}
 
 
 @app.get('/api/databases')
@@ -506,17 +717,25 @@ def get_databases(username: str = Depends(decode_token)):
     return {'data': device_manager_service.get_databases()}
 
 
+def _check_sinks(sinks: str):
+    for sink in parse_sink_names(sinks):
+        if sink not in SINKS:
+            raise HTTPException(400, f'Unknown sink {sink}, expected one of {", ".join(SINKS)}')
+
+
 @app.post('/api/databases')
 def add_database(database: NewDatabaseModel, username: str = Depends(decode_token)):
     """
     Add a new database to the system. The database information is stored in the postgreSQL database.
 
-    :param database: An object containing the information of the new database, i.e. connection details and name.
+    :param database: An object containing the information of the new database, i.e. connection details, name and the
+        comma separated sinks the data handler writes into ('influx', 'file' and 'timescale')
     :type database: NewDatabaseModel
     :param username: The name of the executing user
     :type username: str
     :return: None
     """
+    _check_sinks(database.sinks)
     device_manager_service = DeviceManagerService()
     device_manager_service.add_database(database)
     return
@@ -552,6 +771,46 @@ def database_status(id: int, username: str = Depends(decode_token)):
     device_manager_service = DeviceManagerService()
     return device_manager_service.get_database_status(id)
 
+@app.get('/api/ingestionStats')
+def get_ingestion_stats(username: str = Depends(decode_token)):
+    """
+    Get the statistics of the data handler ingestion per database and sink, i.e. the number of queued, written, replayed,
+    rejected and dropped points, the throughput in points/s, the latency of the last flush and the bytes of the
+    write-ahead log that are still pending, were lost or were skipped as corrupt
+
+    :param username: The name of the executing user
+    :type username: str
+    :return: A list of statistics, one per database and sink
+    """
+    device_manager_service = DeviceManagerService()
+    return {'data': device_manager_service.get_ingestion_stats()}
+
+@app.get('/api/pollingStats')
+def get_polling_stats(username: str = Depends(decode_token)):
+    """
+    Get the statistics of the data handler per polled command and property, i.e. the achieved sampling period in
+    seconds, the latency of the last call and the number of samples, failed calls and skipped ticks
+
+    :param username: The name of the executing user
+    :type username: str
+    :return: A list of statistics, one per device and polled command or property
+    """
+    device_manager_service = DeviceManagerService()
+    return {'data': device_manager_service.get_polling_stats()}
+
+@app.get('/api/containerStartStats')
+def get_container_start_stats(username: str = Depends(decode_token)):
+    """
+    Get the histogram of the seconds from the start of an experiment until its container runs, counted separately for
+    containers taken from the warm pool and containers created on demand
+
+    :param username: The name of the executing user
+    :type username: str
+    :return: The upper bounds of the buckets in seconds and the counts, total count and sum of seconds per kind
+    """
+    device_manager_service = DeviceManagerService()
+    return {'data': device_manager_service.get_container_start_stats()}
+
 @app.put('/api/databases/{id}')
 def set_database(id: int,
                  database: DatabaseInfoModel,
@@ -567,6 +826,7 @@ def set_database(id: int,
     :type username: str
     :return:
     """
+    _check_sinks(database.sinks)
     device_manager_service = DeviceManagerService()
     device_manager_service.set_database(id, database)
     return
@@ -670,6 +930,11 @@ def set_feature_attributes_for_data_handler(uuid: str,
     return
 
 
+def _check_recording_mode(recording_mode: Optional[str]):
+    if recording_mode is not None and recording_mode not in RECORDING_MODES:
+        raise HTTPException(400, f'Unknown recording mode {recording_mode}, expected one of {", ".join(RECORDING_MODES)}')
+
+
 @app.put('/api/devices/{uuid}/features/{feature_id}/commands/{command_id}/dataHandler')
 def set_command_attributes_for_data_handler(uuid: str,
                                             feature_id: str,
@@ -679,6 +944,9 @@ def set_command_attributes_for_data_handler(uuid: str,
                                             meta: bool = Body(...),
                                             nonMetaInterval: int = Body(default=None),
                                             metaInterval: int = Body(default=None),
+                                            recordingMode: str = Body(default=None),
+                                            deadband: float = Body(default=None),
+                                            maxSilence: int = Body(default=None),
                                             username: str = Depends(decode_token)):
     """
     Set the state of the data acquisition mode on a command level. De/Activate data acquisition and switch from meta to
@@ -700,14 +968,25 @@ def set_command_attributes_for_data_handler(uuid: str,
     :type nonMetaInterval: int
     :param metaInterval: Polling interval for meta data acquisition
     :type metaInterval: int
+    :param recordingMode: Which samples are written to the database: 'always', 'on_change', 'absolute_deadband' or
+        'relative_deadband'. Unchanged if not given.
+    :type recordingMode: str
+    :param deadband: The change of a numeric value that is recorded, absolute or relative to the last recorded value
+        depending on the recording mode. Unchanged if not given.
+    :type deadband: float
+    :param maxSilence: Seconds after which an unchanged sample is recorded anyway, 0 never records unchanged samples.
+        Unchanged if not given.
+    :type maxSilence: int
     :param username: The name of the executing user
     :type username: str
     :return: None
     :return:
     """
+    _check_recording_mode(recordingMode)
     device_manager_service = DeviceManagerService()
     device_manager_service.set_command_attributes_for_data_handler(uuid, feature_id, command_id, active, meta,
-                                                                   nonMetaInterval, metaInterval, parameters)
+                                                                   nonMetaInterval, metaInterval, parameters,
+                                                                   recordingMode, deadband, maxSilence)
     return
 
 
@@ -719,6 +998,9 @@ def set_property_attributes_for_data_handler(uuid: str,
                                              meta: bool = Body(...),
                                              nonMetaInterval: int = Body(default=None),
                                              metaInterval: int = Body(default=None),
+                                             recordingMode: str = Body(default=None),
+                                             deadband: float = Body(default=None),
+                                             maxSilence: int = Body(default=None),
                                              username: str = Depends(decode_token)):
     """
     Set the state of the data acquisition mode on a property level. De/Activate data acquisition and switch from meta to
@@ -738,13 +1020,24 @@ def set_property_attributes_for_data_handler(uuid: str,
     :type nonMetaInterval: int
     :param metaInterval: Polling interval for meta data acquisition
     :type metaInterval: int
+    :param recordingMode: Which samples are written to the database: 'always', 'on_change', 'absolute_deadband' or
+        'relative_deadband'. Unchanged if not given.
+    :type recordingMode: str
+    :param deadband: The change of a numeric value that is recorded, absolute or relative to the last recorded value
+        depending on the recording mode. Unchanged if not given.
+    :type deadband: float
+    :param maxSilence: Seconds after which an unchanged sample is recorded anyway, 0 never records unchanged samples.
+        Unchanged if not given.
+    :type maxSilence: int
     :param username: The name of the executing user
     :type username: str
     :return: None
     """
+    _check_recording_mode(recordingMode)
     device_manager_service = DeviceManagerService()
     device_manager_service.set_property_attributes_for_data_handler(uuid, feature_id, property_id, active, meta,
-                                                                    nonMetaInterval, metaInterval)
+                                                                    nonMetaInterval, metaInterval, recordingMode,
+                                                                    deadband, maxSilence)
     return
 
 
@@ -941,6 +1234,32 @@ def create_experiment(experiment: ExperimentBookingModel,
     return
 
 
+@app.get('/api/experiments/{experimentID}/data')
+def get_experiment_data(experimentID: int, format: str = 'csv', username: str = Depends(decode_token)):
+    """
+    Export the data recorded by the data handler during an experiment. The samples are selected by their experiment
+    tag and streamed in chunks while they are read from the databases of the booked devices. Every row holds one field
+    of one sample: the time in nanoseconds, the booking id, device, feature, command or property, field and value.
+
+    :param experimentID: The internal experiment id
+    :type experimentID: int
+    :param format: 'csv' or 'arrow' for an Arrow IPC stream, which stores numeric values in a number column and all
+        other values in a text column
+    :type format: str
+    :param username: The name of the executing user
+    :type username: str
+    :return: The chunked export
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(400, f'Unknown format {format}, expected one of {", ".join(EXPORT_MEDIA_TYPES)}')
+    if format == EXPORT_ARROW and not arrow_available():
+        raise HTTPException(501, 'The Arrow export requires pyarrow to be installed')
+    device_manager_service = DeviceManagerService()
+    return StreamingResponse(device_manager_service.get_experiment_data(experimentID, format),
+                             media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={'Content-Disposition': f'attachment; filename="experiment-{experimentID}.{format}"'})
+
+
 @app.put('/api/experiments/edit/{experimentID}')
 def edit_experiment(experimentID: int,
                     experiment: ExperimentBookingModel,
@@ -1184,6 +1503,124 @@ async def experiment_status_websocket(
         print("Websocket status disconnect")
 
 
+# Todo allow authentication !
+@app.websocket("/ws/device_status")
+async def device_status_websocket(
+        websocket: WebSocket):  # , username:str = Depends(decode_token)):
+    """
+    Asynchronous function that forwards the status transitions of the devices detected by the device status monitor
+    via websocket
+
+    :param websocket: The websocket the information is transferred by
+    :type websocket: Websocket
+    :return: None
+    """
+    # Every websocket has its own connection, the channel of a shared pool would hand each transition to only one of
+    # the clients
+    connection = await aioredis.create_redis('redis://localhost')
+    try:
+        channels = await connection.subscribe(DEVICE_STATUS_CHANNEL)
+        await websocket.accept()
+        print("Websocket device status connect")
+        while await channels[0].wait_message():
+            message = msgpack.unpackb(await channels[0].get(), raw=False)
+            await websocket.send_json(data=message)
+        await websocket.close(code=1000)
+    except WebSocketDisconnect:
+        print("Websocket device status disconnect")
+    finally:
+        connection.close()
+        await connection.wait_closed()
+
+
+# Todo allow authentication !
+@app.websocket("/ws/devices/{uuid}/latest")
+async def device_latest_values_websocket(websocket: WebSocket, uuid: str):
+    """
+    Asynchronous function that sends the last values of the recorded commands and properties of a device and then
+    forwards every update of the last value cache via websocket
+
+    :param websocket: The websocket the information is transferred by
+    :type websocket: Websocket
+    :param uuid: Internally assigned device uuid
+    :type uuid: str
+    :return: None
+    """
+    # Every websocket has its own connection, the channel of a shared pool would hand each update to only one of the
+    # clients watching the same device
+    connection = await aioredis.create_redis('redis://localhost')
+    try:
+        channels = await connection.subscribe(get_latest_values_channel(uuid))
+        await websocket.accept()
+        print("Websocket latest values connect")
+        # Subscribed before the snapshot is read, so no update is lost in between
+        device_manager_service = DeviceManagerService()
+        await websocket.send_json(data=await device_manager_service.get_latest_values_async(uuid))
+        while await channels[0].wait_message():
+            message = msgpack.unpackb(await channels[0].get(), raw=False)
+            await websocket.send_json(data=message)
+        await websocket.close(code=1000)
+    except WebSocketDisconnect:
+        print("Websocket latest values disconnect")
+    finally:
+        connection.close()
+        await connection.wait_closed()
+
+
+# Todo allow authentication !
+@app.websocket("/ws/experiments/{experimentID}/data")
+async def experiment_data_websocket(websocket: WebSocket, experimentID: int, devices: Optional[str] = None,
+                                    items: Optional[str] = None):
+    """
+    Asynchronous function that forwards the samples recorded for an experiment via websocket, in batches of at most
+    one per 100 ms. Every message is an object with the samples and the number of samples dropped because the client
+    did not keep up. The filter can be replaced by sending an object with devices and items lists.
+
+    :param websocket: The websocket the information is transferred by
+    :type websocket: Websocket
+    :param experimentID: The id of the experiment
+    :type experimentID: int
+    :param devices: Comma separated uuids of the devices to send, all devices if not set
+    :type devices: str
+    :param items: Comma separated commands and properties to send, as identifier or feature/identifier, all if not set
+    :type items: str
+    :return: None
+    """
+    client = LiveDataClient(parse_filter(devices), parse_filter(items))
+    hub = get_live_data_hub()
+    await websocket.accept()
+    await hub.add_client(experimentID, client)
+    print("Websocket experiment data connect")
+
+    async def receive_filters():
+        try:
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                    client.set_filter(parse_filter(message.get('devices')), parse_filter(message.get('items')))
+                except (ValueError, AttributeError):
+                    print("Websocket experiment data received an invalid filter")
+        except WebSocketDisconnect:
+            client.close()
+
+    receiver = asyncio.ensure_future(receive_filters())
+    try:
+        while True:
+            batch = await client.get()
+            if batch is None:
+                # Closed after the websocket was disconnected or after the live data subscription was lost
+                if websocket.client_state == WebSocketState.CONNECTED:
+                    await websocket.close(code=1011)
+                break
+            await websocket.send_json(data={'samples': batch[0], 'dropped': batch[1]})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        await hub.remove_client(experimentID, client)
+        print("Websocket experiment data disconnect")
+
+
 # Todo allow authentication !
 @app.websocket("/ws/experiments_logs")
 async def experiment_logs_websocket(
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compares the time needed to load the features of a dynamic client with and without the stub cache.
+
+The standard features shipped with sila2lib are loaded for a number of simulated devices, once the way
+DynamicSiLA2Client.run() loaded them before (code generation and import per device) and once from the stub cache
+(cold, warm on disk and warm in the process). No SiLA server is needed, the channel is never used.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_dynamic_client_connect [number of devices]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import grpc
+import sila2lib
+from sila2lib.proto_builder.dynamic_feature import DynamicFeature
+
+import source.device_manager.device_layer.stub_cache as stub_cache
+
+FEATURE_DEFINITIONS = os.path.join(os.path.dirname(sila2lib.__file__), 'framework', 'feature_definitions',
+                                   'org.silastandard')
+
+
+def copy_feature_definitions(directory: str):
+    """Each simulated device gets its own copy of the FDL files, like in the device directories"""
+    fdl_files = []
+    os.makedirs(directory)
+    for file in sorted(os.listdir(FEATURE_DEFINITIONS)):
+        if file.endswith('.sila.xml'):
+            fdl_files.append(shutil.copy(os.path.join(FEATURE_DEFINITIONS, file), directory))
+    return fdl_files
+
+
+def load_without_cache(fdl_files, channel):
+    for fdl_file in fdl_files:
+        feature = DynamicFeature(fdl_file=fdl_file, channel=channel)
+        del sys.modules[feature._module_pb2.__name__]
+        del sys.modules[feature._module_pb2_grpc.__name__]
+        sys.path.remove(os.path.dirname(fdl_file))
+
+
+def load_with_cache(fdl_files, channel):
+    for fdl_file in fdl_files:
+        stub_cache.CachedDynamicFeature(fdl_file=fdl_file, channel=channel)
+
+
+def measure(name, function, devices, channel):
+    start = time.perf_counter()
+    for fdl_files in devices:
+        function(fdl_files, channel)
+    duration = time.perf_counter() - start
+    print(f'{name:<40}{duration:10.3f} s total {1000 * duration / len(devices):10.1f} ms per device')
+
+
+def main():
+    device_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    directory = tempfile.mkdtemp()
+    stub_cache.STUB_CACHE_DIRECTORY = os.path.join(directory, 'stubs')
+    channel = grpc.insecure_channel('localhost:50051')
+    try:
+        devices = [copy_feature_definitions(os.path.join(directory, f'device-{i}')) for i in range(device_count)]
+        print(f'{device_count} devices with {len(devices[0])} features each')
+        measure('code generation per device (before)', load_without_cache, devices, channel)
+        stub_cache.clear_stub_cache()
+        measure('stub cache, empty', load_with_cache, devices, channel)
+        stub_cache._loaded_features.clear()
+        measure('stub cache, on disk (new process)', load_with_cache, devices, channel)
+        measure('stub cache, loaded in process', load_with_cache, devices, channel)
+    finally:
+        channel.close()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Measures the throughput of the data handler ingestion pipeline.
+
+A local HTTP server that accepts every write like InfluxDB stands in for the database, so the benchmark measures the
+queueing, write-ahead logging, line protocol encoding and gzip compression of the pipeline, not the database.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_ingestion [number of points] [number of producer threads]
+"""
+import gzip
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import source.device_manager.ingestion as ingestion
+from source.device_manager.device_layer.database_info import DatabaseInfo
+
+
+class InfluxDBStandIn(BaseHTTPRequestHandler):
+    points = 0
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.startswith('/write'):
+            if self.headers.get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            # One line of line protocol per point
+            InfluxDBStandIn.points += data.count(b'\n')
+            self.send_response(204)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        if not self.path.startswith('/write'):
+            self.wfile.write(b'{"results": [{"statement_id": 0}]}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    producers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    server = ThreadingHTTPServer(('localhost', 0), InfluxDBStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    info = DatabaseInfo(1, 'benchmark', 'localhost', server.server_address[1], '', '')
+
+    ingestion.STATS_INTERVAL = 3600
+    wal_directory = tempfile.TemporaryDirectory()
+    pipeline = ingestion.IngestionPipeline(wal_directory=wal_directory.name)
+
+    def produce(count: int, producer: int):
+        for i in range(count):
+            pipeline.submit(info, ingestion.Sample(
+                'device_manager',
+                {'device': f'device-{producer}', 'feature': 'TemperatureController', 'property': 'Temperature'},
+                {'temperature/real': 37.0 + i % 10 / 10, 'unit/string': 'degC'},
+                time.time_ns()))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=produce, args=(total // producers, p)) for p in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    submitted = time.perf_counter() - start
+    while sum(stats.written for stats in pipeline.get_stats()) < producers * (total // producers):
+        time.sleep(0.01)
+    duration = time.perf_counter() - start
+    stats = pipeline.get_stats()[0]
+    print(f'{stats.written} points from {producers} producers, {InfluxDBStandIn.points} points received')
+    print(f'submitted in {submitted:.2f} s, written in {duration:.2f} s: {stats.written / duration:.0f} points/s')
+    print(f'last flush latency {1000 * stats.flush_latency:.1f} ms, queue latency {1000 * stats.queue_latency:.1f} ms')
+    server.shutdown()
+    wal_directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
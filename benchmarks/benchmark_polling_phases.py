@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Measures how evenly the polling planner spreads the polls of the data handler over time.
+
+Many items with the same interval are subscribed at once, like the items of an experiment with many devices. The polls
+are counted in buckets of one timer wheel tick, once with the polls starting at the subscription, like the former
+APScheduler jobs, and once with the phase offsets of the planner. A flat load has a peak close to the mean.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_polling_phases [number of items] [interval in seconds] [jitter]
+"""
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+import source.device_manager.polling_planner as polling_planner
+from source.device_manager.polling import PollingExecutor
+
+
+class RecordingExecutor(PollingExecutor):
+    """Records the time of every due item instead of polling it"""
+    def __init__(self):
+        super().__init__(1)
+        self.times = []
+        self._times_lock = threading.Lock()
+
+    def tick(self, device_uuid, items):
+        now = time.monotonic()
+        with self._times_lock:
+            self.times.extend(now for _ in items)
+
+
+def measure(items: int, interval: float, jitter: float, spread_phases: bool):
+    executor = RecordingExecutor()
+    planner = polling_planner.PollingPlanner(executor, {'property': lambda device, item, subscriptions: None},
+                                             jitter=jitter, spread_phases=spread_phases)
+    end = time.time() + 3600
+    for i in range(items):
+        planner.subscribe(1, f'device-{i // 10}', 'property', ('Feature', f'Property{i % 10}'), 'Feature',
+                          f'Property{i % 10}', None, interval, end)
+    start = time.monotonic()
+    # Skip the first interval, in which the spread polls have not all started yet
+    time.sleep(3 * interval)
+    planner.stop()
+    buckets = Counter(int((t - start) / polling_planner.RESOLUTION) for t in executor.times
+                      if t - start >= interval)
+    ticks = int(2 * interval / polling_planner.RESOLUTION)
+    counts = [buckets.get(tick, 0) for tick in range(int(interval / polling_planner.RESOLUTION),
+                                                     int(interval / polling_planner.RESOLUTION) + ticks)]
+    return max(counts), statistics.mean(counts), statistics.pstdev(counts)
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    jitter = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    polling_planner.STATS_INTERVAL = 3600
+    print(f'{items} items with an interval of {interval} s, polls per {1000 * polling_planner.RESOLUTION:.0f} ms')
+    for name, spread_phases in (('start at subscription', False), ('phase offsets', True)):
+        peak, mean, stdev = measure(items, interval, jitter, spread_phases)
+        print(f'{name:>22}: peak {peak}, mean {mean:.1f}, standard deviation {stdev:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of encoding the samples of the data handler per point for every time-series sink.
+
+The samples look like those of the data handler: a few devices and items with two fields each. The line protocol of
+the InfluxDB client, which the ingestion pipeline used before the sinks, is measured for comparison. Only the encoding
+is measured, nothing is sent.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_sink_encoding [number of points] [batch size]
+"""
+import sys
+import time
+
+from influxdb.line_protocol import make_line
+
+from source.device_manager.ingestion import Sample
+from source.device_manager.time_series_sink import SINKS, create_sink
+
+
+def make_samples(count: int):
+    return [Sample('device_manager',
+                   {'device': f'device-{i % 20}', 'feature': 'TemperatureController', 'property': f'Property{i % 10}'},
+                   {'temperature/real': 37.0 + i % 10 / 10, 'unit/string': 'degC'},
+                   time.time_ns() + i)
+            for i in range(count)]
+
+
+def measure(encode, samples, batch_size: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(samples), batch_size):
+        encode(samples[i:i + batch_size])
+    return (time.perf_counter() - start) / len(samples)
+
+
+def encode_with_influxdb_client(samples):
+    return ('\n'.join(make_line(sample.measurement, sample.tags, sample.fields, sample.time)
+                      for sample in samples) + '\n').encode()
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    samples = make_samples(total)
+    print(f'{total} points in batches of {batch_size}, encoding time per point')
+    print(f'{"influxdb make_line":>20}: {measure(encode_with_influxdb_client, samples, batch_size) * 1e6:.2f} us')
+    for name in SINKS:
+        sink = create_sink(name)
+        print(f'{name:>20}: {measure(sink.encode, samples, batch_size) * 1e6:.2f} us')
+
+
+if __name__ == '__main__':
+    main()
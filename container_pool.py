@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import configparser
+import threading
+import uuid
+from typing import Iterable, List, Tuple
+
+import docker
+
+import docker_helper
+from source.device_manager.data_directories import DATA_DIRECTORY
+
+#: Docker label of the idle containers of the pool, used to adopt them after a restart of the scheduler
+POOL_LABEL = 'device-manager.pool'
+#: Name prefix of the idle containers, labels cannot be changed, so a taken container is told apart by its new name
+POOL_NAME_PREFIX = 'pool-'
+#: Number of idle containers kept ready, 0 creates every container when its experiment starts
+POOL_SIZE = 2
+#: Seconds the pool waits before it tries again after a container could not be created
+REPLENISH_RETRY_DELAY = 10
+
+
+def read_container_pool_config():
+    """Returns the ContainerPool section of the config file, an empty dict if there is none"""
+    config = configparser.ConfigParser()
+    config.read(f'{DATA_DIRECTORY}/device-manager.conf')
+    return config['ContainerPool'] if config.has_section('ContainerPool') else {}
+
+
+class ContainerPool:
+    """Idle user_script containers created ahead of time, so an experiment only has to copy its script into one and
+    start it
+
+    A background thread creates containers until the pool is full and replaces every container that is taken. If the
+    pool is empty, a container is created on demand.
+    """
+    def __init__(self, size: int = POOL_SIZE):
+        """
+        :param size: Number of idle containers
+        """
+        self.size = size
+        self._client = None
+        self._idle: List = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def start(self, client, used_container_ids: Iterable[str] = ()):
+        """
+        :param client: The Docker client shared by the scheduler
+        :param used_container_ids: Containers of experiments, which are never adopted even if they have not been
+            renamed yet
+        """
+        self._client = client
+        used_container_ids = set(used_container_ids)
+        try:
+            # Idle containers of the previous run are used first
+            self._idle = [
+                container for container in
+                self._client.containers.list(all=True, filters={'label': POOL_LABEL, 'status': 'created'})
+                if container.name.startswith(POOL_NAME_PREFIX) and container.id not in used_container_ids
+            ]
+        except docker.errors.DockerException as e:
+            print(f'Could not list the idle containers: {e}')
+        if self.size > 0:
+            threading.Thread(target=self._replenish, daemon=True).start()
+            self.fill()
+
+    def _replenish(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        break
+                try:
+                    container = docker_helper.create_idle_container(self._client,
+                                                                    f'{POOL_NAME_PREFIX}{uuid.uuid4().hex[:12]}',
+                                                                    labels={POOL_LABEL: '1'})
+                except docker.errors.DockerException as e:
+                    print(f'Could not create an idle container: {e}')
+                    self._wake.wait(REPLENISH_RETRY_DELAY)
+                    continue
+                with self._lock:
+                    self._idle.append(container)
+
+    def fill(self):
+        """Wakes the background thread, which creates containers until the pool is full"""
+        self._wake.set()
+
+    def acquire(self, name: str) -> Tuple[object, bool]:
+        """Returns a created container for an experiment and whether it was taken from the pool
+
+        :param name: The name of the container
+        """
+        while True:
+            with self._lock:
+                container = self._idle.pop(0) if self._idle else None
+            if container is None:
+                break
+            self.fill()
+            try:
+                container.rename(name)
+                return container, True
+            except docker.errors.NotFound:
+                # Removed since it was created
+                continue
+            except docker.errors.APIError as e:
+                # Names have to be unique, the container must not keep its pool name though
+                print(f'Could not rename container {container.name} to {name}: {e}')
+                container.rename(f'{name}-{container.short_id}')
+                return container, True
+        self.fill()
+        return docker_helper.create_idle_container(self._client, name), False
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import ssl
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Thread
+from typing import Callable, Dict, List, Optional
+
+import docker
+
+from source.device_manager.data_directories import TEMP_DIRECTORY
+
+#: Seconds the supervisor waits before it subscribes to the Docker events again after the stream was interrupted
+EVENTS_RECONNECT_DELAY = 1
+#: Bytes read from a log stream at once
+READ_SIZE = 65536
+#: Header of a frame of a multiplexed container stream: stream type, 3 bytes padding, payload size
+FRAME_HEADER = struct.Struct('>BxxxL')
+
+
+@dataclass
+class _WatchedContainer:
+    container_id: str
+    experiment_id: int
+    log_file: object = None
+    socket: object = None
+    buffer: bytes = b''
+    lines: Dict[int, bytes] = field(default_factory=dict)
+    # The messages of the lines read since the last batch was handed to the log writer
+    messages: List[str] = field(default_factory=list)
+    exit_code: Optional[int] = None
+    end_of_logs: bool = False
+
+
+class ContainerSupervisor:
+    """Watches the containers of all experiments from one event loop over the shared Docker client
+
+    The logs of a container are read from its attach stream, which is registered with the event loop, so reading the
+    logs of many containers needs no thread per container. Exits are taken from the Docker events stream, which a
+    single thread forwards to the event loop. A container has ended once its exit is known and its logs are read
+    completely, then it is removed and the exit is reported.
+
+    The event loop itself does not block: the requests to the Docker API run in the default executor, and the lines of
+    one read are handed as one batch to a single log writer thread, which prints them, appends them to the log file of
+    the container and forwards them in order.
+    """
+    def __init__(self, client, on_log: Callable[[int, List[str]], None], on_exit: Callable[[int, int], None]):
+        """
+        :param client: The Docker client shared by the scheduler
+        :param on_log: Called with the experiment id and the lines of the logs read at once, in the log writer thread
+        :param on_exit: Called with the experiment id and the exit code once a container has ended and its logs have
+            been forwarded, in the log writer thread
+        """
+        self._client = client
+        self._on_log = on_log
+        self._on_exit = on_exit
+        self._loop = asyncio.new_event_loop()
+        self._log_writer = ThreadPoolExecutor(1, thread_name_prefix='container-logs')
+        self._watched: Dict[str, _WatchedContainer] = {}
+
+    def start(self):
+        Thread(target=self._loop.run_forever, daemon=True).start()
+        Thread(target=self._forward_exits, daemon=True).start()
+
+    def watch(self, container_id: str, experiment_id: int):
+        """Starts watching a container, which may also have ended already, e.g. while the scheduler was not running"""
+        self._loop.call_soon_threadsafe(self._loop.create_task, self._watch(container_id, experiment_id))
+
+    def _forward_exits(self):
+        while True:
+            try:
+                for event in self._client.events(decode=True, filters={'type': 'container', 'event': 'die'}):
+                    exit_code = int(event.get('Actor', {}).get('Attributes', {}).get('exitCode', -1))
+                    self._loop.call_soon_threadsafe(self._set_exit_code, event['id'], exit_code)
+            except Exception as e:
+                # Connection errors of requests are no DockerException
+                print(f'Lost the Docker events stream: {e}')
+            time.sleep(EVENTS_RECONNECT_DELAY)
+            # Exits during the interruption are picked up by inspecting the watched containers
+            self._loop.call_soon_threadsafe(self._check_watched)
+
+    async def _watch(self, container_id: str, experiment_id: int):
+        if container_id in self._watched:
+            return
+        watched = _WatchedContainer(container_id, experiment_id)
+        self._watched[container_id] = watched
+        try:
+            socket = await self._loop.run_in_executor(None, self._attach, watched)
+            watched.socket = getattr(socket, '_sock', socket)
+            watched.socket.setblocking(False)
+            self._loop.add_reader(watched.socket.fileno(), self._read, watched)
+        except (docker.errors.DockerException, OSError) as e:
+            print(f'Could not read the logs of container {container_id}: {e}')
+            watched.end_of_logs = True
+        print('Output stream started!')
+        # The container may have stopped before its die event could be received
+        await self._check_exit(watched)
+
+    def _attach(self, watched: _WatchedContainer):
+        """Opens the log file and the attach stream of a container, runs in the executor"""
+        os.makedirs(os.path.join(TEMP_DIRECTORY, 'container'), exist_ok=True)
+        log_path = os.path.join(TEMP_DIRECTORY, 'container',
+                                f'{datetime.now().strftime("%d_%m_%Y-%H_%M_%S")}_{str(watched.experiment_id)}.log')
+        watched.log_file = open(log_path, 'w')
+        # The attach stream starts with the logs written so far
+        return self._client.api.attach_socket(watched.container_id, params={'stdout': 1, 'stderr': 1, 'stream': 1,
+                                                                            'logs': 1})
+
+    async def _check_exit(self, watched: _WatchedContainer):
+        try:
+            state = (await self._loop.run_in_executor(None, self._client.api.inspect_container,
+                                                      watched.container_id))['State']
+        except docker.errors.NotFound:
+            self._set_exit_code(watched.container_id, -1)
+            return
+        except docker.errors.DockerException as e:
+            print(f'Could not inspect container {watched.container_id}: {e}')
+            return
+        if state['Status'] in ('exited', 'dead'):
+            self._set_exit_code(watched.container_id, state['ExitCode'])
+
+    def _check_watched(self):
+        for watched in list(self._watched.values()):
+            self._loop.create_task(self._check_exit(watched))
+
+    def _read(self, watched: _WatchedContainer):
+        while True:
+            try:
+                data = watched.socket.recv(READ_SIZE)
+            except (BlockingIOError, ssl.SSLWantReadError):
+                break
+            except OSError as e:
+                print(f'Could not read the logs of container {watched.container_id}: {e}')
+                data = b''
+            if not data:
+                self._loop.remove_reader(watched.socket.fileno())
+                watched.socket.close()
+                watched.end_of_logs = True
+                self._flush_lines(watched)
+                break
+            watched.buffer += data
+            self._parse_frames(watched)
+        self._write_messages(watched)
+        self._finish(watched)
+
+    def _parse_frames(self, watched: _WatchedContainer):
+        while len(watched.buffer) >= FRAME_HEADER.size:
+            stream, size = FRAME_HEADER.unpack_from(watched.buffer)
+            if len(watched.buffer) < FRAME_HEADER.size + size:
+                return
+            payload = watched.buffer[FRAME_HEADER.size:FRAME_HEADER.size + size]
+            watched.buffer = watched.buffer[FRAME_HEADER.size + size:]
+            # Lines may be split across frames, stdout and stderr are joined separately
+            *lines, watched.lines[stream] = (watched.lines.get(stream, b'') + payload).split(b'\n')
+            for line in lines:
+                self._log(watched, line)
+
+    def _flush_lines(self, watched: _WatchedContainer):
+        for line in watched.lines.values():
+            if line:
+                self._log(watched, line)
+        watched.lines = {}
+
+    def _log(self, watched: _WatchedContainer, line: bytes):
+        # The same format as the timestamped logs of Docker
+        watched.messages.append(f'{datetime.utcnow().isoformat()}Z {line.decode(errors="replace")}\n')
+
+    def _write_messages(self, watched: _WatchedContainer):
+        if watched.messages:
+            messages, watched.messages = watched.messages, []
+            self._log_writer.submit(self._write_log, watched.experiment_id, watched.log_file, messages)
+
+    def _write_log(self, experiment_id: int, log_file, messages: List[str]):
+        """Runs in the log writer thread"""
+        text = ''.join(messages)
+        print(text, end='')
+        try:
+            log_file.write(text)
+            log_file.flush()
+            self._on_log(experiment_id, messages)
+        except Exception as e:
+            print(f'Could not write the logs of experiment {experiment_id}: {e}')
+
+    def _set_exit_code(self, container_id: str, exit_code: int):
+        watched = self._watched.get(container_id)
+        if watched is None or watched.exit_code is not None:
+            return
+        watched.exit_code = exit_code
+        self._finish(watched)
+
+    def _finish(self, watched: _WatchedContainer):
+        if watched.exit_code is None or not watched.end_of_logs:
+            return
+        del self._watched[watched.container_id]
+        print(f'container stopped with StatusCode {watched.exit_code}')
+        # Queued behind the last lines of the logs
+        self._log_writer.submit(self._report_exit, watched)
+        self._loop.run_in_executor(None, self._remove, watched.container_id)
+
+    def _report_exit(self, watched: _WatchedContainer):
+        """Runs in the log writer thread"""
+        if watched.log_file is not None:
+            watched.log_file.close()
+        self._on_exit(watched.experiment_id, watched.exit_code)
+
+    def _remove(self, container_id: str):
+        try:
+            self._client.api.remove_container(container_id)
+        except docker.errors.DockerException as e:
+            print(f'Could not remove container {container_id}: {e}')
@@ -1,152 +1,302 @@
-import sys
-from typing import List
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Tuple
 
-from apscheduler.job import Job
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
-
-from influxdb import InfluxDBClient
-
-from source.device_manager import device_manager
-
-scheduler = BackgroundScheduler()
-scheduler.start()
-
-
-def save_commands(commands_to_call):
-    for device_uuid in commands_to_call.keys():
-
-        dev_manager = device_manager.DeviceManager()
-
-        sila_device = dev_manager.get_device_instance(device_uuid)
-        sila_device.connect()
-
-        device_info = dev_manager.get_device_info(device_uuid)
-
-        if device_info.databaseId is not None:
-            database_info = dev_manager.get_database_info(device_info.databaseId)
-
-            for command_info in commands_to_call[device_uuid]:
-
-                command = command_info[0]
-                feature = command_info[1]
-
-                parameters = {}
-                for parameter in command.parameters:
-                    parameters[parameter.identifier.lower() + '/' + parameter.type] = parameter.value
-
-                try:
-                    try:
-                        responses = sila_device.call_command(feature_id=feature.identifier, command_id=command.identifier,
-                                                             parameters=parameters)
-                    except:
-                        print(feature.originator, feature.category, feature.identifier, feature.feature_version_major)
-                        qualified_feature_id = f'{feature.originator}/{feature.category}/{feature.identifier}/v{feature.feature_version_major}'
-                        responses = sila_device.call_command(feature_id=qualified_feature_id,
-                                                             command_id=command.identifier,
-                                                             parameters=parameters)
-                    # TODO experiment
-                    # TODO for a device write all points at the end
-                    # TODO timeout call
-                    # TODO meta / non-meta indicator
-                    # TODO decide if we need to do something if responses == {}
-                    # TODO report on different possible exceptions
-                    # TODO check if possible to make these 2 functions into a single one
-                    # TODO EmptyParameters must not be passed; simply pass {} instead
-                    if responses != {}:
-                        client = InfluxDBClient(database_info.address, database_info.port, 'root', 'root',
-                                                database_info.name)
-                        client.create_database(database_info.name)
-                        point = {}
-                        tags = {'device': device_uuid, 'feature': feature.identifier, 'command': command.identifier}
-                        point['measurement'] = 'device_manager'
-                        point['tags'] = tags
-                        point['time'] = datetime.now()
-                        point['fields'] = responses
-                        points = [point]
-
-                        client.write_points(points)
-                    print(responses)
-                except:
-                    print(sys.exc_info())
-        else:
-            print("Device " + device_info.name + " with UUID " + device_uuid + " does not have a database assigned")
-
-
-def save_properties(properties_to_call):
-    for device_uuid in properties_to_call.keys():
-
-        dev_manager = device_manager.DeviceManager()
-
-        sila_device = dev_manager.get_device_instance(device_uuid)
-        sila_device.connect()
-
-        device_info = dev_manager.get_device_info(device_uuid)
-
-        if device_info.databaseId is not None:
-            database_info = dev_manager.get_database_info(device_info.databaseId)
-
-            for property_info in properties_to_call[device_uuid]:
-
-                property = property_info[0]
-                feature = property_info[1]
-
-                try:
-                    try:
-                        responses = sila_device.call_property(feature_id=feature.identifier,
-                                                              property_id=property.identifier)
-                    except:
-                        print(feature.originator, feature.category, feature.identifier, feature.feature_version_major)
-                        # qualified_feature_id = feature.originator + '/' + feature.category + '/' + feature.identifier + '/' + feature.feature_version_major
-                        qualified_feature_id = f'{feature.originator}/{feature.category}/{feature.identifier}/v{feature.feature_version_major}'
-
-                        responses = sila_device.call_property(feature_id=qualified_feature_id,
-                                                              property_id=property.identifier)
-                    # TODO experiment
-                    # TODO for a device write all points at the end
-                    # TODO timeout call
-                    # TODO meta / non-meta indicator
-                    # TODO decide if we need to do something if responses == {}
-                    # TODO report on different possible exceptions
-                    # TODO check if possible to make these 2 functions into a single one
-                    # TODO EmptyParameters must not be passed; simply pass {} instead
-                    print(feature.identifier, responses)
-                    if responses != {}:
-                        client = InfluxDBClient(database_info.address, database_info.port, 'root', 'root',
-                                                database_info.name)
-                        client.create_database(database_info.name)
-                        point = {}
-                        tags = {'device': device_uuid, 'feature': feature.identifier, 'property': property.identifier}
-                        point['measurement'] = 'device_manager'
-                        point['tags'] = tags
-                        point['time'] = datetime.now()
-                        point['fields'] = responses
-                        points = [point]
-
-                        client.write_points(points)
-                    print(responses)
-                except:
-                    print(sys.exc_info())
-        else:
-            print("Device " + device_info.name + " with UUID " + device_uuid + " does not have a database assigned")
-
-
-def create_jobs(commands_to_call, properties_to_call) -> List[Job]:
-    jobs = []
-    for key in commands_to_call.keys():
-        job = scheduler.add_job(save_commands,
-                                'interval',
-                                seconds=key[0],
-                                start_date=datetime.fromtimestamp(datetime.timestamp(datetime.now()) + 1),
-                                end_date=datetime.fromtimestamp(key[1]),
-                                args=[commands_to_call[key]])
-        jobs.append(job)
-    for key in properties_to_call.keys():
-        job = scheduler.add_job(save_properties,
-                                'interval',
-                                seconds=key[0],
-                                start_date=datetime.fromtimestamp(datetime.timestamp(datetime.now()) + 1),
-                                end_date=datetime.fromtimestamp(key[1]),
-                                args=[properties_to_call[key]])
-        jobs.append(job)
-    return jobs
+from source.device_manager.array_store import ArrayStoreError, get_array_fields, get_array_store, to_array
+from source.device_manager.data_handler_session import DataHandlerSession, get_data_handler_session
+from source.device_manager.ingestion import get_ingestion_pipeline, Sample
+from source.device_manager.last_value_cache import get_last_value_cache
+from source.device_manager.live_data import get_live_sample_publisher
+from source.device_manager.polling import PollingStats, get_polling_executor, read_data_handler_config
+from source.device_manager.polling_planner import PollingPlanner, Subscription, JITTER
+from source.device_manager.property_subscription import PropertySubscription
+from source.device_manager.recording_filter import RecordingFilter, RECORD_ALWAYS
+
+#: Seconds a data handler poll waits for space in the ingestion queue of a slow database
+SUBMIT_TIMEOUT = 10
+#: Minimum number of seconds between two recorded values of an observable property, 0 records every pushed value
+OBSERVABLE_MIN_INTERVAL = 0
+
+
+def _call_command(sila_device, feature, command, parameters):
+    try:
+        return sila_device.call_command(feature_id=feature.identifier, command_id=command.identifier,
+                                        parameters=parameters)
+    except:
+        print(feature.originator, feature.category, feature.identifier, feature.feature_version_major)
+        qualified_feature_id = f'{feature.originator}/{feature.category}/{feature.identifier}/v{feature.feature_version_major}'
+        return sila_device.call_command(feature_id=qualified_feature_id,
+                                        command_id=command.identifier,
+                                        parameters=parameters)
+
+
+def _call_property(sila_device, feature, property):
+    try:
+        return sila_device.call_property(feature_id=feature.identifier,
+                                         property_id=property.identifier)
+    except:
+        print(feature.originator, feature.category, feature.identifier, feature.feature_version_major)
+        # qualified_feature_id = feature.originator + '/' + feature.category + '/' + feature.identifier + '/' + feature.feature_version_major
+        qualified_feature_id = f'{feature.originator}/{feature.category}/{feature.identifier}/v{feature.feature_version_major}'
+
+        return sila_device.call_property(feature_id=qualified_feature_id,
+                                         property_id=property.identifier)
+
+
+def _get_database_info(session: DataHandlerSession):
+    device_info, database_info = session.get_info()
+    if database_info is None:
+        print("Device " + device_info.name + " with UUID " + session.uuid + " does not have a database assigned")
+    return database_info
+
+
+def _to_plain_values(responses: Dict[str, Any]) -> Dict[str, Any]:
+    # The elements of list responses are data objects of the SiLA client
+    return {field: [getattr(element, 'value', element) for element in value] if isinstance(value, list) else value
+            for field, value in responses.items()}
+
+
+def _store_arrays(tags, responses: Dict[str, Any], array_fields: Dict[str, Any], sample_time: int) -> Dict[str, Any]:
+    """Moves the numeric list responses into the array store, the time-series sinks get a reference to the array
+    instead, since they cannot store lists"""
+    stored = responses
+    for field, value in responses.items():
+        identifier = field.split('/', 1)[0]
+        # Features added before the list types were stored are detected by the value
+        if identifier not in array_fields and not isinstance(value, list):
+            continue
+        array = to_array(value, array_fields.get(identifier))
+        if array is None:
+            continue
+        try:
+            reference = get_array_store().append(tags['device'], tags['feature'],
+                                                 tags.get('command') or tags.get('property'), field, sample_time, array)
+        except (ArrayStoreError, OSError) as e:
+            print(f'Could not store the array {field} of device {tags["device"]}: {e}')
+            continue
+        if stored is responses:
+            stored = dict(responses)
+        stored[field] = reference
+    return stored
+
+
+def _submit(database_info, tags, responses, subscriptions: List[Subscription], array_fields: Dict[str, Any]) -> bool:
+    """Queues a sample for every experiment that subscribes to the item, tagged with the experiment and booking ids, so
+    the data of one experiment is selected by its tag instead of scanning the time range of all devices
+
+    Returns whether every sink has queued the sample of every experiment.
+    """
+    sample_time = time.time_ns()
+    # An array is stored once, all experiments get the same reference
+    stored = _store_arrays(tags, responses, array_fields, sample_time)
+    experiments = {(subscription.experiment_id, subscription.booking_id) for subscription in subscriptions}
+    if not experiments:
+        # The last subscription has ended during the call
+        experiments = {(None, None)}
+    queued = True
+    for experiment_id, booking_id in experiments:
+        experiment_tags = dict(tags)
+        if experiment_id is not None:
+            experiment_tags['experiment'] = str(experiment_id)
+        if booking_id is not None:
+            experiment_tags['booking'] = str(booking_id)
+        errors = get_ingestion_pipeline().submit(database_info,
+                                                 Sample('device_manager', experiment_tags, stored, sample_time),
+                                                 SUBMIT_TIMEOUT)
+        for error in errors.values():
+            print(f'Sample of {tags["device"]} dropped: {error}')
+        queued = queued and not errors
+        if experiment_id is not None:
+            # The live charts of the experiment receive the sample with the next batch
+            get_live_sample_publisher().publish(experiment_id, booking_id, tags['device'], tags['feature'],
+                                                tags.get('command') or tags.get('property'), responses, sample_time)
+    return queued
+
+
+def save_command(device_uuid: str, command_info, subscriptions: List[Subscription]):
+    command = command_info[0]
+    feature = command_info[1]
+    recording_filter = command_info[2]
+
+    # The session keeps the device connected and caches its infos between the ticks
+    session = get_data_handler_session(device_uuid)
+    database_info = _get_database_info(session)
+    if database_info is None:
+        return
+
+    parameters = {}
+    for parameter in command.parameters:
+        parameters[parameter.identifier.lower() + '/' + parameter.type] = parameter.value
+
+    start = time.perf_counter()
+    responses = _to_plain_values(
+        session.call(lambda sila_device: _call_command(sila_device, feature, command, parameters)))
+    latency = time.perf_counter() - start
+    # TODO for a device write all points at the end
+    # TODO meta / non-meta indicator
+    # TODO decide if we need to do something if responses == {}
+    # TODO report on different possible exceptions
+    # TODO check if possible to make these 2 functions into a single one
+    # TODO EmptyParameters must not be passed; simply pass {} instead
+    if responses != {}:
+        # Every response refreshes the last value, also if the recording mode does not store it
+        get_last_value_cache().update(device_uuid, feature.identifier, command.identifier, responses, time.time_ns(),
+                                      latency)
+    # Filtered before the write path, so an unchanged sample costs no queue space and no database write
+    now = time.monotonic()
+    if responses != {} and recording_filter.should_record(responses, now):
+        tags = {'device': device_uuid, 'feature': feature.identifier, 'command': command.identifier}
+        # A dropped sample is not compared with, so the next one is recorded
+        if _submit(database_info, tags, responses, subscriptions, get_array_fields(command.responses)):
+            recording_filter.record(responses, now)
+    print(responses)
+
+
+def save_property(device_uuid: str, property_info, subscriptions: List[Subscription]):
+    property = property_info[0]
+    feature = property_info[1]
+
+    # The session keeps the device connected and caches its infos between the ticks
+    session = get_data_handler_session(device_uuid)
+    database_info = _get_database_info(session)
+    if database_info is None:
+        return
+
+    start = time.perf_counter()
+    responses = _to_plain_values(session.call(lambda sila_device: _call_property(sila_device, feature, property)))
+    latency = time.perf_counter() - start
+    # TODO for a device write all points at the end
+    # TODO meta / non-meta indicator
+    # TODO decide if we need to do something if responses == {}
+    # TODO report on different possible exceptions
+    # TODO check if possible to make these 2 functions into a single one
+    # TODO EmptyParameters must not be passed; simply pass {} instead
+    print(feature.identifier, responses)
+    _store_property(device_uuid, database_info, feature, property, property_info[2], responses, subscriptions,
+                    latency)
+    print(responses)
+
+
+def _store_property(device_uuid: str, database_info, feature, property, recording_filter: RecordingFilter, responses,
+                    subscriptions: List[Subscription], latency: float = None):
+    if responses != {}:
+        # Values pushed by the device have no call latency
+        get_last_value_cache().update(device_uuid, feature.identifier, property.identifier, responses, time.time_ns(),
+                                      latency)
+    # Unchanged samples are dropped here, before they take up space in the ingestion queue and the database
+    now = time.monotonic()
+    if responses != {} and recording_filter.should_record(responses, now):
+        tags = {'device': device_uuid, 'feature': feature.identifier, 'property': property.identifier}
+        if _submit(database_info, tags, responses, subscriptions, get_array_fields([property.response])):
+            recording_filter.record(responses, now)
+
+
+def _subscribe_property(sila_device, feature, property):
+    try:
+        return sila_device.subscribe_property(feature.identifier, property.identifier)
+    except KeyError:
+        qualified_feature_id = f'{feature.originator}/{feature.category}/{feature.identifier}/v{feature.feature_version_major}'
+        return sila_device.subscribe_property(qualified_feature_id, property.identifier)
+
+
+def _open_property_stream(device_uuid: str, property_info):
+    property = property_info[0]
+    feature = property_info[1]
+    # A new session is used after the device has been edited
+    session = get_data_handler_session(device_uuid)
+    return session.call(lambda sila_device: _subscribe_property(sila_device, feature, property))
+
+
+def _record_property(device_uuid: str, property_info, get_subscriptions: Callable[[], List[Subscription]],
+                     responses):
+    database_info = _get_database_info(get_data_handler_session(device_uuid))
+    if database_info is not None:
+        _store_property(device_uuid, database_info, property_info[1], property_info[0], property_info[2],
+                        _to_plain_values(responses), get_subscriptions())
+
+
+def stream_property(device_uuid: str, property_info, stats: PollingStats,
+                    get_subscriptions: Callable[[], List[Subscription]]) -> PropertySubscription:
+    """Records the values of an observable property which are pushed by the device over a long-lived subscription"""
+    property = property_info[0]
+    feature = property_info[1]
+    subscription = PropertySubscription(
+        f'{feature.identifier}/{property.identifier} of device {device_uuid}',
+        functools.partial(_open_property_stream, device_uuid, property_info),
+        functools.partial(_record_property, device_uuid, property_info, get_subscriptions),
+        lambda: get_data_handler_session(device_uuid).reconnect(),
+        stats,
+        float(config.get('observable_min_interval', OBSERVABLE_MIN_INTERVAL)))
+    subscription.start()
+    return subscription
+
+
+config = read_data_handler_config()
+planner = PollingPlanner(get_polling_executor(), {'command': save_command, 'property': save_property},
+                         jitter=float(config.get('jitter', JITTER)),
+                         stream_functions={'observable_property': stream_property})
+
+
+# The filters of the subscribed items by the kind and database id of the item and the parameters of a command; the
+# planner keeps the argument of the first subscription, so a filter is reconfigured instead of being replaced
+_recording_filters: Dict[Tuple[str, int, Hashable], RecordingFilter] = {}
+_recording_filters_lock = threading.Lock()
+
+
+def _get_recording_filter(kind: str, item, parameters: Hashable = None) -> RecordingFilter:
+    """Returns the filter of an item, configured with the recording mode the item has now"""
+    with _recording_filters_lock:
+        recording_filter = _recording_filters.setdefault((kind, item.id, parameters), RecordingFilter())
+    # Items stored before the recording modes existed have no mode
+    recording_filter.configure(item.recording_mode or RECORD_ALWAYS, item.deadband, item.max_silence)
+    return recording_filter
+
+
+def set_recording_mode(kind: str, item_id: int, mode: str, deadband: float, max_silence: int):
+    """Applies an edited recording mode of a command or property to its subscriptions
+
+    :param kind: 'command' or 'property'
+    :param item_id: The database id of the command or property
+    :param mode: The recording mode, None for items stored before the recording modes existed
+    :param deadband: The deadband of the recording mode
+    :param max_silence: Seconds after which an unchanged sample is recorded
+    """
+    with _recording_filters_lock:
+        recording_filters = [recording_filter for (filter_kind, filter_item_id, _), recording_filter
+                             in _recording_filters.items() if filter_kind == kind and filter_item_id == item_id]
+    for recording_filter in recording_filters:
+        recording_filter.configure(mode or RECORD_ALWAYS, deadband, max_silence)
+
+
+def subscribe_command(experiment_id: int, device_uuid: str, command_info, interval: float, end: float,
+                      booking_id: int = None):
+    """Polls a command for an experiment until the end of its booking, together with all other experiments that
+    subscribe to the same command with the same parameters. Only the samples passing the recording mode of the
+    command are stored."""
+    command = command_info[0]
+    feature = command_info[1]
+    parameters = tuple((parameter.identifier, parameter.type, parameter.value) for parameter in command.parameters)
+    # All experiments subscribing to the same item share its filter
+    planner.subscribe(experiment_id, str(device_uuid), 'command', (feature.identifier, command.identifier, parameters),
+                      feature.identifier, command.identifier,
+                      (command, feature, _get_recording_filter('command', command, parameters)), interval, end,
+                      booking_id)
+
+
+def subscribe_property(experiment_id: int, device_uuid: str, property_info, interval: float, end: float,
+                       booking_id: int = None):
+    """Polls a property for an experiment until the end of its booking, together with all other experiments that
+    subscribe to the same property. Observable properties are not polled, their values are pushed by the device."""
+    property = property_info[0]
+    feature = property_info[1]
+    kind = 'observable_property' if property.observable and \
+        str(config.get('subscribe_observable_properties', True)).lower() == 'true' else 'property'
+    planner.subscribe(experiment_id, str(device_uuid), kind, (feature.identifier, property.identifier),
+                      feature.identifier, property.identifier,
+                      (property, feature, _get_recording_filter('property', property)), interval, end, booking_id)
+
+
+def unsubscribe(experiment_id: int):
+    """Stops polling for an experiment"""
+    planner.unsubscribe(experiment_id)
@@ -7,6 +7,10 @@ def delete_user(c):
 def delete_devices(c):
     c.execute('drop table if exists devices')
 
+def delete_device_groups(c):
+    c.execute('drop table if exists device_groups')
+    c.execute('drop table if exists device_group_members')
+
 def delete_features_for_data_handler(c):
     c.execute('drop table if exists features_for_data_handler')
 
@@ -45,6 +49,7 @@ def main():
     c = conn.cursor()
     delete_user(c)
     delete_devices(c)
+    delete_device_groups(c)
     delete_features_for_data_handler(c)
     delete_commands_for_data_handler(c)
     delete_properties_for_data_handler(c)
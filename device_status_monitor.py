@@ -0,0 +1,91 @@
+#!/bin/env python3
+"""
+Probes all registered devices in the background and stores their status in Redis.
+
+Every device is probed on its own jittered cadence, so the probes of many devices do not run in lock step. Status
+transitions are published on the device_status channel, which the backend forwards to the /ws/device_status
+websocket. /api/deviceStatus answers from the stored status.
+"""
+import asyncio
+import configparser
+import random
+from typing import Dict
+
+from source.device_manager.data_directories import DATA_DIRECTORY
+from source.device_manager.device_layer.device_info import DeviceInfo
+from source.device_manager.device_manager import DeviceManager, invalidate_async_device
+from source.device_manager.device_status import set_cached_device_status, delete_cached_device_status
+
+#: Seconds between two probes of a device
+PROBE_INTERVAL = 10
+#: Fraction by which the interval between two probes is varied randomly
+PROBE_JITTER = 0.2
+#: Seconds after which a probe is aborted and the device is considered offline
+PROBE_TIMEOUT = 5
+#: Seconds between two reads of the device list from the database
+DEVICE_LIST_INTERVAL = 30
+
+
+def connection_details(info: DeviceInfo):
+    return info.address, info.port, info.type, info.name
+
+
+def read_config():
+    config = configparser.ConfigParser()
+    config.read(f'{DATA_DIRECTORY}/device-manager.conf')
+    if not config.has_section('DeviceStatusMonitor'):
+        return PROBE_INTERVAL, PROBE_JITTER, PROBE_TIMEOUT, DEVICE_LIST_INTERVAL
+    section = config['DeviceStatusMonitor']
+    return (section.getfloat('interval', PROBE_INTERVAL),
+            section.getfloat('jitter', PROBE_JITTER),
+            section.getfloat('timeout', PROBE_TIMEOUT),
+            section.getfloat('device_list_interval', DEVICE_LIST_INTERVAL))
+
+
+async def monitor_device(device_manager: DeviceManager, info: DeviceInfo, interval: float, jitter: float,
+                         timeout: float):
+    # Spread the first probes of all devices over one interval
+    await asyncio.sleep(random.uniform(0, interval))
+    while True:
+        status = await device_manager.probe_device_async(info, timeout)
+        try:
+            if await set_cached_device_status(info.uuid, status, int(3 * interval)):
+                print(f'Device {info.name} ({info.uuid}) is {"online" if status.online else "offline"}'
+                      f' {status.status}')
+        except Exception as e:
+            print(f'Could not store the status of device {info.uuid}: {e}')
+        await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+
+
+async def main():
+    interval, jitter, timeout, device_list_interval = read_config()
+    device_manager = DeviceManager()
+    loop = asyncio.get_event_loop()
+    tasks: Dict[str, asyncio.Task] = {}
+    devices: Dict[str, DeviceInfo] = {}
+    while True:
+        try:
+            device_list = await loop.run_in_executor(None, device_manager.get_device_info_list)
+        except Exception as e:
+            print(f'Could not read the device list: {e}')
+            device_list = list(devices.values())
+        current = {str(info.uuid): info for info in device_list}
+        for uuid in list(tasks.keys()):
+            if uuid not in current or connection_details(current[uuid]) != connection_details(devices[uuid]):
+                tasks.pop(uuid).cancel()
+                del devices[uuid]
+                if uuid not in current:
+                    invalidate_async_device(uuid)
+                    try:
+                        await delete_cached_device_status(uuid)
+                    except Exception as e:
+                        print(f'Could not delete the status of device {uuid}: {e}')
+        for uuid, info in current.items():
+            if uuid not in tasks:
+                devices[uuid] = info
+                tasks[uuid] = loop.create_task(monitor_device(device_manager, info, interval, jitter, timeout))
+        await asyncio.sleep(device_list_interval)
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -1,55 +1,35 @@
 #!/usr/bin/env python3
+import io
 import tarfile
-import uuid
-import os
-from source.device_manager.data_directories import TEMP_DIRECTORY
+import time
 from docker.types import LogConfig, DriverConfig
 import re
 
 
-def _delete_file(file_name: str):
-    if os.path.exists(file_name):
-        os.remove(file_name)
+def _add_file(tar: tarfile.TarFile, name: str, data: str):
+    content = data.encode()
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(content))
 
 
-def _set_script_filename(tarinfo):
-    tarinfo.name = 'script.py'
-    return tarinfo
+def _create_archive(script_data: str, devices_data: str) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        _add_file(tar, 'script.py', script_data)
+        _add_file(tar, 'devices.py', devices_data)
+    return buffer.getvalue()
 
 
-def _set_devices_filename(tarinfo):
-    tarinfo.name = 'devices.py'
-    return tarinfo
-
-
-def _create_temporary_tar(script_data: str, devices_data: str):
-    os.makedirs(f'{TEMP_DIRECTORY}/container', exist_ok=True)
-    name = str(uuid.uuid4())
-    script_file = f'{TEMP_DIRECTORY}/container/{name}_script.py'
-    devices_file = f'{TEMP_DIRECTORY}/container/{name}_devices.py'
-    tar_file = f'{TEMP_DIRECTORY}/container/{name}.tar'
-    _delete_file(script_file)
-    _delete_file(devices_file)
-    with open(script_file, mode='x') as f:
-        f.write(script_data)
-    with open(devices_file, mode='x') as f:
-        f.write(devices_data)
-    _delete_file(tar_file)
-    with tarfile.open(tar_file, mode='x') as tar:
-        tar.add(script_file, filter=_set_script_filename)
-        tar.add(devices_file, filter=_set_devices_filename)
-    _delete_file(script_file)
-    _delete_file(devices_file)
-    return tar_file
-
-
-def create_script_container(docker_client, container_name: str, script_data: str, devices_data: str):
+def create_idle_container(docker_client, container_name: str = None, labels: dict = None):
+    """Creates a user_script container without a script, which is added with inject_script before it is started"""
     dc = DriverConfig(name='local', options={
         'max-size': '10m'
     })
     # publish_all_ports
     extra_hosts = {'host.docker.internal': 'host-gateway'}
-    container = docker_client.containers.create(
+    return docker_client.containers.create(
         'user_script',
         'python main.py',
         name=container_name,
@@ -58,15 +38,19 @@ def create_script_container(docker_client, container_name: str, script_data: str
         # publish_all_ports=True,
         network_mode='host',
         extra_hosts=extra_hosts,
+        labels=labels,
     )
+
+
+def inject_script(container, script_data: str, devices_data: str):
+    """Copies the script and the device configuration into a created container, the archive is built in memory"""
     devices_data = re.sub(r"'localhost'", "'host.docker.internal'", devices_data)
     devices_data = re.sub(r"'127.0.0.1'", "'host.docker.internal'", devices_data)
     devices_data = re.sub(r"'0.0.0.0'", "'host.docker.internal'", devices_data)
+    container.put_archive('/usr/src/app', _create_archive(script_data, devices_data))
 
-    tar = _create_temporary_tar(script_data, devices_data)
-    with open(tar, "rb") as tar_file:
-        buff = tar_file.read()
-        container.put_archive('/usr/src/app', buff)
-    _delete_file(tar)
-    return container
 
+def create_script_container(docker_client, container_name: str, script_data: str, devices_data: str):
+    container = create_idle_container(docker_client, container_name)
+    inject_script(container, script_data, devices_data)
+    return container
@@ -18,6 +18,34 @@ config['Database'] = {
     'user': 'postgres',
     'password': '1234'
 }
+config['DeviceStatusMonitor'] = {
+    'interval': 10,
+    'jitter': 0.2,
+    'timeout': 5,
+    'device_list_interval': 30
+}
+config['Ingestion'] = {
+    'queue_size': 100000,
+    'batch_size': 5000,
+    'flush_interval': 1.0,
+    'overflow_policy': 'block',
+    'wal_segment_size': 16 * 1024 * 1024,
+    'wal_max_segments': 64,
+    'replay_rate': 20000
+}
+
+config['DataHandler'] = {
+    'max_workers': 32,
+    'call_timeout': 10,
+    'overrun_policy': 'skip',
+    'jitter': 0.0,
+    'subscribe_observable_properties': True,
+    'observable_min_interval': 0
+}
+
+config['ContainerPool'] = {
+    'size': 2
+}
 
 os.makedirs(DIRECTORY, exist_ok=True)
 with open(CONFIG_FILE, 'w') as configfile:
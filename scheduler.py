@@ -2,29 +2,56 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.job import Job
 from apscheduler import events
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.redis import RedisJobStore
 import time
 from datetime import datetime
-import os
 import data_handler
 import source.device_manager.experiment as experiment
 from source.device_manager.experiment import ExperimentStatus
 from source.device_manager.device_manager import DeviceManager
 from source.device_manager.script import Script, get_user_script
 from source.device_manager.device import get_device_info
-from source.device_manager.data_directories import TEMP_DIRECTORY
+from source.device_manager.influx_writer import invalidate_influx_writer
+from source.device_manager.data_handler_session import invalidate_data_handler_session, invalidate_database_info
+from source.device_manager.database import connect_database
+import psycopg2
+import psycopg2.extensions
 import redis
+import select
 import msgpack
 from dataclasses import dataclass, asdict
 from enum import IntEnum
 import queue
 from collections import deque
-from typing import Optional
+from typing import List, Optional
 import docker
 import docker_helper
+from container_pool import ContainerPool, read_container_pool_config, POOL_SIZE
+from container_supervisor import ContainerSupervisor
+from source.device_manager.container_stats import StartLatencyHistogram
 from threading import Thread
 import json
 
 EXPERIMENT_LOG_BUFFER_LENGTH: int = 100
+#: Redis hash with the runtime state of the experiments that have not finished, keyed by experiment id
+EXPERIMENT_STATE_KEY = 'scheduler:experiments'
+#: Redis keys of the persistent job store of APScheduler
+JOBS_KEY = 'scheduler:jobs'
+RUN_TIMES_KEY = 'scheduler:run_times'
+#: Seconds after its start time an experiment is still started, e.g. after the scheduler has been restarted
+MISFIRE_GRACE_TIME = 60
+#: Statuses after which an experiment needs no recovery
+FINISHED_STATUSES = (ExperimentStatus.FINISHED_SUCCESSFUL, ExperimentStatus.FINISHED_ERROR,
+                     ExperimentStatus.FINISHED_MANUALLY)
+#: Seconds the Redis listener waits before it subscribes again after the connection was lost
+REDIS_RECONNECT_DELAY = 1
+#: Seconds the experiment change listener waits before it connects again after the connection was lost
+DATABASE_RECONNECT_DELAY = 1
+#: Seconds without notifications after which the experiment change listener checks its connection
+LISTEN_TIMEOUT = 60
+#: Seconds between two reconciliations while the experiments table has no trigger for the change notifications
+RESCAN_INTERVAL = 5
 
 
 @dataclass
@@ -53,20 +80,75 @@ class ProcessStatusEvent:
     message: Optional[str] = None
 
 
-event_queue = queue.SimpleQueue()
-process_status_queue = queue.SimpleQueue()
+@dataclass
+class SchedulerCommand:
+    command: str
+    params: list
+
+
+@dataclass
+class ExperimentChange:
+    operation: str
+    experiment_id: int
+
+
+@dataclass
+class ReconcileExperiments:
+    pass
+
+
+# APScheduler events, process status events, experiment changes and scheduler commands are handled one after another by the main loop,
+# which blocks on this queue until one of them arrives
+dispatch_queue = queue.SimpleQueue()
 
 experiments = {}
 job_to_experiment = {}
-experiment_id_to_data_handler_jobs = {}
 
-scheduler = BackgroundScheduler()
+# The jobs survive a restart of the scheduler, the experiments they belong to are restored by recover_experiments
+scheduler = BackgroundScheduler(jobstores={'default': RedisJobStore(jobs_key=JOBS_KEY, run_times_key=RUN_TIMES_KEY)},
+                                job_defaults={'misfire_grace_time': MISFIRE_GRACE_TIME})
 redis_connection = redis.Redis(host='localhost')
+# Shared by the container pool, the supervisor and the experiment commands, it connects on the first request
+docker_client = docker.from_env()
+container_pool = ContainerPool(int(read_container_pool_config().get('size', POOL_SIZE)))
+start_latency = StartLatencyHistogram()
 pubsub = redis_connection.pubsub()
 
 
+def save_experiment_state(entry: ExperimentState):
+    """Persists the runtime state of an experiment until it has finished"""
+    if entry.status in FINISHED_STATUSES:
+        redis_connection.hdel(EXPERIMENT_STATE_KEY, entry.experiment_id)
+        return
+    redis_connection.hset(EXPERIMENT_STATE_KEY, entry.experiment_id, msgpack.packb({
+        'experimentId': entry.experiment_id,
+        'name': entry.name,
+        'jobId': entry.job_id,
+        'containerId': entry.container_id,
+        'start': entry.start_time,
+        'end': entry.end_time,
+        'status': int(entry.status)
+    }))
+
+
+def load_experiment_states():
+    states = []
+    for key, data in redis_connection.hgetall(EXPERIMENT_STATE_KEY).items():
+        try:
+            state = msgpack.unpackb(data, raw=False)
+            states.append(ExperimentState(state['experimentId'], state['name'], state['jobId'], state['containerId'],
+                                          state['start'], state['end'], ExperimentStatus(state['status']),
+                                          deque(['Reconnected to experiment.\n'],
+                                                maxlen=EXPERIMENT_LOG_BUFFER_LENGTH)))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f'Discarding the unreadable state of experiment {key}: {e}')
+            redis_connection.hdel(EXPERIMENT_STATE_KEY, key)
+    return states
+
+
 def change_experiment_status(experiment_id: int, status: ExperimentStatus):
     experiments[experiment_id].status = status
+    save_experiment_state(experiments[experiment_id])
     redis_connection.publish(
         'experiment_status',
         msgpack.packb({
@@ -75,26 +157,27 @@ def change_experiment_status(experiment_id: int, status: ExperimentStatus):
         }))
 
 
-def forward_experiment_log(experiment_id: int, logging_message: str):
+def forward_experiment_log(experiment_id: int, logging_messages: List[str]):
     """
     The logging messages from the experiment docker container are put into a queue buffer which is forwarded
     to the frontend by a websocket
 
     :param experiment_id: The internally assigned id of the experiment
     :type experiment_id: int
-    :param logging_message: The latest logging message of the most recent flush of the docker stderr
-    :type logging_message: str
+    :param logging_messages: The latest logging messages, read at once from the docker stdout and stderr
+    :type logging_messages: List[str]
     """
     # Todo:  Parse the docker python string into a dict and transfer dict with levelname, timestamp,leg message ...
     # experiments[experiment_id].logs.append(logging_message)
-    if len(experiments[experiment_id].logs) < EXPERIMENT_LOG_BUFFER_LENGTH:
-        experiments[experiment_id].logs.append(logging_message)
-    elif len(experiments[experiment_id].logs) >= EXPERIMENT_LOG_BUFFER_LENGTH:
-        experiments[experiment_id].logs.popleft()
-        experiments[experiment_id].logs.append(logging_message)
-    else:
-        for _ in range(int(EXPERIMENT_LOG_BUFFER_LENGTH/2)):
+    for logging_message in logging_messages:
+        if len(experiments[experiment_id].logs) < EXPERIMENT_LOG_BUFFER_LENGTH:
+            experiments[experiment_id].logs.append(logging_message)
+        elif len(experiments[experiment_id].logs) >= EXPERIMENT_LOG_BUFFER_LENGTH:
             experiments[experiment_id].logs.popleft()
+            experiments[experiment_id].logs.append(logging_message)
+        else:
+            for _ in range(int(EXPERIMENT_LOG_BUFFER_LENGTH/2)):
+                experiments[experiment_id].logs.popleft()
     # print(f'Printing log list {experiments[experiment_id].logs}')
     redis_connection.publish(
         'experiment_logs',
@@ -106,8 +189,6 @@ def forward_experiment_log(experiment_id: int, logging_message: str):
 
 def start_data_handling_for_experiment(exp: experiment.Experiment):
     device_manager = DeviceManager()
-    commands_to_call = {}
-    properties_to_call = {}
     for device_booking in exp.deviceBookings:
         device_uuid = device_booking.device
         features = device_manager.get_features_for_data_handler(device_uuid)
@@ -118,91 +199,59 @@ def start_data_handling_for_experiment(exp: experiment.Experiment):
                         interval_to_use = command.polling_interval_meta
                     else:
                         interval_to_use = command.polling_interval_non_meta
-                    if (interval_to_use, device_booking.end) in commands_to_call.keys():
-                        if device_uuid in commands_to_call[(interval_to_use,
-                                                            device_booking.end)].keys():
-                            commands_to_call[(interval_to_use,
-                                              device_booking.end)][device_uuid].append((command, feature))
-                        else:
-                            commands_to_call[(interval_to_use,
-                                              device_booking.end)][device_uuid] = [(command, feature)]
-                    else:
-                        commands_to_call[(interval_to_use,
-                                          device_booking.end)] = {device_uuid: [(command, feature)]}
+                    data_handler.subscribe_command(exp.id, device_uuid, (command, feature), interval_to_use,
+                                                   device_booking.end, device_booking.id)
             for property in feature.properties:
                 if property.active:
                     if property.meta:
                         interval_to_use = property.polling_interval_meta
                     else:
                         interval_to_use = property.polling_interval_non_meta
-                    if (interval_to_use, device_booking.end) in properties_to_call.keys():
-                        if device_uuid in properties_to_call[(interval_to_use,
-                                                              device_booking.end)].keys():
-                            properties_to_call[(interval_to_use,
-                                                device_booking.end)][device_uuid].append((property, feature))
-                        else:
-                            properties_to_call[(interval_to_use,
-                                                device_booking.end)][device_uuid] = [(property, feature)]
-                    else:
-                        properties_to_call[(interval_to_use,
-                                            device_booking.end)] = {device_uuid: [(property, feature)]}
-    jobs = data_handler.create_jobs(commands_to_call, properties_to_call)
-    if exp.id in experiment_id_to_data_handler_jobs:
-        experiment_id_to_data_handler_jobs[exp.id] = experiment_id_to_data_handler_jobs[exp.id] + jobs
-    else:
-        experiment_id_to_data_handler_jobs[exp.id] = jobs
-
-
-def print_container_output(container, experiment_id):
-    # container_output = container.attach(logs=False, stream=True)
-    container_output = container.logs(follow=True, timestamps=True, stream=True, stdout=True, stderr=True)
-    print('Output thread started!')
-    log_path = os.path.join(TEMP_DIRECTORY, 'container', f'{datetime.now().strftime("%d_%m_%Y-%H_%M_%S")}_{str(experiment_id)}.log')
-    with open(log_path, "w") as file:
-        for line in container_output:
-            print(line.decode())
-            file.write(line.decode())
-            # json.dump(line.decode(), file)
-            forward_experiment_log(experiment_id=experiment_id, logging_message=line.decode())
-
-
-def wait_until_container_stops(container, experiment_id: int,
-                               status_queue: queue.SimpleQueue):
-    status = container.wait()
-    # print(container.logs())
-    print(f'container stopped with StatusCode {status["StatusCode"]}')
-    if status['StatusCode'] == 0:
-        status_queue.put(
-            ProcessStatusEvent(experiment_id,
-                               ProcessStatusEventType.FINISHED_SUCCESSFUL))
+                    data_handler.subscribe_property(exp.id, device_uuid, (property, feature), interval_to_use,
+                                                    device_booking.end, device_booking.id)
+
+
+def report_container_exit(experiment_id: int, exit_code: int):
+    if exit_code == 0:
+        dispatch_queue.put(ProcessStatusEvent(experiment_id, ProcessStatusEventType.FINISHED_SUCCESSFUL))
     else:
-        status_queue.put(
-            ProcessStatusEvent(experiment_id, ProcessStatusEventType.ERROR))
-    container.remove()
+        dispatch_queue.put(ProcessStatusEvent(experiment_id, ProcessStatusEventType.ERROR))
+
 
+# Watches the logs and exits of all experiment containers
+container_supervisor = ContainerSupervisor(docker_client, forward_experiment_log, report_container_exit)
 
-def start_experiment(experiment_id: int, status_queue: queue.SimpleQueue):
+
+def start_experiment(experiment_id: int):
+    # Only the experiment id is passed, since the arguments of the job are persisted
+    start = time.perf_counter()
     exp = experiment.get_experiment(experiment_id)
     script = get_user_script(exp.scriptID)
     devices = [
         asdict(get_device_info(booking.device)) for booking in exp.deviceBookings
     ]
     start_data_handling_for_experiment(exp)
-    client = docker.from_env()
-    container = docker_helper.create_script_container(client, exp.name,
-                                                      script.data,
-                                                      f'devices={devices}')
-    print(f'Created docker container for experiment {experiment_id}: \"{container.name}\"')
-
-    output_thread = Thread(target=print_container_output, args=(container,experiment_id, ), daemon=True)
-    wait_thread = Thread(target=wait_until_container_stops,
-                         args=(container, experiment_id, status_queue))
-    # Starting threads
-    container.start()
-    output_thread.start()
-    wait_thread.start()
-
-    status_queue.put(
+    container, warm = container_pool.acquire(exp.name)
+    # Persisted before the container runs, so the scheduler can reattach to it after a restart
+    experiments[experiment_id].container_id = container.id
+    save_experiment_state(experiments[experiment_id])
+    try:
+        docker_helper.inject_script(container, script.data, f'devices={devices}')
+        print(f'{"Took" if warm else "Created"} docker container for experiment {experiment_id}: \"{container.name}\"')
+        container.start()
+    except Exception as e:
+        # The job error marks the experiment as failed
+        print(f'Could not start the container of experiment {experiment_id}: {e}')
+        data_handler.unsubscribe(experiment_id)
+        experiments[experiment_id].container_id = '0'
+        save_experiment_state(experiments[experiment_id])
+        _remove_container(container)
+        raise
+    start_latency.record(time.perf_counter() - start, warm)
+    start_latency.publish()
+    container_supervisor.watch(container.id, experiment_id)
+
+    dispatch_queue.put(
         ProcessStatusEvent(experiment_id, ProcessStatusEventType.STARTED,
                            container.id))
     return
@@ -224,7 +273,7 @@ def handle_process_status_events(event: ProcessStatusEvent):
 
 
 def event_listener(event):
-    event_queue.put(event)
+    dispatch_queue.put(event)
 
 
 def handle_scheduling_events(event):
@@ -254,9 +303,173 @@ def handle_scheduling_events(event):
             print('experiment missed')
 
 
+def update_scheduled_experiment(exp: experiment.SchedulingInfo):
+    """Moves a waiting experiment to its new start, all other experiments with a start in the future are scheduled
+
+    A waiting experiment whose start is moved into the past is unscheduled, like a new experiment with a start in the
+    past is not scheduled.
+    """
+    in_past = exp.start < int(datetime.timestamp(datetime.now()))
+    entry = experiments.get(exp.id)
+    if entry is None or entry.status != ExperimentStatus.WAITING_FOR_EXECUTION:
+        if not in_past:
+            schedule_experiment(exp)
+        return
+    if (entry.name, entry.start_time, entry.end_time) == (exp.name, exp.start, exp.end):
+        return
+    if in_past and exp.start != entry.start_time:
+        remove_scheduled_experiment(exp.id)
+        return
+    try:
+        scheduler.modify_job(entry.job_id, name=f'experiment:{exp.name}')
+        # An unchanged start may have just passed, the job is about to run then
+        if exp.start != entry.start_time:
+            scheduler.reschedule_job(entry.job_id, trigger='date', run_date=datetime.fromtimestamp(exp.start))
+    except JobLookupError:
+        # The job has just been submitted, its event has not been handled yet
+        return
+    entry.name, entry.start_time, entry.end_time = exp.name, exp.start, exp.end
+    save_experiment_state(entry)
+    print(f'{exp.name} rescheduled')
+
+
+def remove_scheduled_experiment(experiment_id: int):
+    """Removes the job of a waiting experiment, experiments that have been started keep running"""
+    entry = experiments.get(experiment_id)
+    if entry is None or entry.status != ExperimentStatus.WAITING_FOR_EXECUTION:
+        return
+    try:
+        scheduler.remove_job(entry.job_id)
+    except JobLookupError:
+        return
+    del job_to_experiment[entry.job_id]
+    del experiments[experiment_id]
+    redis_connection.hdel(EXPERIMENT_STATE_KEY, experiment_id)
+    print(f'{entry.name} unscheduled')
+
+
+def handle_experiment_change(change: ExperimentChange):
+    if change.operation == 'DELETE':
+        remove_scheduled_experiment(change.experiment_id)
+        return
+    exp = experiment.get_experiment_scheduling_info(change.experiment_id)
+    if exp is None:
+        remove_scheduled_experiment(change.experiment_id)
+    else:
+        update_scheduled_experiment(exp)
+
+
 def schedule_future_experiments_from_database():
-    for exp in experiment.get_scheduling_info():
-        schedule_experiment(exp)
+    """Reconciles the scheduled experiments with the database, which is only needed when changes may have been missed:
+    on startup and after the connection of the change listener was lost"""
+    future_experiments = experiment.get_scheduling_info()
+    for exp in future_experiments:
+        update_scheduled_experiment(exp)
+    future_ids = {exp.id for exp in future_experiments}
+    now = int(datetime.timestamp(datetime.now()))
+    for experiment_id, entry in list(experiments.items()):
+        # Experiments started now have a start in the past and are not in the list
+        if entry.start_time >= now and experiment_id not in future_ids:
+            remove_scheduled_experiment(experiment_id)
+
+
+def _find_experiment_container(client, entry: ExperimentState):
+    if entry.container_id == '0':
+        return None
+    try:
+        return client.containers.get(entry.container_id)
+    except docker.errors.NotFound:
+        pass
+    except docker.errors.DockerException as e:
+        print(f'Could not look up the container of experiment {entry.experiment_id}: {e}')
+    return None
+
+
+def _remove_container(container):
+    try:
+        container.remove(force=True)
+    except docker.errors.DockerException as e:
+        print(f'Could not remove container {container.name}: {e}')
+
+
+def recover_experiments():
+    """Restores the experiments that had not finished when the scheduler stopped
+
+    Waiting experiments keep their persisted jobs. The containers of started experiments are found by their persisted
+    id and watched again, also if they have exited in the meantime, and the data handling of the experiments is resumed.
+    Samples that had not been written are replayed from the write-ahead log of the ingestion pipeline. An experiment
+    that can not be recovered, e.g. because it has been deleted, is marked as failed, so the scheduler starts anyway
+    and does not try it again after the next restart.
+    """
+    for entry in load_experiment_states():
+        experiments[entry.experiment_id] = entry
+        job_to_experiment[entry.job_id] = entry.experiment_id
+        try:
+            _recover_experiment(entry)
+        except Exception as e:
+            print(f'{entry.name} could not be recovered: {e}')
+            data_handler.unsubscribe(entry.experiment_id)
+            entry.status = ExperimentStatus.FINISHED_ERROR
+            redis_connection.hdel(EXPERIMENT_STATE_KEY, entry.experiment_id)
+
+
+def _recover_experiment(entry: ExperimentState):
+    container = _find_experiment_container(docker_client, entry)
+    if container is not None and container.status == 'created':
+        # The scheduler stopped before the container was started, its script may be missing
+        _remove_container(container)
+        change_experiment_status(entry.experiment_id, ExperimentStatus.FINISHED_ERROR)
+        print(f'{entry.name} could not be recovered, its container was never started')
+    elif container is not None:
+        entry.container_id = container.id
+        start_data_handling_for_experiment(experiment.get_experiment(entry.experiment_id))
+        container_supervisor.watch(container.id, entry.experiment_id)
+        change_experiment_status(entry.experiment_id, ExperimentStatus.RUNNING)
+        print(f'{entry.name} reattached to container {container.name}')
+    elif entry.status == ExperimentStatus.WAITING_FOR_EXECUTION and scheduler.get_job(entry.job_id) is not None:
+        print(f'{entry.name} waiting for execution')
+    else:
+        change_experiment_status(entry.experiment_id, ExperimentStatus.FINISHED_ERROR)
+        print(f'{entry.name} could not be recovered')
+
+
+def forward_experiment_changes():
+    """Listens for the notifications of the experiments table and hands the changes to the main loop
+
+    A reconciliation is requested whenever the listener has connected, since notifications sent while it was not
+    listening are lost. A database that has not been migrated has no trigger that sends the notifications, then a
+    reconciliation is requested every RESCAN_INTERVAL seconds instead.
+    """
+    while True:
+        connection = None
+        try:
+            connection = connect_database(keepalives=1)
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(f'listen {experiment.EXPERIMENT_CHANGES_CHANNEL}')
+                notified = experiment.has_experiment_change_trigger(cursor)
+            if not notified:
+                print('The experiments table has no trigger for the change notifications, the experiments are '
+                      f'rescanned every {RESCAN_INTERVAL} s; apply add_experiment_change_trigger of setup_db.py')
+            dispatch_queue.put(ReconcileExperiments())
+            while True:
+                # Notifications may also have been received with the result of a query
+                while connection.notifies:
+                    payload = json.loads(connection.notifies.pop(0).payload)
+                    dispatch_queue.put(ExperimentChange(payload['operation'], payload['id']))
+                timeout = LISTEN_TIMEOUT if notified else RESCAN_INTERVAL
+                if select.select([connection], [], [], timeout) == ([], [], []):
+                    with connection.cursor() as cursor:
+                        cursor.execute('select 1')
+                    if not notified:
+                        dispatch_queue.put(ReconcileExperiments())
+                else:
+                    connection.poll()
+        except (psycopg2.Error, OSError) as e:
+            print(f'Lost the connection for the experiment changes: {e}')
+            if connection is not None:
+                connection.close()
+            time.sleep(DATABASE_RECONNECT_DELAY)
 
 
 def schedule_experiment(exp: experiment.SchedulingInfo):
@@ -267,7 +480,7 @@ def schedule_experiment(exp: experiment.SchedulingInfo):
             == ExperimentStatus.FINISHED_MANUALLY):
         job = scheduler.add_job(start_experiment,
                                 'date',
-                                args=[exp.id, process_status_queue],
+                                args=[exp.id],
                                 name=f'experiment:{exp.name}',
                                 run_date=datetime.fromtimestamp(exp.start))
         experiments[exp.id] = ExperimentState(
@@ -288,7 +501,7 @@ def schedule_experiment_now(exp: experiment.SchedulingInfo):
         stop_experiment(exp.id)
 
     job = scheduler.add_job(start_experiment,
-                            args=[exp.id, process_status_queue],
+                            args=[exp.id],
                             name=f'experiment:{exp.name}')
     experiments[exp.id] = ExperimentState(
         exp.id, exp.name, job.id, '0', exp.start, exp.end,
@@ -299,11 +512,8 @@ def schedule_experiment_now(exp: experiment.SchedulingInfo):
 
 
 def stop_experiment(experiment_id):
-    # Stop data handling jobs for the experiment
-    if experiment_id in experiment_id_to_data_handler_jobs:
-        for job in experiment_id_to_data_handler_jobs[experiment_id]:
-            job.remove()
-        del experiment_id_to_data_handler_jobs[experiment_id]
+    # Stop data handling for the experiment
+    data_handler.unsubscribe(experiment_id)
     if experiment_id in experiments:
         experiment_entry = experiments[experiment_id]
         if experiment_entry.status == ExperimentStatus.WAITING_FOR_EXECUTION:
@@ -315,9 +525,8 @@ def stop_experiment(experiment_id):
               ExperimentStatus.SUBMITED_FOR_EXECUTION) or (
                   experiment_entry.status == ExperimentStatus.RUNNING):
             try:
-                client = docker.from_env()
                 print(experiment_entry.container_id)
-                container = client.containers.get(
+                container = docker_client.containers.get(
                     experiment_entry.container_id)
                 container.stop(timeout=1)
                 change_experiment_status(experiment_id,
@@ -332,14 +541,23 @@ def get_experiment_status(experiment_id):
     return experiments[experiment_id].status
 
 
-def receive_and_execute_commands():
-    message = pubsub.get_message()
-    if (message is None) or (message['type'] != 'message'):
-        return
+def forward_scheduler_commands():
+    """Blocks on the subscription of the scheduler channel and hands the received commands to the main loop"""
+    while True:
+        try:
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    data = msgpack.unpackb(message['data'], raw=False)
+                    dispatch_queue.put(SchedulerCommand(data['command'], data['params']))
+        except redis.ConnectionError as e:
+            # The subscription is renewed when the pubsub connection reconnects
+            print(f'Lost the connection to the scheduler channel: {e}')
+            time.sleep(REDIS_RECONNECT_DELAY)
+
 
-    data = msgpack.unpackb(message['data'], raw=False)
-    command = data['command']
-    params = data['params']
+def execute_command(scheduler_command: SchedulerCommand):
+    command = scheduler_command.command
+    params = scheduler_command.params
 
     if command == 'start':
         print('schedule experiment now')
@@ -348,30 +566,45 @@ def receive_and_execute_commands():
     elif command == 'stop':
         print('stop experiment')
         stop_experiment(params[0])
+    elif command == 'invalidate_database':
+        invalidate_influx_writer(params[0])
+        invalidate_database_info(params[0])
+    elif command == 'invalidate_device':
+        invalidate_data_handler_session(params[0])
+    elif command == 'set_recording_mode':
+        data_handler.set_recording_mode(*params)
+
+
+def dispatch(event):
+    if isinstance(event, events.SchedulerEvent):
+        handle_scheduling_events(event)
+    elif isinstance(event, ProcessStatusEvent):
+        handle_process_status_events(event)
+    elif isinstance(event, ExperimentChange):
+        handle_experiment_change(event)
+    elif isinstance(event, ReconcileExperiments):
+        schedule_future_experiments_from_database()
+    elif isinstance(event, SchedulerCommand):
+        execute_command(event)
 
 
 def main():
     pubsub.subscribe('scheduler')
+    Thread(target=forward_scheduler_commands, daemon=True).start()
     scheduler.add_listener(event_listener, events.EVENT_ALL)
-    scheduler.start()
-    schedule_future_experiments_from_database()
-    t = time.time()
+    # Containers taken by experiments that have not been started yet still carry the pool label
+    container_pool.start(docker_client, [entry.container_id for entry in load_experiment_states()])
+    container_supervisor.start()
+    # Paused, so no restored job runs before the recovery has restored its experiment, the recovery looks up the
+    # persisted jobs and needs a started scheduler for that
+    scheduler.start(paused=True)
+    recover_experiments()
+    scheduler.resume()
+    # The experiments are scheduled with the reconciliation requested by the change listener once it listens
+    Thread(target=forward_experiment_changes, daemon=True).start()
     while True:
-        try:
-            handle_scheduling_events(event_queue.get_nowait())
-        except queue.Empty:
-            pass
-
-        try:
-            handle_process_status_events(process_status_queue.get_nowait())
-        except queue.Empty:
-            pass
-
-        receive_and_execute_commands()
-        t2 = time.time()
-        if t2 - t >= 5:
-            t = t2
-            schedule_future_experiments_from_database()
+        # Sleeps until an event arrives
+        dispatch(dispatch_queue.get())
 
     scheduler.shutdown()
 
@@ -799,6 +799,28 @@ def add_devices(c):
                   ])
 
 
+def add_device_groups(c):
+    c.execute('create table if not exists device_groups '\
+            '(id serial primary key, '\
+            'name varchar(256))')
+    c.execute('create table if not exists device_group_members '\
+            '(id serial primary key, '\
+            'groupID integer references device_groups(id) on delete cascade, '\
+            'device UUID, '\
+            'unique (groupID, device))')
+    # Tables created before the constraints existed may contain orphaned and duplicate members
+    c.execute('delete from device_group_members m where not exists '\
+              '(select 1 from device_groups g where g.id = m.groupID)')
+    c.execute('delete from device_group_members a using device_group_members b '\
+              'where a.groupID = b.groupID and a.device = b.device and a.id > b.id')
+    c.execute('alter table device_group_members drop constraint if exists device_group_members_groupid_fkey')
+    c.execute('alter table device_group_members add constraint device_group_members_groupid_fkey '\
+              'foreign key (groupID) references device_groups(id) on delete cascade')
+    c.execute('alter table device_group_members drop constraint if exists device_group_members_groupid_device_key')
+    c.execute('alter table device_group_members add constraint device_group_members_groupid_device_key '\
+              'unique (groupID, device)')
+
+
 def add_features_for_data_handler(c):
     c.execute('create table if not exists features_for_data_handler ' \
               '(id serial primary key, ' \
@@ -818,6 +840,13 @@ def add_features_for_data_handler(c):
               'meta boolean)')
 
 
+def add_recording_columns(c, table):
+    # Databases created before the recording modes existed
+    c.execute(f"alter table {table} add column if not exists recording_mode varchar(256) default 'always'")
+    c.execute(f'alter table {table} add column if not exists deadband real default 0')
+    c.execute(f'alter table {table} add column if not exists max_silence integer default 0')
+
+
 def add_commands_for_data_handler(c):
     c.execute('create table if not exists commands_for_data_handler ' \
               '(id serial primary key, ' \
@@ -829,7 +858,12 @@ def add_commands_for_data_handler(c):
               'polling_interval_meta integer, ' \
               'activated boolean, ' \
               'meta boolean, ' \
-              'feature integer)')
+              'feature integer, ' \
+              # One of the recording modes of source/device_manager/recording_filter.py
+              'recording_mode varchar(256), ' \
+              'deadband real, ' \
+              'max_silence integer)')
+    add_recording_columns(c, 'commands_for_data_handler')
 
 
 def add_properties_for_data_handler(c):
@@ -843,7 +877,12 @@ def add_properties_for_data_handler(c):
               'polling_interval_meta integer, ' \
               'activated boolean, ' \
               'meta boolean, ' \
-              'feature integer)')
+              'feature integer, ' \
+              # One of the recording modes of source/device_manager/recording_filter.py
+              'recording_mode varchar(256), ' \
+              'deadband real, ' \
+              'max_silence integer)')
+    add_recording_columns(c, 'properties_for_data_handler')
 
 
 def add_parameters_for_data_handler(c):
@@ -914,7 +953,11 @@ def add_databases(c):
               'address varchar(256), ' \
               'port integer,'
               'username varchar(256),'
-              'password varchar(256))')
+              'password varchar(256),'
+              # Comma separated names of the sinks of source/device_manager/time_series_sink.py
+              'sinks varchar(256))')
+    # Databases created before there were several sinks
+    c.execute("alter table databases add column if not exists sinks varchar(256) default 'influx'")
 
 
 def add_logs(c):
@@ -965,6 +1008,23 @@ def add_experiments(c):
         ])
 
 
+def add_experiment_change_trigger(c):
+    # The scheduler listens on this channel instead of scanning all experiments, the notifications are sent on commit
+    c.execute("""create or replace function notify_experiment_change() returns trigger as $$
+        begin
+            if TG_OP = 'DELETE' then
+                perform pg_notify('experiment_changes', json_build_object('operation', TG_OP, 'id', OLD.id)::text);
+            else
+                perform pg_notify('experiment_changes', json_build_object('operation', TG_OP, 'id', NEW.id)::text);
+            end if;
+            return null;
+        end;
+        $$ language plpgsql""")
+    c.execute('drop trigger if exists experiment_changes on experiments')
+    c.execute('create trigger experiment_changes after insert or update or delete on experiments '
+              'for each row execute procedure notify_experiment_change()')
+
+
 def add_scripts(c):
     c.execute('create table if not exists scripts'\
             '(id serial primary key, '\
@@ -986,6 +1046,7 @@ def main():
     c = conn.cursor()
     add_user(c)
     add_devices(c)
+    add_device_groups(c)
     add_features_for_data_handler(c)
     add_commands_for_data_handler(c)
     add_properties_for_data_handler(c)
@@ -997,6 +1058,7 @@ def main():
     add_logs(c)
     add_scripts(c)
     add_experiments(c)
+    add_experiment_change_trigger(c)
     add_booking_info(c)
     conn.commit()
     conn.close()
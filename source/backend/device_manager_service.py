@@ -3,6 +3,7 @@ from dataclasses import asdict
 from dacite import from_dict, Config
 
 from source.device_manager.device_layer.device_info import DeviceInfo
+from source.device_manager.device_layer.device_call import DeviceCall, DeviceCallType
 from source.device_manager.device_manager import DeviceManager
 from source.device_manager.database import get_database_connection
 from pydantic import BaseModel
@@ -15,6 +16,7 @@ class NewDatabaseModel(BaseModel):
     port: int
     username: str
     password: str
+    sinks: str = 'influx'
 
 
 class DatabaseInfoModel(BaseModel):
@@ -24,6 +26,7 @@ class DatabaseInfoModel(BaseModel):
     port: int
     username: str
     password: str
+    sinks: str = 'influx'
 
 
 class DeviceStatusModel(BaseModel):
@@ -94,6 +97,22 @@ class DeviceCommandParameters(BaseModel):
     params: List[DeviceCommandParameter]
 
 
+class DeviceCallModel(BaseModel):
+    type: DeviceCallType
+    feature: str
+    identifier: str
+    params: Optional[List[DeviceCommandParameter]]
+
+
+class DeviceBatchModel(BaseModel):
+    calls: List[DeviceCallModel]
+
+
+class DeviceGroupModel(BaseModel):
+    name: str
+    devices: List[UUID]
+
+
 class DeviceManagerService:
     def __init__(self):
         self.device_manager = DeviceManager()
@@ -154,11 +173,99 @@ class DeviceManagerService:
         } for name, value in self.device_manager.get_feature_property(
             device, qualified_feature_identifier, property_id).items()]
 
+    async def get_status_async(self, uuid: UUID):
+        return asdict(await self.device_manager.get_status_async(uuid))
+
+    async def get_latest_values_async(self, uuid: UUID):
+        return await self.device_manager.get_latest_values_async(uuid)
+
+    async def get_features_async(self, uuid: UUID):
+        return [
+            asdict(feature)
+            for feature in await self.device_manager.get_features_async(uuid)
+        ]
+
+    async def call_feature_command_async(self, device: UUID, feature: str, command_id: str,
+                                         params: List[DeviceCommandParameter], timeout: float):
+        param_dict = {}
+        for param in params:
+            param_dict[param.name] = param.value
+
+        response = await self.device_manager.call_feature_command_async(device, feature, command_id, param_dict,
+                                                                        timeout)
+        return [{
+            'name': name.split('/')[0],
+            'value': value
+        } for name, value in response.items()]
+
+    async def get_feature_property_async(self, device: UUID, qualified_feature_identifier: str,
+                                         property_id: str, timeout: float):
+        response = await self.device_manager.get_feature_property_async(device, qualified_feature_identifier,
+                                                                        property_id, timeout)
+        return [{
+            'name': name.split('/')[0],
+            'value': value
+        } for name, value in response.items()]
+
+    async def call_batch_async(self, device: UUID, calls: List[DeviceCallModel], timeout: float):
+        device_calls = [
+            DeviceCall(call.type, call.feature, call.identifier,
+                       {param.name: param.value for param in call.params or []})
+            for call in calls
+        ]
+        return [
+            self._serialize_call_result(result)
+            for result in await self.device_manager.call_batch_async(device, device_calls, timeout)
+        ]
+
+    def get_device_groups(self):
+        return [asdict(group) for group in self.device_manager.get_device_group_list()]
+
+    def get_device_group(self, id: int):
+        group = self.device_manager.get_device_group(id)
+        return None if group is None else asdict(group)
+
+    def add_device_group(self, group: DeviceGroupModel):
+        return self.device_manager.add_device_group(group.name, group.devices)
+
+    def set_device_group(self, id: int, group: DeviceGroupModel) -> bool:
+        return self.device_manager.set_device_group(id, group.name, group.devices)
+
+    def delete_device_group(self, id: int):
+        self.device_manager.delete_device_group(id)
+
+    async def broadcast_async(self, group_id: int, call: DeviceCallModel, timeout: float):
+        device_call = DeviceCall(call.type, call.feature, call.identifier,
+                                 {param.name: param.value for param in call.params or []})
+        results = await self.device_manager.broadcast_async(group_id, device_call, timeout)
+        if results is None:
+            return None
+        return {uuid: self._serialize_call_result(result) for uuid, result in results.items()}
+
+    @staticmethod
+    def _serialize_call_result(result):
+        return {
+            'response': None if result.response is None else [{
+                'name': name.split('/')[0],
+                'value': value
+            } for name, value in result.response.items()],
+            'error': result.error
+        }
+
     def get_databases(self):
         return [
             asdict(database) for database in self.device_manager.get_database_info_list()
         ]
 
+    def get_ingestion_stats(self):
+        return self.device_manager.get_ingestion_stats()
+
+    def get_polling_stats(self):
+        return self.device_manager.get_polling_stats()
+
+    def get_container_start_stats(self):
+        return self.device_manager.get_container_start_stats()
+
     def get_database_status(self, id: int):
         return asdict(self.device_manager.get_database_status(id))
 
@@ -166,11 +273,12 @@ class DeviceManagerService:
         return asdict(self.device_manager.get_database_info(id))
 
     def add_database(self, database: NewDatabaseModel):
-        self.device_manager.add_database(database.name, database.address, database.port, database.username, database.password)
+        self.device_manager.add_database(database.name, database.address, database.port, database.username, database.password,
+                                         database.sinks)
 
     def set_database(self, id: int, database: DatabaseInfoModel):
         self.device_manager.set_database(database.id, database.name, database.address, database.port,
-                                         database.username, database.password)
+                                         database.username, database.password, database.sinks)
 
     def delete_database(self, id: int):
         self.device_manager.delete_database(id)
@@ -189,14 +297,19 @@ class DeviceManagerService:
 
     def set_command_attributes_for_data_handler(self, device_uuid: UUID, feature_id: str, command_id: str, active: bool,
                                                 meta: bool, interval: int, meta_interval: int,
-                                                parameters: List[DeviceCommandParameter]):
+                                                parameters: List[DeviceCommandParameter], recording_mode: str = None,
+                                                deadband: float = None, max_silence: int = None):
         self.device_manager.set_command_attributes_for_data_handler(device_uuid, feature_id, command_id, active, meta,
-                                                                    interval, meta_interval, parameters)
+                                                                    interval, meta_interval, parameters,
+                                                                    recording_mode, deadband, max_silence)
 
     def set_property_attributes_for_data_handler(self, device_uuid: UUID, feature_id: str, property_id: str,
-                                                 active: bool, meta: bool, interval: int, meta_interval: int):
+                                                 active: bool, meta: bool, interval: int, meta_interval: int,
+                                                 recording_mode: str = None, deadband: float = None,
+                                                 max_silence: int = None):
         self.device_manager.set_property_attributes_for_data_handler(device_uuid, feature_id, property_id, active, meta,
-                                                                     interval, meta_interval)
+                                                                     interval, meta_interval, recording_mode, deadband,
+                                                                     max_silence)
 
     def discover_sila_devices(self):
         return [
@@ -255,6 +368,12 @@ class DeviceManagerService:
     def delete_experiment(self, experimentID: int):
         return self.device_manager.delete_experiment(experimentID)
 
+    def get_experiment_data(self, experiment_id: int, format: str):
+        return self.device_manager.get_experiment_data(experiment_id, format)
+
+    def get_array_slice(self, uuid: UUID, feature: str, item: str, field: str, start: int, end: int, format: str):
+        return self.device_manager.get_array_slice(uuid, feature, item, field, start, end, format)
+
     def get_user_scripts(self, user: int):
         return [
             asdict(scripts)
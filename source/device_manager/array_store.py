@@ -0,0 +1,315 @@
+import io
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy
+
+from source.device_manager.data_directories import DATA_DIRECTORY
+from source.device_manager.global_storage import get_global_storage
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+#: Directory of the array store, every device, feature, item and field has its own subdirectory
+ARRAY_DIRECTORY = os.path.join(DATA_DIRECTORY, 'arrays')
+#: Bytes after which a new block file is started
+BLOCK_SIZE = 64 * 1024 * 1024
+#: Number of series whose files are kept open by the writer, the least recently opened one is closed first
+MAX_OPEN_SERIES = 256
+#: Bytes of a block sent to the client at once
+CHUNK_SIZE = 1024 * 1024
+#: The data type prefix of list responses, followed by the SiLA type of the elements
+LIST_TYPE_PREFIX = 'list/'
+#: The NumPy type of the elements of list responses
+ELEMENT_TYPES = {'Real': numpy.float64, 'Integer': numpy.int64, 'Boolean': numpy.bool_}
+
+#: NumPy array as .npy file
+EXPORT_NPY = 'npy'
+#: Arrow IPC stream with a time column and a values column of fixed size lists, requires pyarrow
+EXPORT_ARROW = 'arrow'
+#: The media type of every export format
+EXPORT_MEDIA_TYPES = {EXPORT_NPY: 'application/octet-stream', EXPORT_ARROW: 'application/vnd.apache.arrow.stream'}
+
+#: One record of the index of a series: time of the sample, block and row within the block
+INDEX_TYPE = numpy.dtype([('time', '<i8'), ('block', '<i4'), ('row', '<i4')])
+
+
+class ArrayStoreError(Exception):
+    """Raised if arrays could not be stored or read"""
+
+
+def _path_component(name: str) -> str:
+    name = str(name).replace('/', '.')
+    if name in ('', '.', '..') or os.sep in name:
+        raise ArrayStoreError(f'Invalid series name {name}')
+    return name
+
+
+def get_array_fields(response_types: List[Any]) -> Dict[str, Any]:
+    """Returns the NumPy element type of the list responses of a command or property, keyed by the lowercase identifier
+
+    :param response_types: Objects with the identifier and data_type of the responses
+    """
+    return {response.identifier.lower(): ELEMENT_TYPES.get(response.data_type[len(LIST_TYPE_PREFIX):])
+            for response in response_types
+            if response.data_type and response.data_type.startswith(LIST_TYPE_PREFIX)}
+
+
+def to_array(value: Any, element_type: Any = None) -> Optional[numpy.ndarray]:
+    """Returns a list response as NumPy array, None if it is empty, not a list or has no numeric elements of the same
+    shape
+
+    :param value: The value of a response, list elements may be data objects of the SiLA client
+    :param element_type: The NumPy type of the elements, inferred if None
+    """
+    if not isinstance(value, (list, tuple)):
+        return None
+    elements = [getattr(element, 'value', element) for element in value]
+    try:
+        array = numpy.asarray(elements, dtype=element_type)
+    except (TypeError, ValueError):
+        return None
+    if array.dtype.kind not in 'biuf' or array.size == 0:
+        return None
+    return array
+
+
+@dataclass
+class _Block:
+    dtype: str
+    shape: Tuple[int, ...]
+
+    @property
+    def row_size(self) -> int:
+        return numpy.dtype(self.dtype).itemsize * int(numpy.prod(self.shape, dtype=numpy.int64))
+
+
+def _block_path(directory: str, block: int) -> str:
+    return os.path.join(directory, f'block-{block:06d}.bin')
+
+
+def _read_blocks(directory: str) -> List[_Block]:
+    try:
+        with open(os.path.join(directory, 'blocks.json')) as file:
+            return [_Block(entry['dtype'], tuple(entry['shape'])) for entry in json.load(file)]
+    except FileNotFoundError:
+        return []
+
+
+class _SeriesWriter:
+    """Appends the arrays of one field to the block files and the index of its directory"""
+    def __init__(self, directory: str, block_size: int):
+        self.directory = directory
+        self.block_size = block_size
+        os.makedirs(directory, exist_ok=True)
+        self.blocks = _read_blocks(directory)
+        self._block_file = None
+        self.rows = 0
+        if self.blocks:
+            block = self.blocks[-1]
+            # A row that was only partly written before a crash is overwritten by the next one
+            self.rows = os.path.getsize(_block_path(directory, len(self.blocks) - 1)) // block.row_size
+            self._open_block()
+        index_path = os.path.join(directory, 'index.bin')
+        valid_size = self._recover_index(index_path) if os.path.exists(index_path) else 0
+        self._index_file = open(index_path, 'r+b' if valid_size else 'wb')
+        self._index_file.seek(valid_size)
+        self._index_file.truncate()
+
+    def _recover_index(self, index_path: str) -> int:
+        """Returns the size of the index without a record that was only partly written before a crash and without the
+        records of rows that were not written completely"""
+        size = os.path.getsize(index_path)
+        index = numpy.fromfile(index_path, dtype=INDEX_TYPE, count=size // INDEX_TYPE.itemsize)
+        last_block = len(self.blocks) - 1
+        valid = (index['block'] < last_block) | ((index['block'] == last_block) & (index['row'] < self.rows))
+        # The records are in the order of the rows, so only the last ones can point past the recovered rows
+        return (len(index) if valid.all() else int(numpy.argmin(valid))) * INDEX_TYPE.itemsize
+
+    def _open_block(self):
+        block = self.blocks[-1]
+        self._block_file = open(_block_path(self.directory, len(self.blocks) - 1), 'r+b' if self.rows else 'wb')
+        self._block_file.seek(self.rows * block.row_size)
+        self._block_file.truncate()
+
+    def _start_block(self, array: numpy.ndarray):
+        if self._block_file is not None:
+            self._block_file.close()
+        self.blocks.append(_Block(array.dtype.str, array.shape))
+        with open(os.path.join(self.directory, 'blocks.json'), 'w') as file:
+            json.dump([{'dtype': block.dtype, 'shape': list(block.shape)} for block in self.blocks], file)
+        self.rows = 0
+        self._open_block()
+
+    def append(self, time_ns: int, array: numpy.ndarray) -> Tuple[int, int]:
+        block = self.blocks[-1] if self.blocks else None
+        # Blocks only hold arrays of the same type and shape, so a time slice of a block is a single NumPy array
+        if block is None or block.dtype != array.dtype.str or block.shape != array.shape or \
+                (self.rows + 1) * block.row_size > self.block_size:
+            self._start_block(array)
+        position = (len(self.blocks) - 1, self.rows)
+        self._block_file.write(numpy.ascontiguousarray(array).tobytes())
+        self._block_file.flush()
+        self._index_file.write(numpy.array([(time_ns, position[0], position[1])], dtype=INDEX_TYPE).tobytes())
+        self._index_file.flush()
+        self.rows += 1
+        return position
+
+    def close(self):
+        if self._block_file is not None:
+            self._block_file.close()
+        self._index_file.close()
+
+
+@dataclass
+class ArraySlice:
+    """The arrays of a series within a time range, read from memory mapped block files without copying them"""
+    #: Nanoseconds since the epoch of the samples
+    times: numpy.ndarray
+    #: One array of shape (samples,) + shape of the samples per consecutive run of samples in the same block
+    segments: List[numpy.ndarray]
+
+    def check_shape(self):
+        """Raises an ArrayStoreError if the arrays cannot be encoded as one array, which is checked before encoding"""
+        shapes = {(segment.dtype.str, segment.shape[1:]) for segment in self.segments}
+        if len(shapes) > 1:
+            raise ArrayStoreError('The arrays of the time range differ in type or shape, select a shorter range')
+
+    def encode_npy(self) -> Iterator[bytes]:
+        """Encodes the arrays of the slice as one .npy array with the samples as first dimension"""
+        dtype, shape = (self.segments[0].dtype, self.segments[0].shape[1:]) if self.segments else (numpy.float64, ())
+        header = io.BytesIO()
+        numpy.lib.format.write_array_header_1_0(header, {'descr': numpy.lib.format.dtype_to_descr(numpy.dtype(dtype)),
+                                                         'fortran_order': False,
+                                                         'shape': (len(self.times),) + tuple(shape)})
+        yield header.getvalue()
+        for segment in self.segments:
+            data = memoryview(segment.reshape(-1)).cast('B')
+            for start in range(0, len(data), CHUNK_SIZE):
+                yield bytes(data[start:start + CHUNK_SIZE])
+
+    def encode_arrow(self) -> Iterator[bytes]:
+        """Encodes the slice as Arrow IPC stream with one record batch per segment, the values are flattened into
+        fixed size lists and the shape of the samples is stored in the schema metadata"""
+        if pyarrow is None:
+            raise ArrayStoreError('The Arrow export requires pyarrow')
+        dtype, shape = (self.segments[0].dtype, self.segments[0].shape[1:]) if self.segments else (numpy.float64, ())
+        size = int(numpy.prod(shape, dtype=numpy.int64))
+        schema = pyarrow.schema([('time', pyarrow.timestamp('ns', tz='UTC')),
+                                 ('values', pyarrow.list_(pyarrow.from_numpy_dtype(dtype), size))],
+                                metadata={'shape': json.dumps(list(shape))})
+        buffer = io.BytesIO()
+        writer = pyarrow.ipc.new_stream(buffer, schema)
+        start = 0
+        for segment in self.segments:
+            times = self.times[start:start + len(segment)]
+            start += len(segment)
+            # Numeric NumPy arrays are wrapped by Arrow without a copy
+            values = pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(segment.reshape(-1)), size)
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(times, type=schema.field('time').type), values], schema=schema))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        writer.close()
+        yield buffer.getvalue()
+
+
+class ArrayStore:
+    """Stores the list responses of the data handler as NumPy arrays in chunked binary block files
+
+    Every field of a command or property is a series with its own directory. The arrays are appended as raw rows to
+    block files holding arrays of one type and shape, the index file holds the time, block and row of every sample.
+    Time slices are read by a binary search in the index and memory mapped from the blocks.
+    """
+    def __init__(self, directory: str = ARRAY_DIRECTORY, block_size: int = BLOCK_SIZE):
+        """
+        :param directory: The directory of the series
+        :param block_size: Bytes after which a new block file is started
+        """
+        self.directory = directory
+        self.block_size = block_size
+        self._writers: Dict[Tuple[str, str, str, str], _SeriesWriter] = {}
+        self._lock = threading.Lock()
+
+    def get_series_directory(self, device_uuid: str, feature: str, item: str, field: str) -> str:
+        return os.path.join(self.directory, *(_path_component(name) for name in (device_uuid, feature, item, field)))
+
+    def append(self, device_uuid: str, feature: str, item: str, field: str, time_ns: int, array: numpy.ndarray) -> str:
+        """Stores an array and returns the reference written to the time-series sink instead of the array
+
+        :param device_uuid: The uuid of the device
+        :param feature: The identifier of the feature
+        :param item: The identifier of the command or property
+        :param field: The response the array is the value of
+        :param time_ns: Nanoseconds since the epoch at which the sample was taken
+        :param array: The value of the response
+        """
+        key = (device_uuid, feature, item, field)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                if len(self._writers) >= MAX_OPEN_SERIES:
+                    self._writers.pop(next(iter(self._writers))).close()
+                writer = _SeriesWriter(self.get_series_directory(*key), self.block_size)
+                self._writers[key] = writer
+            block, row = writer.append(time_ns, array)
+        return f'array:{block}:{row}'
+
+    def read_slice(self, device_uuid: str, feature: str, item: str, field: str, start: int, end: int) -> ArraySlice:
+        """Returns the arrays of a series from start to end in nanoseconds since the epoch, both inclusive"""
+        directory = self.get_series_directory(device_uuid, feature, item, field)
+        index_path = os.path.join(directory, 'index.bin')
+        if not os.path.exists(index_path):
+            raise ArrayStoreError(f'No arrays are stored for {feature}/{item} {field} of device {device_uuid}')
+        # A record that is being written is left out
+        count = os.path.getsize(index_path) // INDEX_TYPE.itemsize
+        if count == 0:
+            return ArraySlice(numpy.empty(0, dtype=numpy.int64), [])
+        index = numpy.memmap(index_path, dtype=INDEX_TYPE, mode='r', shape=(count,))
+        first = int(numpy.searchsorted(index['time'], start, side='left'))
+        last = int(numpy.searchsorted(index['time'], end, side='right'))
+        records = numpy.array(index[first:last])
+        del index
+        blocks = _read_blocks(directory)
+        segments = []
+        run_start = 0
+        for position in range(1, len(records) + 1):
+            # A run ends at the end of the slice, at a block change or at a gap in the rows
+            if position < len(records) and records['block'][position] == records['block'][position - 1] and \
+                    records['row'][position] == records['row'][position - 1] + 1:
+                continue
+            block = blocks[records['block'][run_start]]
+            rows = position - run_start
+            segments.append(numpy.memmap(_block_path(directory, int(records['block'][run_start])), dtype=block.dtype,
+                                         mode='r', offset=int(records['row'][run_start]) * block.row_size,
+                                         shape=(rows,) + block.shape))
+            run_start = position
+        return ArraySlice(records['time'], segments)
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = {}
+
+
+_store_lock = threading.Lock()
+
+
+def get_array_store() -> ArrayStore:
+    """Returns the array store of this process"""
+    storage = get_global_storage()
+    with _store_lock:
+        if storage.get('array_store') is None:
+            storage['array_store'] = ArrayStore()
+    return storage['array_store']
+
+
+def arrow_available() -> bool:
+    return pyarrow is not None
@@ -0,0 +1,54 @@
+import threading
+from typing import Tuple
+
+import msgpack
+
+from source.device_manager.database import get_redis_connection
+
+#: Redis key under which the scheduler stores the start latency histogram of the experiment containers
+STATS_KEY = 'container_start_stats'
+#: Upper bounds in seconds of the histogram buckets, a last bucket counts the slower starts
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+class StartLatencyHistogram:
+    """Counts the seconds from the start of an experiment job until its container runs, separately for containers
+    taken from the warm pool and containers created on demand"""
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        :param buckets: Upper bounds in seconds of the buckets
+        """
+        self.buckets = buckets
+        self._counts = {'warm': [0] * (len(buckets) + 1), 'cold': [0] * (len(buckets) + 1)}
+        self._sums = {'warm': 0.0, 'cold': 0.0}
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, warm: bool):
+        kind = 'warm' if warm else 'cold'
+        bucket = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            self._counts[kind][bucket] += 1
+            self._sums[kind] += seconds
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                **{kind: {'counts': list(counts), 'count': sum(counts), 'sum': self._sums[kind]}
+                   for kind, counts in self._counts.items()}
+            }
+
+    def publish(self):
+        """Stores the histogram in Redis for the backend"""
+        try:
+            get_redis_connection().set(STATS_KEY, msgpack.packb(self.to_dict()))
+        except Exception as e:
+            print(f'Could not publish the container start statistics: {e}')
+
+
+def get_published_stats() -> dict:
+    """Returns the start latency histogram last published by the scheduler"""
+    stats = get_redis_connection().get(STATS_KEY)
+    if stats is None:
+        return {}
+    return msgpack.unpackb(stats, raw=False)
@@ -0,0 +1,153 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+from uuid import UUID
+
+import grpc
+
+from source.device_manager.device_layer.database_info import DatabaseInfo
+from source.device_manager.device_layer.device_info import DeviceInfo
+from source.device_manager.device_layer.device_interface import DeviceInterface, DeviceType
+from source.device_manager.device_manager import DeviceManager, create_device_instance_from_info
+from source.device_manager.global_storage import get_global_storage
+
+#: Seconds to wait after a failed connection attempt before the device is connected again
+RECONNECT_DELAY = 10
+
+T = TypeVar('T')
+
+
+class DataHandlerSession:
+    """The connected device and the cached device and database info used by the data handler jobs of one device
+
+    The device is connected by the first call and reused by all following ticks. If a call fails with a gRPC error other
+    than an exceeded deadline, the connection is closed and the next call reconnects, at most once per RECONNECT_DELAY
+    seconds. The infos are read from the database once and cached until the session is invalidated, e.g. after the
+    device has been edited or linked to another database.
+    """
+    def __init__(self, uuid: str):
+        self.uuid = uuid
+        self._device: Optional[DeviceInterface] = None
+        self._info: Optional[Tuple[DeviceInfo, Optional[DatabaseInfo]]] = None
+        self._next_connect = 0
+        self._closed = False
+        # Calls are serialized, because the dynamic client stores the parameters of a command in the command object
+        self._call_lock = threading.Lock()
+        self._info_lock = threading.Lock()
+
+    def get_info(self) -> Tuple[DeviceInfo, Optional[DatabaseInfo]]:
+        """Returns the info of the device and the info of its database, which is None if no database is linked"""
+        with self._info_lock:
+            if self._info is None:
+                device_manager = DeviceManager()
+                device_info = device_manager.get_device_info(self.uuid)
+                database_info = None
+                if device_info.databaseId is not None:
+                    database_info = device_manager.get_database_info(device_info.databaseId)
+                self._info = device_info, database_info
+            return self._info
+
+    def invalidate_info(self):
+        """Reads the infos from the database again with the next call of get_info()"""
+        with self._info_lock:
+            self._info = None
+
+    def invalidate_database_info(self, database_id: int):
+        """Reads the infos from the database again with the next call of get_info(), if the device is linked to the
+        database"""
+        with self._info_lock:
+            if self._info is not None and self._info[0].databaseId == database_id:
+                self._info = None
+
+    def _get_device(self) -> DeviceInterface:
+        if self._device is None:
+            if time.monotonic() < self._next_connect:
+                raise ConnectionError(f'Device {self.uuid} is not reachable')
+            device = create_device_instance_from_info(self.get_info()[0])
+            device.connect()
+            if device.type == DeviceType.SILA and not device.is_online():
+                self._next_connect = time.monotonic() + RECONNECT_DELAY
+                raise ConnectionError(f'Could not connect to device {self.uuid}')
+            self._device = device
+        return self._device
+
+    def _close_device(self):
+        if self._device is not None:
+            self._device.close()
+            self._device = None
+
+    def call(self, function: Callable[[DeviceInterface], T]) -> T:
+        """Calls a function with the connected device
+
+        :param function: The function to call, e.g. a command or property call of the device
+        :return: The return value of the function
+        """
+        with self._call_lock:
+            try:
+                return function(self._get_device())
+            except grpc.RpcError as e:
+                if not isinstance(e, grpc.Call) or e.code() != grpc.StatusCode.DEADLINE_EXCEEDED:
+                    # The connection is broken, e.g. because the device has been restarted
+                    self._close_device()
+                raise
+            finally:
+                if self._closed:
+                    self._close_device()
+
+    def reconnect(self):
+        """Closes the connection to the device, the next call connects again, e.g. after a subscription has failed"""
+        with self._call_lock:
+            self._close_device()
+
+    def close(self):
+        """Closes the connection to the device, a call that is still running closes it when it is done"""
+        self._closed = True
+        if self._call_lock.acquire(blocking=False):
+            try:
+                self._close_device()
+            finally:
+                self._call_lock.release()
+
+
+_sessions_lock = threading.Lock()
+
+
+def _get_sessions() -> Dict[str, DataHandlerSession]:
+    return get_global_storage().setdefault('data_handler_sessions', {})
+
+
+def get_data_handler_session(uuid: UUID) -> DataHandlerSession:
+    """Returns the session of a device, which is created with the first call
+
+    :param uuid: The uuid of the device
+    """
+    with _sessions_lock:
+        sessions = _get_sessions()
+        session = sessions.get(str(uuid))
+        if session is None:
+            session = DataHandlerSession(str(uuid))
+            sessions[str(uuid)] = session
+    return session
+
+
+def invalidate_data_handler_session(uuid: UUID):
+    """Closes the session of a device, e.g. after it has been edited, deleted or linked to another database
+
+    :param uuid: The uuid of the device
+    """
+    with _sessions_lock:
+        session = _get_sessions().pop(str(uuid), None)
+    if session is not None:
+        session.close()
+
+
+def invalidate_database_info(database_id: int):
+    """Reads the database info of all sessions whose device is linked to the database again, e.g. after the database
+    has been edited or deleted
+
+    :param database_id: The id of the database
+    """
+    with _sessions_lock:
+        sessions = list(_get_sessions().values())
+    for session in sessions:
+        session.invalidate_database_info(database_id)
@@ -1,6 +1,7 @@
 import psycopg2
 from psycopg2 import pool
 import aioredis
+import redis
 import configparser
 import logging
 
@@ -16,14 +17,34 @@ async def get_redis_pool():
     return storage['redis']
 
 
+def get_redis_connection() -> redis.Redis:
+    storage = get_storage()
+    if storage.get('redis_connection') is None:
+        storage['redis_connection'] = redis.Redis(host='localhost')
+    return storage['redis_connection']
+
+
+def _get_database_config():
+    storage = get_storage()
+    if storage.get('dbconf') is None:
+        config = configparser.ConfigParser()
+        config.read(f'{DATA_DIRECTORY}/device-manager.conf')
+        storage['dbconf'] = config['Database']
+    return storage['dbconf']
+
+
+def connect_database(**kwargs):
+    """Opens a connection outside of the pool, for connections that are held open, like the ones waiting for
+    notifications"""
+    dbconf = _get_database_config()
+    return psycopg2.connect(host=dbconf['host'], port=dbconf['port'], user=dbconf['user'],
+                            password=dbconf['password'], **kwargs)
+
+
 def get_database_connection():
     storage = get_storage()
     if storage.get('pool') is None:
-        if storage.get('dbconf') is None:
-            config = configparser.ConfigParser()
-            config.read(f'{DATA_DIRECTORY}/device-manager.conf')
-            storage['dbconf'] = config['Database']
-        dbconf = storage['dbconf']
+        dbconf = _get_database_config()
 
         storage['pool'] = psycopg2.pool.ThreadedConnectionPool(minconn=1,
                                                                maxconn=2000,
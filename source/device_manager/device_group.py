@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+from typing import List, Optional
+from uuid import UUID
+from source.device_manager.device_layer.device_info import DeviceInfo
+from source.device_manager.database import get_database_connection, release_database_connection
+
+
+@dataclass
+class DeviceGroup:
+    id: int
+    name: str
+    devices: List[UUID]
+
+
+def _get_group_members_inside_transaction(cursor, group_id: int) -> List[UUID]:
+    cursor.execute('select device from device_group_members where groupID=%s order by id', [group_id])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _set_group_members_inside_transaction(cursor, group_id: int, devices: List[UUID]):
+    cursor.execute('delete from device_group_members where groupID=%s', [group_id])
+    # A device is a member once, in the order of its first occurrence
+    for device in dict.fromkeys(str(device) for device in devices):
+        cursor.execute('insert into device_group_members values (default,%s,%s)', [group_id, device])
+
+
+def _get_group_member_info_inside_transaction(cursor, group_id: int) -> List[DeviceInfo]:
+    cursor.execute(
+        'select devices.uuid,devices.server_uuid,devices.name,devices.type,devices.address,devices.port,'\
+        'devices.available,devices.userID,devices.databaseID,devices.activated from devices '\
+        'join device_group_members on device_group_members.device=devices.uuid '\
+        'where device_group_members.groupID=%s order by device_group_members.id',
+        [group_id])
+    return [
+        DeviceInfo(row[0], row[1], row[2], row[3], row[4],
+                   row[5], row[6], row[7], row[8], row[9]) for row in cursor.fetchall()
+    ]
+
+
+def get_device_group_list() -> List[DeviceGroup]:
+    """Returns all device groups with their members"""
+    groups = []
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('select id, name from device_groups order by id')
+            groups = [DeviceGroup(row[0], row[1], []) for row in cursor.fetchall()]
+            for group in groups:
+                group.devices = _get_group_members_inside_transaction(cursor, group.id)
+    release_database_connection(conn)
+    return groups
+
+
+def get_device_group(id: int) -> Optional[DeviceGroup]:
+    """Returns the specified device group, None if it does not exist
+    Args:
+        id: The id of the device group
+    """
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('select id, name from device_groups where id=%s', [id])
+            row = cursor.fetchone()
+            group = None if row is None else \
+                DeviceGroup(row[0], row[1], _get_group_members_inside_transaction(cursor, id))
+    release_database_connection(conn)
+    return group
+
+
+def get_device_group_member_info(id: int) -> Optional[List[DeviceInfo]]:
+    """Returns the device infos of all members of the specified device group, None if it does not exist
+    Args:
+        id: The id of the device group
+    """
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('select 1 from device_groups where id=%s', [id])
+            if cursor.fetchone() is None:
+                devices = None
+            else:
+                devices = _get_group_member_info_inside_transaction(cursor, id)
+    release_database_connection(conn)
+    return devices
+
+
+def add_device_group(name: str, devices: List[UUID]) -> int:
+    """Add a new device group to the database
+    Args:
+        name: The name of the group
+        devices: The uuids of the devices in the group
+    Returns:
+        The id of the new group
+    """
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('insert into device_groups values (default,%s) returning id', [name])
+            id = cursor.fetchone()[0]
+            _set_group_members_inside_transaction(cursor, id, devices)
+    release_database_connection(conn)
+    return id
+
+
+def set_device_group(id: int, name: str, devices: List[UUID]) -> bool:
+    """Updates the name and the members of a device group
+    Args:
+        id: The id of the group
+        name: The name of the group
+        devices: The uuids of the devices in the group
+    Returns:
+        False if the group does not exist
+    """
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('update device_groups set name=%s where id=%s', [name, id])
+            exists = cursor.rowcount > 0
+            if exists:
+                _set_group_members_inside_transaction(cursor, id, devices)
+    release_database_connection(conn)
+    return exists
+
+
+def delete_device_group(id: int):
+    """Delete a device group from the database
+    Args:
+        id: The id of the group
+    """
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('delete from device_group_members where groupID=%s', [id])
+            cursor.execute('delete from device_groups where id=%s', [id])
+    release_database_connection(conn)
+
+
+def remove_device_from_groups(device: UUID):
+    """Remove a device from all groups, e.g. after it has been deleted
+    Args:
+        device: The uuid of the device
+    """
+    conn = get_database_connection()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute('delete from device_group_members where device=%s', [str(device)])
+    release_database_connection(conn)
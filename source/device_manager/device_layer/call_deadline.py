@@ -0,0 +1,62 @@
+import collections
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import grpc
+
+from source.device_manager.thread_local_storage import get_storage
+
+
+class _ClientCallDetails(
+        collections.namedtuple('_ClientCallDetails',
+                               ('method', 'timeout', 'metadata', 'credentials', 'wait_for_ready', 'compression')),
+        grpc.ClientCallDetails):
+    pass
+
+
+def get_call_deadline() -> Optional[float]:
+    """Returns the deadline of the device calls of the current thread as time.monotonic() value, None if there is none"""
+    return get_storage().get('call_deadline')
+
+
+@contextmanager
+def call_deadline(timeout: Optional[float]):
+    """Limits all gRPC calls of the current thread inside the with block to a common deadline
+
+    The deadline covers the whole block, e.g. all polls of the execution info of an observable command, not every
+    single call. Calls started after the deadline fail with DEADLINE_EXCEEDED.
+
+    :param timeout: Seconds from now until the deadline, None for no deadline
+    """
+    storage = get_storage()
+    previous = storage.get('call_deadline')
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if previous is not None and (deadline is None or previous < deadline):
+        # A nested block can only shorten the deadline
+        deadline = previous
+    storage['call_deadline'] = deadline
+    try:
+        yield
+    finally:
+        storage['call_deadline'] = previous
+
+
+class DeadlineInterceptor(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor):
+    """Sets the timeout of every call on the channel to the remaining time until the deadline of the calling thread"""
+    def _with_deadline(self, client_call_details):
+        deadline = get_call_deadline()
+        if deadline is None:
+            return client_call_details
+        timeout = max(deadline - time.monotonic(), 0)
+        if client_call_details.timeout is not None:
+            timeout = min(timeout, client_call_details.timeout)
+        return _ClientCallDetails(client_call_details.method, timeout, client_call_details.metadata,
+                                  client_call_details.credentials, client_call_details.wait_for_ready,
+                                  client_call_details.compression)
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        return continuation(self._with_deadline(client_call_details), request)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        return continuation(self._with_deadline(client_call_details), request)
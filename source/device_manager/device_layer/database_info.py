@@ -9,6 +9,8 @@ class DatabaseInfo:
     port: int
     username: str
     password: str
+    #: Comma separated names of the sinks the data handler writes into, see time_series_sink.SINKS
+    sinks: str = 'influx'
 
 @dataclass
 class DatabaseInfoNew:
@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Optional
+
+
+class DeviceCallType(str, Enum):
+    COMMAND = 'command'
+    PROPERTY = 'property'
+
+
+@dataclass
+class DeviceCall:
+    type: DeviceCallType
+    feature: str
+    identifier: str
+    params: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class DeviceCallResult:
+    response: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
@@ -40,6 +40,9 @@ class DataHandlerConfig:
     polling_interval_meta: int
     active: bool
     meta: bool
+    recording_mode: str
+    deadband: float
+    max_silence: int
 
 
 @dataclass
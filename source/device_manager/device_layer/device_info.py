@@ -7,6 +7,7 @@ from uuid import UUID
 class DeviceStatus:
     online: bool
     status: str
+    latency: Optional[float] = None
 
 
 @dataclass
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import sqlite3
 from enum import IntEnum
 from dataclasses import dataclass
@@ -40,6 +40,10 @@ class DeviceInterface(ABC):
     #async def connect_async(self):
     #    pass
 
+    def close(self):
+        """Releases the connection to the device"""
+        pass
+
     @abstractmethod
     def get_status(self):
         pass
@@ -68,3 +72,51 @@ class DeviceInterface(ABC):
     def call_command(self, feature_id: str, command_id: str,
                      parameters: Dict[str, Any]):
         pass
+
+
+class AsyncDeviceInterface(ABC):
+    """Device interface whose calls are coroutines executed on the event loop of the caller"""
+    @abstractmethod
+    def __init__(self, ip: str, port: int, uuid: UUID, name: str,
+                 type: DeviceType):
+        self.ip = ip
+        self.port = port
+        self.uuid = uuid
+        self.name = name
+        self.type = type
+
+    @abstractmethod
+    async def connect(self):
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    @abstractmethod
+    def get_status(self):
+        pass
+
+    @abstractmethod
+    def is_online(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def ping(self, timeout: Optional[float] = None):
+        """Executes a cheap call on the device to check that it responds, the timeout is sent as deadline of the call"""
+        pass
+
+    @abstractmethod
+    def get_feature_names(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    async def call_command(self, feature_id: str, command_id: str,
+                           parameters: Dict[str, Any], timeout: Optional[float] = None):
+        """Calls a command, the timeout is sent to the device as deadline of the call"""
+        pass
+
+    @abstractmethod
+    async def call_property(self, feature_id: str, property_id: str, timeout: Optional[float] = None):
+        """Requests a property, the timeout is sent to the device as deadline of the call"""
+        pass
@@ -0,0 +1,256 @@
+import itertools
+import threading
+import time
+import grpc
+from dataclasses import dataclass
+from multiprocessing import Process, Pipe
+from typing import Any, Callable, Dict, List, Optional
+
+from source.device_manager.device_layer.device_info import DeviceInfo
+from source.device_manager.device_layer.device_interface import DeviceInterface
+
+#: Number of worker processes that are started per device
+WORKERS_PER_DEVICE = 1
+#: Seconds after which an unused worker process is shut down
+WORKER_IDLE_TIMEOUT = 600
+#: Seconds to wait for the response of a worker before it is considered hung
+WORKER_REQUEST_TIMEOUT = 120
+
+
+class DeviceWorkerError(Exception):
+    """Raised if a device worker could not process a request"""
+
+
+@dataclass
+class WorkerRequest:
+    request_id: int
+    method: str
+    args: tuple
+
+
+@dataclass
+class WorkerResponse:
+    request_id: int
+    result: Any = None
+    error: Optional[str] = None
+
+
+def _device_worker_main(info: DeviceInfo, device_factory: Callable[[DeviceInfo], DeviceInterface],
+                        handlers: Dict[str, Callable], connection, idle_timeout: float):
+    """Main loop of a device worker process
+
+    The worker keeps one connected device instance alive and serves the requests received over the connection
+    until it receives None, the connection is closed or it has been idle for longer than idle_timeout.
+
+    :param info: The device the worker is responsible for
+    :param device_factory: Creates the (not yet connected) device instance for the device info
+    :param handlers: The functions that can be requested, called as handler(device, *args)
+    :param connection: The worker end of the pipe to the pool
+    :param idle_timeout: Seconds without a request after which the worker exits
+    """
+    device = None
+    try:
+        while connection.poll(idle_timeout):
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            try:
+                if device is None or not device.is_online():
+                    device = device_factory(info)
+                    device.connect()
+                response = WorkerResponse(request.request_id, handlers[request.method](device, *request.args))
+            except grpc.RpcError as e:
+                # The channel is broken, reconnect on the next request
+                device = None
+                response = WorkerResponse(request.request_id, error=f'{type(e).__name__}: {e}')
+            except Exception as e:
+                response = WorkerResponse(request.request_id, error=f'{type(e).__name__}: {e}')
+            connection.send(response)
+    finally:
+        connection.close()
+
+
+class DeviceWorker:
+    """A single long-lived worker process serving the requests for one device"""
+    def __init__(self, info: DeviceInfo, device_factory: Callable[[DeviceInfo], DeviceInterface],
+                 handlers: Dict[str, Callable], idle_timeout: float):
+        self.info = info
+        self.restarts = 0
+        self.last_used = time.monotonic()
+        self._device_factory = device_factory
+        self._handlers = handlers
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._process = None
+        self._connection = None
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def is_busy(self) -> bool:
+        return self._lock.locked()
+
+    def _start(self):
+        parent_conn, child_conn = Pipe()
+        # The worker exits on its own somewhat later than the pool evicts it, so an idle worker is never
+        # shut down while the pool is sending a request to it
+        self._process = Process(target=_device_worker_main,
+                                args=(self.info, self._device_factory, self._handlers, child_conn,
+                                      2 * self._idle_timeout),
+                                daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._connection = parent_conn
+
+    def _terminate(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process.join()
+            self._process.close()
+            self._process = None
+
+    def call(self, method: str, args: tuple, timeout: float):
+        """Send a request to the worker process and wait for the result
+
+        A crashed worker is restarted before the request is sent. A worker that crashes or does not answer within
+        the timeout while processing the request is terminated and restarted with the next request.
+        """
+        with self._lock:
+            self.last_used = time.monotonic()
+            if not self.is_alive():
+                if self._process is not None:
+                    print(f'Restarting crashed worker of device {self.info.uuid}')
+                    self.restarts += 1
+                self._terminate()
+                self._start()
+            request = WorkerRequest(next(self._request_ids), method, args)
+            try:
+                self._connection.send(request)
+                if not self._connection.poll(timeout):
+                    self._terminate()
+                    raise DeviceWorkerError(
+                        f'Worker of device {self.info.uuid} did not answer {method} within {timeout} s')
+                response = self._connection.recv()
+            except (EOFError, OSError) as e:
+                self._terminate()
+                raise DeviceWorkerError(f'Worker of device {self.info.uuid} crashed during {method}') from e
+            finally:
+                self.last_used = time.monotonic()
+        if response.error is not None:
+            raise DeviceWorkerError(response.error)
+        return response.result
+
+    def stop(self):
+        """Shut the worker process down"""
+        with self._lock:
+            if self.is_alive():
+                try:
+                    self._connection.send(None)
+                    self._process.join(timeout=5)
+                except OSError:
+                    pass
+            self._terminate()
+
+
+class DeviceWorkerPool:
+    """Long-lived worker processes that keep connected device instances alive
+
+    Requests for a device are dispatched to one of its workers. Requests with the same session key are always
+    served by the same worker, requests without one go to an idle worker if there is one. Workers that have not been
+    used for idle_timeout seconds are shut down and started again when they are needed.
+    """
+    def __init__(self, device_factory: Callable[[DeviceInfo], DeviceInterface], handlers: Dict[str, Callable],
+                 workers_per_device: int = WORKERS_PER_DEVICE, idle_timeout: float = WORKER_IDLE_TIMEOUT,
+                 request_timeout: float = WORKER_REQUEST_TIMEOUT):
+        """
+        :param device_factory: Creates the (not yet connected) device instance for a device info
+        :param handlers: The functions that can be dispatched to the workers, called as handler(device, *args)
+        :param workers_per_device: Number of worker processes per device
+        :param idle_timeout: Seconds after which an unused worker is shut down
+        :param request_timeout: Default number of seconds to wait for the result of a request
+        """
+        self._device_factory = device_factory
+        self._handlers = handlers
+        self._workers_per_device = workers_per_device
+        self._idle_timeout = idle_timeout
+        self._request_timeout = request_timeout
+        self._workers: Dict[str, List[DeviceWorker]] = {}
+        self._lock = threading.Lock()
+        self._reaper = threading.Thread(target=self._reap_idle_workers, daemon=True)
+        self._reaper.start()
+
+    @staticmethod
+    def _connection_details(info: DeviceInfo):
+        return info.address, info.port, info.type, info.name
+
+    def _get_worker(self, info: DeviceInfo, session: Optional[str]) -> DeviceWorker:
+        key = str(info.uuid)
+        stale = []
+        with self._lock:
+            workers = self._workers.get(key)
+            if workers is not None and \
+                    self._connection_details(workers[0].info) != self._connection_details(info):
+                # The device has been edited, the running workers connect to the old address
+                stale = workers
+                workers = None
+            if workers is None:
+                workers = [
+                    DeviceWorker(info, self._device_factory, self._handlers, self._idle_timeout)
+                    for _ in range(self._workers_per_device)
+                ]
+                self._workers[key] = workers
+        for worker in stale:
+            worker.stop()
+        if session is not None:
+            return workers[hash(session) % len(workers)]
+        idle_workers = [worker for worker in workers if not worker.is_busy()]
+        return min(idle_workers or workers, key=lambda worker: worker.last_used)
+
+    def dispatch(self, info: DeviceInfo, method: str, *args, session: Optional[str] = None,
+                 timeout: Optional[float] = None):
+        """Execute a request in a worker of the specified device
+
+        :param info: The device to execute the request for
+        :param method: The name of the handler to call
+        :param args: The arguments passed to the handler after the device instance
+        :param session: Optional session key, requests with the same key are served by the same worker
+        :param timeout: Seconds to wait for the result, defaults to the request timeout of the pool
+        :return: The return value of the handler
+        """
+        if method not in self._handlers:
+            raise DeviceWorkerError(f'Unknown device worker request {method}')
+        worker = self._get_worker(info, session)
+        return worker.call(method, args, self._request_timeout if timeout is None else timeout)
+
+    def shutdown_device(self, uuid):
+        """Shut down all workers of the specified device, e.g. after it has been edited or deleted"""
+        with self._lock:
+            workers = self._workers.pop(str(uuid), [])
+        for worker in workers:
+            worker.stop()
+
+    def shutdown(self):
+        """Shut down all workers"""
+        with self._lock:
+            workers = [worker for device_workers in self._workers.values() for worker in device_workers]
+            self._workers = {}
+        for worker in workers:
+            worker.stop()
+
+    def _reap_idle_workers(self):
+        while True:
+            time.sleep(max(self._idle_timeout / 4, 1))
+            now = time.monotonic()
+            with self._lock:
+                workers = [worker for device_workers in self._workers.values() for worker in device_workers]
+            for worker in workers:
+                if worker.is_alive() and not worker.is_busy() and now - worker.last_used > self._idle_timeout:
+                    worker.stop()
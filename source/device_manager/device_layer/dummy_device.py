@@ -1,5 +1,5 @@
-from source.device_manager.device_layer.device_interface import DeviceInterface, DeviceType
-from typing import List, Dict, Any
+from source.device_manager.device_layer.device_interface import DeviceInterface, AsyncDeviceInterface, DeviceType
+from typing import List, Dict, Any, Optional
 
 
 class DummyDevice(DeviceInterface):
@@ -41,3 +41,38 @@ class DummyDevice(DeviceInterface):
 
     def get_properties(self, feature_id: str):
         return []
+
+
+class AsyncDummyDevice(AsyncDeviceInterface):
+    def __init__(self,
+                 ip: str,
+                 port: int,
+                 uuid,
+                 name: str,
+                 type: DeviceType = DeviceType.CUSTOM):
+        super().__init__(ip, port, uuid, name, type)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def get_status(self):
+        return ""
+
+    def is_online(self):
+        return False
+
+    async def ping(self, timeout: Optional[float] = None):
+        pass
+
+    def get_feature_names(self) -> List[str]:
+        return []
+
+    async def call_command(self, feature_id: str, command_id: str,
+                           parameters: Dict[str, Any], timeout: Optional[float] = None):
+        pass
+
+    async def call_property(self, feature_id, property_id, timeout: Optional[float] = None):
+        pass
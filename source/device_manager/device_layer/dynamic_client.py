@@ -5,16 +5,22 @@ from typing import Optional
 from typing import Dict, List, Any
 
 import os
+import copy
+import time
 import grpc
+from grpc import aio
 
 from sila2lib.sila_client import SiLA2Client
 
-from sila2lib.framework.std_features import SiLAService_pb2, SimulationController_pb2
+from sila2lib.framework.std_features import SiLAService_pb2, SiLAService_pb2_grpc, SimulationController_pb2
 from sila2lib.framework import SiLAFramework_pb2 as silaFW_pb2
 
 from sila2lib.proto_builder.dynamic_feature import DynamicFeature
 from sila2lib.proto_builder.data.data_base import DataBase
 
+from source.device_manager.device_layer.stub_cache import CachedDynamicFeature
+from source.device_manager.device_layer.call_deadline import DeadlineInterceptor
+
 from source.device_manager.data_directories import TEMP_DIRECTORY
 from uuid import UUID
 import filelock
@@ -92,6 +98,9 @@ class DynamicSiLA2Client(SiLA2Client):
                  server_port: int = 50051):
         super().__init__(name, description, server_name, client_uuid, version,
                          vendor_url, server_hostname, server_ip, server_port)
+        # all calls of this client are limited by the call deadline of the calling thread
+        self.channel = grpc.intercept_channel(self.channel, DeadlineInterceptor())
+        self.SiLAService_stub = SiLAService_pb2_grpc.SiLAServiceStub(self.channel)
         # get the servers UUID
         response = self.SiLAService_stub.Get_ServerUUID(
             SiLAService_pb2.Get_ServerUUID_Parameters())
@@ -236,9 +245,7 @@ class DynamicSiLA2Client(SiLA2Client):
                                                     major_feature_version.strip(),
                                                     f'{feature_identifier.strip()}.sila.xml')
                         self._features[qualified_feature_identifier.strip('\n')] = \
-                            DynamicFeature(fdl_file=fdl_filename, channel=self.channel)
-                        del sys.modules[feature_identifier.strip() + '_pb2' ]
-                        del sys.modules[feature_identifier.strip() + '_pb2_grpc']
+                            CachedDynamicFeature(fdl_file=fdl_filename, channel=self.channel)
                     else:
                         # For unqualified features:
                         fdl_filename = os.path.join(
@@ -246,14 +253,7 @@ class DynamicSiLA2Client(SiLA2Client):
                             f'{qualified_feature_identifier.strip()}.sila.xml'
                         )
                         self._features[qualified_feature_identifier.strip('\n')] = \
-                            DynamicFeature(fdl_file=fdl_filename, channel=self.channel)
-
-                        del sys.modules[qualified_feature_identifier.rstrip('\n') + '_pb2']
-                        del sys.modules[qualified_feature_identifier.rstrip('\n') + '_pb2_grpc']
-
-                    # del sys.modules[feature_id.rstrip('\n') + '_pb2']
-                    # del sys.modules[feature_id.rstrip('\n') + '_pb2_grpc']
-                    sys.path.remove(os.path.dirname(fdl_filename))
+                            CachedDynamicFeature(fdl_file=fdl_filename, channel=self.channel)
 
     def stop(self, force: bool = False):
         # nothing to do I guess
@@ -387,11 +387,135 @@ class DynamicSiLA2Client(SiLA2Client):
 
             return return_value
 
+    def subscribe_property(self, feature_id: str, property_id: str):
+        """Opens a subscription to an observable property, which stays open until it is cancelled
+
+        :param feature_id: The identifier of the feature
+        :param property_id: The identifier of the property
+        :return: The gRPC stream of the property values, which can be cancelled from another thread, and a function
+            that converts a message of the stream into a dict of values
+        """
+        _property = self._features[feature_id].properties[property_id]
+        if not _property.observable:
+            raise TypeError(f'Property {property_id} of feature {feature_id} is not observable')
+        stream = _property._function(_property.parameters())
+
+        def parse(message) -> Dict[str, Any]:
+            response = copy.copy(_property.responses)
+            response.parse_from_message(message=message)
+            return {path: response.get_value(path=path) for path in _property.responses.paths}
+
+        return stream, parse
+
     @staticmethod
     def _list_names(content: Dict[str, Any]):
         return list(content.keys())
 
 
+class AsyncDynamicSiLA2Client:
+    """ Asynchronous access to a SiLA server based on grpc.aio
+
+    The feature definitions, generated protobuf modules and data types are taken from an already running
+    DynamicSiLA2Client, only the calls are executed over an asyncio channel. This way, an arbitrary number of calls
+    can be in flight on a single event loop. Every call accepts a timeout, which is sent to the server as the gRPC
+    deadline, so a call that times out is cancelled on both sides and frees its resources.
+    """
+    #: Stubs of the features bound to the asyncio channel
+    _stubs: Dict[str, Any]
+
+    def __init__(self, client: DynamicSiLA2Client):
+        """
+        :param client: A dynamic client on which run() has been called
+        :type client: DynamicSiLA2Client
+        """
+        self.client = client
+        target = f'{client.server_hostname}:{client.server_port}'
+        if client.encryption:
+            self.channel = aio.secure_channel(
+                target, grpc.ssl_channel_credentials(root_certificates=client.server_cert))
+        else:
+            self.channel = aio.insecure_channel(target)
+        self._stubs = {}
+        for qualified_feature_identifier, feature in client._features.items():
+            stub_class = getattr(feature._module_pb2_grpc, f'{feature.feature_id}Stub')
+            self._stubs[qualified_feature_identifier] = stub_class(self.channel)
+
+    async def close(self):
+        await self.channel.close()
+
+    def _resolve_feature_id(self, feature_id: str) -> str:
+        """Returns the key of the feature, which may be qualified when the identifier is not and vice versa"""
+        if feature_id in self._stubs:
+            return feature_id
+        identifier = feature_id.split('/')[-2] if feature_id.count('/') == 3 else feature_id
+        for key in self._stubs.keys():
+            if feature_id in key or key == identifier:
+                return key
+        raise KeyError(feature_id)
+
+    async def call_command(self, feature_id: str, command_id: str, parameters: Dict[str, Any],
+                           timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        :param timeout: Seconds until the deadline of the call, which covers all calls of an observable command
+        """
+        feature_id = self._resolve_feature_id(feature_id)
+        stub = self._stubs[feature_id]
+        command_object = self.client._features[feature_id].commands[command_id]
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+        # set the parameters and build the message before the first await, the parameter object is shared
+        for parameter_path in parameters:
+            if parameters[parameter_path] == '':
+                break
+            command_object.parameters.set_value(
+                path=parameter_path, value=parameters[parameter_path])
+        message = command_object.parameters()
+
+        response = await getattr(stub, command_id)(message, timeout=remaining())
+
+        if command_object.observable:
+            command_uuid = silaFW_pb2.CommandExecutionUUID(value=response.commandExecutionUUID.value)
+            async for progress in getattr(stub, f'{command_id}_Info')(command_uuid, timeout=remaining()):
+                if progress.commandStatus not in (silaFW_pb2.ExecutionInfo.CommandStatus.waiting,
+                                                  silaFW_pb2.ExecutionInfo.CommandStatus.running):
+                    break
+            response = await getattr(stub, f'{command_id}_Result')(command_uuid, timeout=remaining())
+
+        return self._parse_response(command_object.responses, response)
+
+    async def call_property(self, feature_id: str, property_id: str,
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        :param timeout: Seconds until the deadline of the call
+        """
+        feature_id = self._resolve_feature_id(feature_id)
+        stub = self._stubs[feature_id]
+        _property = self.client._features[feature_id].properties[property_id]
+
+        if _property.observable:
+            call = getattr(stub, f'Subscribe_{property_id}')(_property.parameters(), timeout=timeout)
+            try:
+                async for response in call:
+                    return self._parse_response(_property.responses, response)
+            finally:
+                call.cancel()
+        else:
+            response = await getattr(stub, f'Get_{property_id}')(_property.parameters(), timeout=timeout)
+            return self._parse_response(_property.responses, response)
+
+    @staticmethod
+    def _parse_response(responses: DataBase, message) -> Dict[str, Any]:
+        obj = copy.copy(responses)
+        obj.parse_from_message(message=message)
+        return_value = {}
+        for path in responses.paths:
+            return_value[path] = obj.get_value(path=path)
+        return return_value
+
+
 # if __name__ == "__main__":
      # Add source to path to enable imports
      # import os
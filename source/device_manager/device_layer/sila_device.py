@@ -1,11 +1,24 @@
-from source.device_manager.device_layer.device_interface import DeviceInterface, DeviceType, DeviceError
-from typing import List, Dict, Any
-from source.device_manager.device_layer.dynamic_client import DynamicSiLA2Client
+from source.device_manager.device_layer.device_interface import DeviceInterface, AsyncDeviceInterface, DeviceType, \
+    DeviceError
+from typing import List, Dict, Any, Optional
+from source.device_manager.device_layer.dynamic_client import DynamicSiLA2Client, AsyncDynamicSiLA2Client
+from source.device_manager.device_layer.call_deadline import call_deadline
 from uuid import UUID
 from logging import error
 import sys
+import threading
 import traceback
-#import asyncio
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# DynamicSiLA2Client.run() imports the generated modules by manipulating sys.path and sys.modules, which must not
+# happen concurrently in the threads of one process
+_dynamic_client_lock = threading.Lock()
+#: Seconds the calls to the server may take while the features of an async device are loaded
+CONNECT_TIMEOUT = 30
+# Loads the features of async devices, one at a time because of the lock above; a server that hangs while its features
+# are loaded does not take threads of the default executor of the event loop
+_connect_executor = ThreadPoolExecutor(1, thread_name_prefix='sila-connect')
 
 
 def create_and_init_dynamic_client(name, ip, port):
@@ -22,6 +35,12 @@ def create_and_init_dynamic_client(name, ip, port):
     return client
 
 
+def _create_and_init_dynamic_client_locked(name, ip, port):
+    # The deadline frees the executor thread if the server hangs while its features are loaded
+    with _dynamic_client_lock, call_deadline(CONNECT_TIMEOUT):
+        return create_and_init_dynamic_client(name, ip, port)
+
+
 class SilaDevice(DeviceInterface):
     def __init__(self, ip: str, port: int, uuid: UUID, name: str):
         super().__init__(ip, port, uuid, name, DeviceType.SILA)
@@ -32,6 +51,11 @@ class SilaDevice(DeviceInterface):
         self.__client = create_and_init_dynamic_client(self.name, self.ip,
                                                        self.port)
 
+    def close(self):
+        if self.__client is not None:
+            self.__client.channel.close()
+        self.__client = None
+
     def getClient(self) -> DynamicSiLA2Client:
         return self.__client
 
@@ -73,9 +97,71 @@ class SilaDevice(DeviceInterface):
         client = self.getClient()
         return client.call_property(feature_id, property_id)
 
+    def subscribe_property(self, feature_id, property_id):
+        client = self.getClient()
+        return client.subscribe_property(feature_id, property_id)
+
     def interval_dict(self):
         interval = {}
         for feature in self.get_feature_names():
             for properties in self.get_properties(feature):
                 interval[properties] = self.defult_interval
         return interval
+
+
+class AsyncSilaDevice(AsyncDeviceInterface):
+    """SiLA device whose commands and properties are called over a grpc.aio channel
+
+    The feature definitions are loaded with a regular DynamicSiLA2Client in an executor, after that all calls are
+    executed on the event loop that called connect(). The generated modules come from the stub cache, so they are
+    imported once per process. Every call is sent with its timeout as gRPC deadline.
+    """
+    def __init__(self, ip: str, port: int, uuid: UUID, name: str):
+        super().__init__(ip, port, uuid, name, DeviceType.SILA)
+        self.__client = None
+        self.__async_client = None
+
+    async def connect(self):
+        loop = asyncio.get_event_loop()
+        client = await loop.run_in_executor(_connect_executor, _create_and_init_dynamic_client_locked,
+                                            self.name, self.ip, self.port)
+        if client is not None:
+            self.__async_client = AsyncDynamicSiLA2Client(client)
+        self.__client = client
+
+    async def close(self):
+        if self.__async_client is not None:
+            await self.__async_client.close()
+        if self.__client is not None:
+            self.__client.channel.close()
+        self.__async_client = None
+        self.__client = None
+
+    def getClient(self) -> DynamicSiLA2Client:
+        return self.__client
+
+    def get_status(self):
+        return ""
+
+    def is_online(self):
+        return self.__async_client is not None
+
+    async def ping(self, timeout: Optional[float] = None):
+        client = self._get_async_client()
+        feature = next(name for name in client.client.list_features() if 'SiLAService' in name)
+        await client.call_property(feature, 'ServerName', timeout)
+
+    def get_feature_names(self) -> List[str]:
+        return self.__client.list_features() if self.__client is not None else []
+
+    def _get_async_client(self) -> AsyncDynamicSiLA2Client:
+        if self.__async_client is None:
+            raise DeviceError(self.ip, self.port, self.uuid, self.name, self.type, 'Device is not connected')
+        return self.__async_client
+
+    async def call_command(self, feature_id: str, command_id: str,
+                           parameters: Dict[str, Any], timeout: Optional[float] = None):
+        return await self._get_async_client().call_command(feature_id, command_id, parameters, timeout)
+
+    async def call_property(self, feature_id, property_id, timeout: Optional[float] = None):
+        return await self._get_async_client().call_property(feature_id, property_id, timeout)
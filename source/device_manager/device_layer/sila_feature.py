@@ -115,6 +115,9 @@ def serialize_command_response(response):
         print('CSubTYpe:', response.sub_type.sub_type.name)
         print('CName:', response.name)
 
+    elif response.sub_type.is_list:
+        # The data handler stores list responses of numbers as arrays
+        sub_type = 'list/' + response.sub_type.sub_type.name
     else:
         sub_type = response.sub_type.name
         print('Identifier:', response.identifier)
@@ -138,6 +141,8 @@ def serialize_intermediate_command_response(intermediate_response):
         print('CSubTYpe:', intermediate_response.sub_type.sub_type)
         print('CName:', intermediate_response.name)
 
+    elif intermediate_response.sub_type.is_list:
+        sub_type = 'list/' + intermediate_response.sub_type.sub_type.name
     else:
         sub_type = intermediate_response.sub_type.name
         print('Type:', intermediate_response.sub_type.name)
@@ -161,6 +166,8 @@ def serialize_property_response(response):
         print('CSubTYpe:', response.sub_type.sub_type.name)
         print('CName:', response.name)
 
+    elif response.sub_type.is_list:
+        sub_type = 'list/' + response.sub_type.sub_type.name
     else:
         sub_type = response.sub_type.name
         print('Identifier:', response.identifier)
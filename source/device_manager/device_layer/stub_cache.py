@@ -0,0 +1,153 @@
+import hashlib
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from typing import Dict, Tuple
+
+import filelock
+import grpc
+
+from sila2lib.fdl_parser.fdl_parser import FDLParser
+from sila2lib.proto_builder.proto_builder import ProtoBuilder
+from sila2lib.proto_builder.proto_compiler import compile_proto_to_python
+from sila2lib.proto_builder.dynamic_feature import DynamicFeature
+from sila2lib.proto_builder._dynamic_command import _DynamicCommand
+from sila2lib.proto_builder._dynamic_property import _DynamicProperty
+
+from source.device_manager.data_directories import TEMP_DIRECTORY
+
+#: Directory in which the generated protobuf modules are stored, one subdirectory per FDL hash
+STUB_CACHE_DIRECTORY = os.path.join(TEMP_DIRECTORY, 'Sila', 'stubs')
+
+_cache_lock = threading.Lock()
+#: The feature definitions and modules that have already been loaded by this process, keyed by FDL hash
+_loaded_features: Dict[str, Tuple[FDLParser, object, object]] = {}
+
+
+def get_fdl_hash(fdl_content: bytes) -> str:
+    """
+    Get the key under which the modules generated for a feature definition are cached
+
+    :param fdl_content: The content of the FDL file
+    :type fdl_content: bytes
+    """
+    return hashlib.sha256(fdl_content).hexdigest()
+
+
+def _generate_modules(fdl_file: str, target_directory: str):
+    """Generates the proto file and the protobuf modules of a feature into an empty directory"""
+    fdl_parser = FDLParser(fdl_filename=fdl_file)
+    proto_builder = ProtoBuilder(fdl_parser=fdl_parser)
+    proto_file = proto_builder.write_proto(target_directory)
+    result = compile_proto_to_python(
+        proto_file=os.path.basename(proto_file),
+        source_dir=target_directory,
+        target_dir=target_directory
+    )
+    if not result:
+        raise RuntimeError(f'Could not compile proto file "{proto_file}"')
+
+
+def _get_cache_directory(fdl_file: str, fdl_hash: str) -> str:
+    """Returns the cache directory of the feature, the modules are generated if they are not cached yet"""
+    directory = os.path.join(STUB_CACHE_DIRECTORY, fdl_hash)
+    if os.path.exists(directory):
+        return directory
+    os.makedirs(STUB_CACHE_DIRECTORY, exist_ok=True)
+    with filelock.FileLock(f'{directory}.lock', timeout=60):
+        if not os.path.exists(directory):
+            # Generate into a temporary directory and rename it, so other processes never see partial modules
+            temporary_directory = tempfile.mkdtemp(dir=STUB_CACHE_DIRECTORY, prefix=f'.{fdl_hash}-')
+            try:
+                _generate_modules(fdl_file, temporary_directory)
+                os.rename(temporary_directory, directory)
+            except Exception:
+                shutil.rmtree(temporary_directory, ignore_errors=True)
+                raise
+    return directory
+
+
+def _load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _import_modules(directory: str, proto_name: str):
+    """Imports the _pb2 and _pb2_grpc module from the cache directory without adding it to sys.path"""
+    pb2_name = f'{proto_name}_pb2'
+    module_pb2 = _load_module(pb2_name, os.path.join(directory, f'{pb2_name}.py'))
+    # The grpc module imports the protobuf module by its plain name
+    previous_module = sys.modules.get(pb2_name)
+    sys.modules[pb2_name] = module_pb2
+    try:
+        module_pb2_grpc = _load_module(f'{pb2_name}_grpc', os.path.join(directory, f'{pb2_name}_grpc.py'))
+    finally:
+        if previous_module is None:
+            del sys.modules[pb2_name]
+        else:
+            sys.modules[pb2_name] = previous_module
+    return module_pb2, module_pb2_grpc
+
+
+def load_feature(fdl_file: str) -> Tuple[FDLParser, object, object]:
+    """
+    Get the parsed feature definition and the generated protobuf modules of a feature
+
+    Features with identical definitions share the modules, independent of the device they belong to. The modules are
+    only generated if no process has generated them before and only imported once per process.
+
+    :param fdl_file: Path to the FDL file of the feature
+    :type fdl_file: str
+    :return: The parsed feature definition, the _pb2 module and the _pb2_grpc module
+    """
+    with open(fdl_file, 'rb') as file:
+        fdl_hash = get_fdl_hash(file.read())
+    with _cache_lock:
+        if fdl_hash not in _loaded_features:
+            fdl_parser = FDLParser(fdl_filename=fdl_file)
+            directory = _get_cache_directory(fdl_file, fdl_hash)
+            proto_files = [file for file in os.listdir(directory) if file.endswith('.proto')]
+            if len(proto_files) != 1:
+                raise RuntimeError(f'Invalid stub cache directory {directory}')
+            proto_name = os.path.splitext(proto_files[0])[0]
+            _loaded_features[fdl_hash] = (fdl_parser,) + _import_modules(directory, proto_name)
+        return _loaded_features[fdl_hash]
+
+
+def clear_stub_cache():
+    """Deletes the generated modules from the disk, the modules loaded by running processes stay valid"""
+    with _cache_lock:
+        _loaded_features.clear()
+        if os.path.exists(STUB_CACHE_DIRECTORY):
+            shutil.rmtree(STUB_CACHE_DIRECTORY)
+
+
+class CachedDynamicFeature(DynamicFeature):
+    """ A DynamicFeature whose protobuf modules are taken from the stub cache instead of being generated """
+    def __init__(self, fdl_file: str, channel: grpc.Channel):
+        self.storage_path = os.path.dirname(fdl_file)
+
+        fdl_parser, self._module_pb2, self._module_pb2_grpc = load_feature(fdl_file)
+        self.feature_id = fdl_parser.identifier
+
+        # load access to all defined commands and properties
+        feature_stub_class = getattr(self._module_pb2_grpc, f'{self.feature_id}Stub')
+        feature_stub = feature_stub_class(channel)
+        self.commands = {}
+        for command_id in fdl_parser.commands:
+            self.commands[command_id] = _DynamicCommand(command=fdl_parser.commands[command_id],
+                                                        fdl_parser=fdl_parser,
+                                                        feature_stub=feature_stub,
+                                                        feature_pb2=self._module_pb2)
+
+        self.properties = {}
+        for property_id in fdl_parser.properties:
+            self.properties[property_id] = _DynamicProperty(property_element=fdl_parser.properties[property_id],
+                                                            fdl_parser=fdl_parser,
+                                                            feature_stub=feature_stub,
+                                                            feature_pb2=self._module_pb2)
@@ -1,16 +1,24 @@
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional
 from uuid import UUID, uuid4
 from datetime import datetime
 import requests
 import timeit
 import os
+import itertools
+import threading
+import asyncio
+import time
+import grpc
 
 from source.device_manager.device_layer.database_info import DatabaseInfo, DatabaseStatus
 from source.device_manager.sila_auto_discovery.sila_auto_discovery import find
 from source.device_manager.device_layer.device_info import DeviceInfo, DeviceStatus
-from source.device_manager.device_layer.device_interface import DeviceInterface, DeviceType, DeviceError
-from source.device_manager.device_layer.dummy_device import DummyDevice
-from source.device_manager.device_layer.sila_device import SilaDevice
+from source.device_manager.device_layer.device_interface import DeviceInterface, AsyncDeviceInterface, DeviceType, \
+    DeviceError
+from source.device_manager.device_layer.dummy_device import DummyDevice, AsyncDummyDevice
+from source.device_manager.device_layer.sila_device import SilaDevice, AsyncSilaDevice
+from source.device_manager.device_layer.device_worker_pool import DeviceWorkerPool
+from source.device_manager.device_layer.device_call import DeviceCall, DeviceCallResult, DeviceCallType
 
 from source.device_manager.device_layer.device_feature import Feature, FeatureForDataHandler, \
     CommandForDataHandler, CommandResponseForDataHandler, IntermediateCommandResponseForDataHandler, \
@@ -18,16 +26,28 @@ from source.device_manager.device_layer.device_feature import Feature, FeatureFo
 
 from source.device_manager.device_layer.sila_feature import serialize_feature
 from source.device_manager.device_log import DeviceManagerLogHandler, LogLevel
-from source.device_manager.database import get_database_connection, release_database_connection
+from source.device_manager.database import get_database_connection, release_database_connection, get_redis_connection
+from source.device_manager.global_storage import get_global_storage
+from source.device_manager.device_status import get_cached_device_status
 from source.device_manager.scheduler import BookingInfo, get_booking_entry, get_device_booking_info, get_booking_info, book, id_is_valid, delete_booking_entry
 from source.device_manager.scheduler import BookingInfoWithNames, get_device_booking_info_with_names, get_booking_info_with_names
 from source.device_manager.device_layer.dynamic_client import delete_dynamic_client
 import source.device_manager.device
+import source.device_manager.device_group as device_group
+import source.device_manager.array_store as array_store
+import source.device_manager.container_stats as container_stats
+import source.device_manager.ingestion as ingestion
+import source.device_manager.last_value_cache as last_value_cache
+import source.device_manager.polling as polling
+import source.device_manager.recording_filter as recording_filter
+import source.device_manager.time_series_sink as time_series_sink
 import source.device_manager.experiment as experiment
+import source.device_manager.experiment_data as experiment_data
 import source.device_manager.script as script
 
 from sila2lib.fdl_parser.fdl_parser import FDLParser
 from dataclasses import asdict
+import msgpack
 from influxdb import InfluxDBClient, exceptions
 from multiprocessing import Process, Pipe
 from multiprocessing import pool as mpp
@@ -41,43 +61,29 @@ INTERVAL = 30
 META_INTERVAL = 3600
 ACTIVE = True
 META = False
+RECORDING_MODE = recording_filter.RECORD_ALWAYS
+DEADBAND = 0
+MAX_SILENCE = 0
+#: Default number of seconds an asynchronous device call may take
+ASYNC_CALL_TIMEOUT = 120
+#: Default number of seconds a status probe of a device may take
+PROBE_TIMEOUT = 10
 
 
-def _call_feature_command_from_subprocess(info: DeviceInfo, qualified_feature_identifier: str,
-                                          command_id: str, parameters: Dict[str,
-                                                                         any],
-                                          connection):
+def _call_feature_command_in_worker(device: DeviceInterface, qualified_feature_identifier: str,
+                                    command_id: str, parameters: Dict[str, any]):
     try:
-        device = _create_device_instance(info.address, info.port, info.uuid,
-                                         info.name, info.type)
-        device.connect()
-        # print(qualified_feature_identifier)
-        # print(parameters)
-        try:
-            result = device.call_command(qualified_feature_identifier, command_id, parameters)
-        except:
-            print('+++++++++++++++++++++++++++++++++++++++++++++++++', qualified_feature_identifier.split('/')[-2])
-            result = device.call_command(qualified_feature_identifier.split('/')[-2], command_id, parameters)
+        return device.call_command(qualified_feature_identifier, command_id, parameters)
+    except:
+        return device.call_command(qualified_feature_identifier.split('/')[-2], command_id, parameters)
 
-        connection.send(result)
-    finally:
-        connection.close()
 
-
-def _get_feature_property_from_subprocess(info: DeviceInfo, qualified_feature_identifier: str,
-                                          property_id: str, connection):
+def _get_feature_property_in_worker(device: DeviceInterface, qualified_feature_identifier: str,
+                                    property_id: str):
     try:
-        device = _create_device_instance(info.address, info.port, info.uuid,
-                                         info.name, info.type)
-        device.connect()
-        # result = device.call_property(feature+'\n', prop)
-        try:
-            result = device.call_property(qualified_feature_identifier, property_id)
-        except:
-            result = device.call_property(qualified_feature_identifier.split('/')[-2], property_id)
-        connection.send(result)
-    finally:
-        connection.close()
+        return device.call_property(qualified_feature_identifier, property_id)
+    except:
+        return device.call_property(qualified_feature_identifier.split('/')[-2], property_id)
 
 
 def _create_device_instance(ip: str, port: int, uuid: UUID, name: str, type: DeviceType):
@@ -87,55 +93,213 @@ def _create_device_instance(ip: str, port: int, uuid: UUID, name: str, type: Dev
         return DummyDevice(ip, port, uuid, name, type)
 
 
-def _get_device_instance_from_subprocess(info: DeviceInfo, connection):
-    """Get a device instance for the device specified by the provided details
-    """
-    try:
-        device = _create_device_instance(info.address, info.port, info.uuid, info.name, info.type)
-        connection.send(device)
-    finally:
-        connection.close()
+def create_device_instance_from_info(info: DeviceInfo) -> DeviceInterface:
+    """Returns a not yet connected device instance for the device info"""
+    return _create_device_instance(info.address, info.port, info.uuid, info.name, info.type)
 
 
-def _get_device_status_from_subprocess(info: DeviceInfo, connection):
+def _get_device_status_in_worker(device: DeviceInterface):
     """Get the current status of the specified device
     """
+    if device.is_online() and device.type == DeviceType.SILA:
+        # The client stays connected after the device went down, so the device has to answer a cheap call
+        for feature in (name for name in device.get_feature_names() if 'SiLAService' in name):
+            try:
+                device.call_property(feature, 'ServerName')
+            except grpc.RpcError:
+                # Closed, so the worker connects again with the next request
+                device.close()
+            break
+    return DeviceStatus(device.is_online(), device.get_status())
+
+
+def _get_device_features_in_worker(device: DeviceInterface):
+    """Get the description of supported features of the specified device
+    """
+    features = []
+    if device.is_online() and device.type == DeviceType.SILA:
+        for name in device.get_feature_names():
+            if '/' in name:
+                originator, category, feature_identifier, major_feature_version = name.split('/')
+                fdl_filename = os.path.join(originator.strip(),
+                                            category.strip(),
+                                            feature_identifier.strip(),
+                                            major_feature_version.strip(),
+                                            f'{feature_identifier.strip()}')
+                feature_file = device.get_feature_path(fdl_filename)
+            else:
+                feature_file = device.get_feature_path(name)
+            parser = FDLParser(feature_file)
+            features.append(serialize_feature(parser))
+    return features
+
+
+# The requests that can be dispatched to the device worker processes
+_DEVICE_WORKER_HANDLERS = {
+    'get_status': _get_device_status_in_worker,
+    'get_features': _get_device_features_in_worker,
+    'call_command': _call_feature_command_in_worker,
+    'get_property': _get_feature_property_in_worker,
+}
+
+_device_worker_pool_lock = threading.Lock()
+
+
+def get_device_worker_pool() -> DeviceWorkerPool:
+    """Returns the device worker pool of this process"""
+    storage = get_global_storage()
+    with _device_worker_pool_lock:
+        if storage.get('device_worker_pool') is None:
+            storage['device_worker_pool'] = DeviceWorkerPool(create_device_instance_from_info,
+                                                             _DEVICE_WORKER_HANDLERS)
+    return storage['device_worker_pool']
+
+
+def _create_async_device_instance(info: DeviceInfo) -> AsyncDeviceInterface:
+    if info.type == DeviceType.SILA:
+        return AsyncSilaDevice(info.address, info.port, info.uuid, info.name)
+    else:
+        return AsyncDummyDevice(info.address, info.port, info.uuid, info.name, info.type)
+
+
+async def _connect_async_device(info: DeviceInfo) -> AsyncDeviceInterface:
+    device = _create_async_device_instance(info)
+    await device.connect()
+    return device
+
+
+def _close_async_device_entry(entry):
+    """Closes the device of a registry entry on the event loop it belongs to"""
+    _, loop, task = entry
+
+    def close(done_task):
+        if not done_task.cancelled() and done_task.exception() is None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(done_task.result().close(), loop)
+
+    if loop.is_closed():
+        return
+    loop.call_soon_threadsafe(task.add_done_callback, close)
+
+
+_async_device_lock = threading.Lock()
+
+
+async def get_async_device(info: DeviceInfo) -> AsyncDeviceInterface:
+    """Returns the connected async device instance of the specified device
+
+    One instance per device is kept for the event loop of the caller and shared by all concurrent calls. The device
+    is connected on first use and again after its connection details have been changed.
+    """
+    loop = asyncio.get_event_loop()
+    key = str(info.uuid)
+    details = (info.address, info.port, info.type, info.name)
+    stale = None
+    with _async_device_lock:
+        devices = get_global_storage().setdefault('async_devices', {})
+        entry = devices.get(key)
+        if entry is not None and (entry[0] != details or entry[1] is not loop):
+            stale = entry
+            entry = None
+        if entry is None:
+            entry = (details, loop, loop.create_task(_connect_async_device(info)))
+            devices[key] = entry
+    if stale is not None:
+        _close_async_device_entry(stale)
     try:
-        device = _create_device_instance(info.address, info.port, info.uuid,
-                                         info.name, info.type)
-        device.connect()
-        connection.send(DeviceStatus(device.is_online(), device.get_status()))
-    finally:
-        connection.close()
+        # Shielded, so a caller that times out does not cancel the connection attempt of the others
+        device = await asyncio.shield(entry[2])
+    except Exception:
+        _invalidate_async_device_entry(key, entry)
+        raise
+    if not device.is_online():
+        # Try again with the next call
+        _invalidate_async_device_entry(key, entry)
+    return device
+
+
+def _invalidate_async_device_entry(key: str, entry):
+    with _async_device_lock:
+        devices = get_global_storage().setdefault('async_devices', {})
+        if devices.get(key) is not entry:
+            return
+        del devices[key]
+    _close_async_device_entry(entry)
 
 
-def _get_device_features_from_subprocess(info: DeviceInfo, connection):
-    """Get the description of supported features of the specified device
+def invalidate_async_device(uuid: UUID):
+    """Closes the async device instance of the specified device, e.g. after it has been edited or deleted"""
+    with _async_device_lock:
+        entry = get_global_storage().setdefault('async_devices', {}).pop(str(uuid), None)
+    if entry is not None:
+        _close_async_device_entry(entry)
+
+
+def _is_connection_error(e: Exception) -> bool:
+    """Whether the channel to the device is broken, as opposed to an error of the call itself"""
+    if isinstance(e, grpc.RpcError):
+        return callable(getattr(e, 'code', None)) and e.code() == grpc.StatusCode.UNAVAILABLE
+    return isinstance(e, DeviceError)
+
+
+async def _call_async_device(info: DeviceInfo, call, deadline: Optional[float] = None):
+    """Executes call(device, timeout) with the async device instance and drops the instance if its channel is broken
+
+    The timeout passed to the call is the time left until the deadline, a loop time, once the device is connected;
+    None without a deadline.
     """
+    device = await get_async_device(info)
+    timeout = None if deadline is None else max(deadline - asyncio.get_event_loop().time(), 0)
     try:
-        device = _create_device_instance(info.address, info.port, info.uuid,
-                                         info.name, info.type)
-        device.connect()
-        features = []
-        if device.is_online() and device.type == DeviceType.SILA:
-            for name in device.get_feature_names():
-                if '/' in name:
-                    originator, category, feature_identifier, major_feature_version = name.split('/')
-                    fdl_filename = os.path.join(originator.strip(),
-                                                category.strip(),
-                                                feature_identifier.strip(),
-                                                major_feature_version.strip(),
-                                                f'{feature_identifier.strip()}')
-                    feature_file = device.get_feature_path(fdl_filename)
-                else:
-                    feature_file = device.get_feature_path(name)
-                parser = FDLParser(feature_file)
-                feature = serialize_feature(parser)
-                print(feature)
-                features.append(serialize_feature(parser))
-        connection.send(features)
-    finally:
-        connection.close()
+        return await call(device, timeout)
+    except Exception as e:
+        if _is_connection_error(e):
+            invalidate_async_device(info.uuid)
+        raise
+
+
+async def _call_feature_command_async(info: DeviceInfo, qualified_feature_identifier: str, command_id: str,
+                                      parameters: Dict[str, any], deadline: Optional[float] = None):
+    return await _call_async_device(
+        info, lambda device, timeout: device.call_command(qualified_feature_identifier, command_id, parameters,
+                                                          timeout), deadline)
+
+
+async def _get_feature_property_async(info: DeviceInfo, qualified_feature_identifier: str, property_id: str,
+                                      deadline: Optional[float] = None):
+    return await _call_async_device(
+        info, lambda device, timeout: device.call_property(qualified_feature_identifier, property_id, timeout),
+        deadline)
+
+
+async def _execute_device_call(info: DeviceInfo, call: DeviceCall, timeout: float) -> DeviceCallResult:
+    """Executes a command or property call and returns its response or error instead of raising"""
+    deadline = asyncio.get_event_loop().time() + timeout
+    try:
+        if call.type == DeviceCallType.COMMAND:
+            execution = _call_feature_command_async(info, call.feature, call.identifier, call.params or {}, deadline)
+        else:
+            execution = _get_feature_property_async(info, call.feature, call.identifier, deadline)
+        return DeviceCallResult(await asyncio.wait_for(execution, timeout))
+    except asyncio.TimeoutError:
+        return DeviceCallResult(error='Timeout')
+    except Exception as e:
+        return DeviceCallResult(error=f'{type(e).__name__}: {e}')
+
+
+def _check_timeout(timeout: float):
+    if timeout <= 0:
+        raise ValueError(f'The timeout must be positive, got {timeout}')
+
+
+def _publish_scheduler_command(command: str, params: list):
+    """Sends a command to the scheduler process, which also runs the data handler"""
+    try:
+        get_redis_connection().publish('scheduler', msgpack.packb({
+            'command': command,
+            'params': params
+        }))
+    except Exception as e:
+        logging.warning(f'Could not send {command} to the scheduler: {e}')
 
 
 def _get_database_status_from_subprocess(info: DatabaseInfo, connection):
@@ -195,6 +359,9 @@ class DeviceManager:
             device: The device that should replace the one in the database
         """
         source.device_manager.device.set_device(device)
+        get_device_worker_pool().shutdown_device(device.uuid)
+        invalidate_async_device(device.uuid)
+        _publish_scheduler_command('invalidate_device', [str(device.uuid)])
 
     def add_device(self, server_uuid: UUID, name: str, type: DeviceType, address: str, port: int):
         """Add a new device to the database
@@ -211,8 +378,13 @@ class DeviceManager:
             uuid (uuid.UUID): The unique id of the device
         """
         dev_info = self.get_device_info(uuid)
+        get_device_worker_pool().shutdown_device(uuid)
+        invalidate_async_device(uuid)
         source.device_manager.device.delete_device(dev_info.uuid, dev_info.server_uuid)
+        device_group.remove_device_from_groups(uuid)
         self.delete_features(uuid)
+        get_redis_connection().delete(last_value_cache.get_latest_values_key(uuid))
+        _publish_scheduler_command('invalidate_device', [str(uuid)])
 
     def get_status(self, uuid: UUID) -> DeviceStatus:
         """Get the current status of the specified device
@@ -220,36 +392,14 @@ class DeviceManager:
             uuid (uuid.UUID): The unique id of the device
         """
         device_info = self.get_device_info(uuid)
-        parent_conn, child_conn = Pipe()
-        process = Process(target=_get_device_status_from_subprocess,
-                          args=(device_info, child_conn),daemon=True)
-        device_status = None
-        try:
-            process.start()
-            device_status = parent_conn.recv()
-            process.join()
-        finally:
-            process.close()
-            print('get_status process finished')
-        return device_status
+        return get_device_worker_pool().dispatch(device_info, 'get_status')
 
     def get_device_instance(self, uuid: UUID):
         """Get a device instance for the specified device
         Args:
         uuid (uuid.UUID): The unique id of the device
         """
-        device_info = self.get_device_info(uuid)
-        parent_conn, child_conn = Pipe()
-        process = Process(target=_get_device_instance_from_subprocess,
-                          args=(device_info, child_conn),
-                          daemon=True)
-        try:
-            process.start()
-            sila_device = parent_conn.recv()
-            process.join()
-        finally:
-            process.close()
-        return sila_device
+        return create_device_instance_from_info(self.get_device_info(uuid))
 
     def get_features(self, uuid: UUID) -> List[Feature]:
         """Get the description of supported features of the specified device
@@ -257,50 +407,199 @@ class DeviceManager:
             uuid (uuid.UUID): The unique id of the device
         """
         device_info = self.get_device_info(uuid)
-        parent_conn, child_conn = Pipe()
-        process = Process(target=_get_device_features_from_subprocess,
-                          args=(device_info, child_conn),daemon=True)
-        features = None
-        try:
-            process.start()
-            features = parent_conn.recv()
-            process.join()
-        finally:
-            process.close()
-            print('get_features process finished')
-        return features
+        return get_device_worker_pool().dispatch(device_info, 'get_features')
 
     def call_feature_command(self, device: UUID, feature: str, command: str,
                              params: Dict[str, any]):
         device_info = self.get_device_info(device)
-        parent_conn, child_conn = Pipe()
-        process = Process(target=_call_feature_command_from_subprocess,
-                          args=(device_info, feature, command, params,
-                                child_conn),daemon=True)
-        result = None
-        try:
-            process.start()
-            result = parent_conn.recv()
-            process.join()
-        finally:
-            process.close()
-            print('call_feature_command process finished')
-        return result
+        return get_device_worker_pool().dispatch(device_info, 'call_command', feature, command, params)
 
     def get_feature_property(self, device: UUID, qualified_feature_identifier: str, prop: str):
         device_info = self.get_device_info(device)
-        parent_conn, child_conn = Pipe()
-        process = Process(target=_get_feature_property_from_subprocess,
-                          args=(device_info, qualified_feature_identifier, prop, child_conn),daemon=True)
-        result = None
+        return get_device_worker_pool().dispatch(device_info, 'get_property', qualified_feature_identifier, prop)
+
+    async def get_status_async(self, uuid: UUID) -> DeviceStatus:
+        """Get the status of the specified device stored by the device status monitor. The device is only probed if
+        there is no stored status.
+        Args:
+            uuid (uuid.UUID): The unique id of the device
+        """
+        status = await get_cached_device_status(uuid)
+        if status is not None:
+            return status
+        loop = asyncio.get_event_loop()
+        device_info = await loop.run_in_executor(None, self.get_device_info, uuid)
+        return await self.probe_device_async(device_info)
+
+    async def get_latest_values_async(self, uuid: UUID) -> List[dict]:
+        """Get the last recorded value, its time and the call latency of every command and property the data handler
+        records for the specified device. The values are read from the last value cache, the device is not called.
+        Args:
+            uuid (uuid.UUID): The unique id of the device
+        """
+        return await last_value_cache.get_latest_values(uuid)
+
+    async def probe_device_async(self, device_info: DeviceInfo, timeout: float = PROBE_TIMEOUT) -> DeviceStatus:
+        """Connect to the device if necessary and measure the round trip time of a cheap call
+        Args:
+            device_info: The device to probe
+            timeout: Seconds after which the device is considered offline
+        """
+        # The ping is sent with the time left as gRPC deadline, so a device that hangs frees the call on both sides.
+        # A connection attempt that outlasts the probe is shared with the next probe instead of being started again.
+        deadline = asyncio.get_event_loop().time() + timeout
+
+        async def probe():
+            device = await get_async_device(device_info)
+            if not device.is_online():
+                return DeviceStatus(False, device.get_status())
+            start = time.perf_counter()
+            await _call_async_device(device_info, lambda instance, remaining: instance.ping(remaining), deadline)
+            return DeviceStatus(True, device.get_status(), time.perf_counter() - start)
+
         try:
-            process.start()
-            result = parent_conn.recv()
-            process.join()
-        finally:
-            process.close()
-            print('get_feature_property process finished')
-        return result
+            return await asyncio.wait_for(probe(), timeout)
+        except asyncio.TimeoutError:
+            return DeviceStatus(False, 'Timeout')
+        except Exception as e:
+            return DeviceStatus(False, type(e).__name__)
+
+    async def get_features_async(self, uuid: UUID) -> List[Feature]:
+        """Get the description of supported features of the specified device without blocking the event loop
+        Args:
+            uuid (uuid.UUID): The unique id of the device
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.get_features, uuid)
+
+    async def call_feature_command_async(self, device: UUID, feature: str, command: str,
+                                         params: Dict[str, any], timeout: float = ASYNC_CALL_TIMEOUT):
+        """Call a command of the specified device over its asynchronous channel
+        Args:
+            device (uuid.UUID): The unique id of the device
+            feature: The (qualified) feature identifier
+            command: The command identifier
+            params: The parameters of the command
+            timeout: Seconds after which the call is cancelled with an asyncio.TimeoutError, also sent to the device
+                as gRPC deadline
+        """
+        _check_timeout(timeout)
+        loop = asyncio.get_event_loop()
+        device_info = await loop.run_in_executor(None, self.get_device_info, device)
+        deadline = loop.time() + timeout
+        return await asyncio.wait_for(_call_feature_command_async(device_info, feature, command, params, deadline),
+                                      timeout)
+
+    async def get_feature_property_async(self, device: UUID, qualified_feature_identifier: str, prop: str,
+                                         timeout: float = ASYNC_CALL_TIMEOUT):
+        """Request a property of the specified device over its asynchronous channel
+        Args:
+            device (uuid.UUID): The unique id of the device
+            qualified_feature_identifier: The (qualified) feature identifier
+            prop: The property identifier
+            timeout: Seconds after which the call is cancelled with an asyncio.TimeoutError, also sent to the device
+                as gRPC deadline
+        """
+        _check_timeout(timeout)
+        loop = asyncio.get_event_loop()
+        device_info = await loop.run_in_executor(None, self.get_device_info, device)
+        deadline = loop.time() + timeout
+        return await asyncio.wait_for(_get_feature_property_async(device_info, qualified_feature_identifier, prop,
+                                                                  deadline), timeout)
+
+    async def call_batch_async(self, device: UUID, calls: List[DeviceCall],
+                               timeout: float = ASYNC_CALL_TIMEOUT) -> List[DeviceCallResult]:
+        """Execute several commands and property reads on the specified device over one connection
+
+        Commands are executed one after the other in the given order. The property reads between two commands are in
+        flight at the same time on the grpc.aio channel of the device; whether the device serves them in parallel is
+        up to its server. Every call is sent with the time left until the batch timeout as gRPC deadline, so calls
+        that have not finished when the timeout expires are cancelled on the device as well.
+        Args:
+            device (uuid.UUID): The unique id of the device
+            calls: The commands and properties to call
+            timeout: Seconds after which all unfinished calls are cancelled
+        Returns:
+            The result or the error of every call, in the order of the calls
+        """
+        _check_timeout(timeout)
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        device_info = await loop.run_in_executor(None, self.get_device_info, device)
+        results = [None] * len(calls)
+
+        async def execute(index: int):
+            results[index] = await _execute_device_call(device_info, calls[index], deadline - loop.time())
+
+        reads = []
+        for index, call in enumerate(calls):
+            if call.type == DeviceCallType.PROPERTY:
+                reads.append(execute(index))
+            else:
+                await asyncio.gather(*reads)
+                reads = []
+                await execute(index)
+        await asyncio.gather(*reads)
+        return results
+
+    def get_device_group_list(self) -> List[device_group.DeviceGroup]:
+        """Returns all device groups"""
+        return device_group.get_device_group_list()
+
+    def get_device_group(self, id: int) -> Optional[device_group.DeviceGroup]:
+        """Returns the specified device group, None if it does not exist
+        Args:
+            id: The id of the device group
+        """
+        return device_group.get_device_group(id)
+
+    def add_device_group(self, name: str, devices: List[UUID]) -> int:
+        """Add a new device group to the database
+        Args:
+            name: The name of the group
+            devices: The uuids of the member devices
+        """
+        return device_group.add_device_group(name, devices)
+
+    def set_device_group(self, id: int, name: str, devices: List[UUID]) -> bool:
+        """Updates a device group in the database
+        Args:
+            id: The id of the device group
+            name: The name of the group
+            devices: The uuids of the member devices
+        Returns:
+            False if the device group does not exist
+        """
+        return device_group.set_device_group(id, name, devices)
+
+    def delete_device_group(self, id: int):
+        """Delete a device group from the database
+        Args:
+            id: The id of the device group
+        """
+        device_group.delete_device_group(id)
+
+    async def broadcast_async(self, group_id: int, call: DeviceCall,
+                              timeout: float = ASYNC_CALL_TIMEOUT) -> Optional[Dict[str, DeviceCallResult]]:
+        """Execute the same command or property read on all devices of a group in parallel
+        Args:
+            group_id: The id of the device group
+            call: The command or property to call on every device
+            timeout: Seconds after which the calls of all devices that have not answered are cancelled
+        Returns:
+            The result or the error of the call, keyed by device uuid; None if the device group does not exist
+        """
+        _check_timeout(timeout)
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        devices = await loop.run_in_executor(None, device_group.get_device_group_member_info, group_id)
+        if devices is None:
+            return None
+
+        results = await asyncio.gather(*[
+            _execute_device_call(device_info, call, deadline - loop.time()) for device_info in devices
+        ])
+        return {str(device_info.uuid): result for device_info, result in zip(devices, results)}
 
     def add_features_for_data_handler(self, uuid: UUID):
         """Add the features of the device (specified by uuid) to the database
@@ -342,10 +641,10 @@ class DeviceManager:
                         dynamic_command = dynamic_feature.commands[
                             command.identifier]
                         cursor.execute(
-                            'insert into commands_for_data_handler values (default,%s,%s,%s,%s,%s,%s,%s,%s,%s)' \
+                            'insert into commands_for_data_handler values (default,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)' \
                             'returning id',
                             [command.identifier, command.display_name, command.description, command.observable, INTERVAL,
-                             META_INTERVAL, ACTIVE, META, feature_id])
+                             META_INTERVAL, ACTIVE, META, feature_id, RECORDING_MODE, DEADBAND, MAX_SILENCE])
                         command_id = cursor.fetchone()[0]
                         for parameter in command.parameters:
                             if parameter.data_type != 'Void':
@@ -395,10 +694,10 @@ class DeviceManager:
                         dynamic_property = dynamic_feature.properties[
                             property.identifier]
                         cursor.execute(
-                            'insert into properties_for_data_handler values (default,%s,%s,%s,%s,%s,%s,%s,%s,%s)' \
+                            'insert into properties_for_data_handler values (default,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)' \
                             'returning id',
                             [property.identifier, property.display_name, property.description, property.observable, INTERVAL,
-                             META_INTERVAL, ACTIVE, META, feature_id])
+                             META_INTERVAL, ACTIVE, META, feature_id, RECORDING_MODE, DEADBAND, MAX_SILENCE])
                         property_id = cursor.fetchone()[0]
                         response = property.response
                         data_responses = dynamic_property.responses
@@ -581,7 +880,7 @@ class DeviceManager:
         with conn:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    'select identifier,display_name,description,observable,id,polling_interval_non_meta,polling_interval_meta,activated,meta from commands_for_data_handler where feature=%s',
+                    'select identifier,display_name,description,observable,id,polling_interval_non_meta,polling_interval_meta,activated,meta,recording_mode,deadband,max_silence from commands_for_data_handler where feature=%s',
                     [str(feature_id)])
                 result = cursor.fetchall()
                 commands = [
@@ -597,7 +896,10 @@ class DeviceManager:
                                           polling_interval_non_meta=row[5],
                                           polling_interval_meta=row[6],
                                           active=row[7],
-                                          meta=row[8]) for row in result
+                                          meta=row[8],
+                                          recording_mode=row[9],
+                                          deadband=row[10],
+                                          max_silence=row[11]) for row in result
                 ]
         release_database_connection(conn)
         for command in commands:
@@ -721,7 +1023,7 @@ class DeviceManager:
         with conn:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    'select id,identifier,display_name,description,observable,polling_interval_non_meta,polling_interval_meta,activated,meta from properties_for_data_handler where feature=%s',
+                    'select id,identifier,display_name,description,observable,polling_interval_non_meta,polling_interval_meta,activated,meta,recording_mode,deadband,max_silence from properties_for_data_handler where feature=%s',
                     [str(feature_id)])
                 result = cursor.fetchall()
                 properties = [
@@ -735,7 +1037,10 @@ class DeviceManager:
                                            polling_interval_non_meta=row[5],
                                            polling_interval_meta=row[6],
                                            active=row[7],
-                                           meta=row[8]) for row in result
+                                           meta=row[8],
+                                           recording_mode=row[9],
+                                           deadband=row[10],
+                                           max_silence=row[11]) for row in result
 
                 ]
                 for property in properties:
@@ -796,11 +1101,11 @@ class DeviceManager:
         with conn:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    'select id,name,address,port, username, password from databases'
+                    'select id,name,address,port, username, password, sinks from databases'
                 )
                 result = cursor.fetchall()
                 info_list=[
-                    DatabaseInfo(row[0], row[1], row[2], row[3], row[4], row[5]) for row in result
+                    DatabaseInfo(row[0], row[1], row[2], row[3], row[4], row[5], row[6]) for row in result
                 ]
         release_database_connection(conn)
         return info_list
@@ -817,11 +1122,12 @@ class DeviceManager:
         with conn:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    'select id,name,address,port, username, password from databases ' \
+                    'select id,name,address,port, username, password, sinks from databases ' \
                     'where id=%s',
                     [str(id)])
                 database = cursor.fetchone()
-                info = DatabaseInfo(database[0], database[1], database[2], database[3], database[4], database[5])
+                info = DatabaseInfo(database[0], database[1], database[2], database[3], database[4], database[5],
+                                    database[6])
         release_database_connection(conn)
         return info
 
@@ -846,7 +1152,8 @@ class DeviceManager:
             print('get_status process finished')
         return database_status
 
-    def add_database(self, name: str, address: str, port: int, username: str, password: str):
+    def add_database(self, name: str, address: str, port: int, username: str, password: str,
+                     sinks: str = time_series_sink.INFLUX_SINK):
         """Add a new database to the database
         Args:
             name: The name of the new database that should be added to the database
@@ -854,16 +1161,18 @@ class DeviceManager:
             port: The port of the new database that should be added to the database
             username: The username that is needed as login credential for the new database
             password: The password for the new database login
+            sinks: The comma separated names of the sinks the data handler writes into
         """
         conn = get_database_connection()
         with conn:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    'insert into databases values (default,%s,%s,%s,%s,%s)',
-                    [name, address, port, username, password])
+                    'insert into databases values (default,%s,%s,%s,%s,%s,%s)',
+                    [name, address, port, username, password, sinks])
         release_database_connection(conn)
 
-    def set_database(self, id: int, name: str, address: str, port: int, username: str, password: str):
+    def set_database(self, id: int, name: str, address: str, port: int, username: str, password: str,
+                     sinks: str = time_series_sink.INFLUX_SINK):
         """Updates a database in the database
         Args:
             id: The id of the database to update
@@ -872,17 +1181,19 @@ class DeviceManager:
             port: The new port to set to the database
             username: The username to set to the new database
             password: The password to set to the new database
+            sinks: The comma separated names of the sinks the data handler writes into
         """
         conn = get_database_connection()
         with conn:
             with conn.cursor() as cursor:
                 cursor.execute(
-                    'update databases set name=%s, address=%s, port=%s, username=%s, password=%s ' \
+                    'update databases set name=%s, address=%s, port=%s, username=%s, password=%s, sinks=%s ' \
                     'where id=%s',
                     [
-                        name, address, port, username, password, id
+                        name, address, port, username, password, sinks, id
                     ])
         release_database_connection(conn)
+        _publish_scheduler_command('invalidate_database', [id])
 
     def delete_database(self, id: int):
         """Delete a database from the database
@@ -898,7 +1209,20 @@ class DeviceManager:
                 cursor.execute('update devices set databaseID = %s where databaseID=%s',
                                [None, id])
         release_database_connection(conn)
+        _publish_scheduler_command('invalidate_database', [id])
+
+
+    def get_ingestion_stats(self) -> List[dict]:
+        """Returns the throughput, latency and queue statistics of the data handler per database"""
+        return ingestion.get_published_stats()
+
+    def get_polling_stats(self) -> List[dict]:
+        """Returns the achieved sampling period, latency and sample counters of the data handler per polled item"""
+        return polling.get_published_stats()
 
+    def get_container_start_stats(self) -> dict:
+        """Returns the histogram of the start latencies of the experiment containers, from the warm pool and cold"""
+        return container_stats.get_published_stats()
 
     def link_database(self, device_uuid: UUID, database_id: int):
         """Link a device to a database
@@ -913,6 +1237,7 @@ class DeviceManager:
                     'update devices set databaseID = %s where uuid = %s',
                     [database_id, device_uuid])
         release_database_connection(conn)
+        _publish_scheduler_command('invalidate_device', [str(device_uuid)])
 
     def unlink_database(self, device_uuid: UUID):
         """Removes the database link of the specified device
@@ -926,6 +1251,7 @@ class DeviceManager:
                     'update devices set databaseID = %s where uuid = %s',
                     [None, device_uuid])
         release_database_connection(conn)
+        _publish_scheduler_command('invalidate_device', [str(device_uuid)])
 
     def set_device_attributes_for_data_handler(self, device_uuid: UUID, active: bool):
         """Set the 'active' attribute of the specified device and its features, commands and properties
@@ -1000,7 +1326,8 @@ class DeviceManager:
 
     def set_command_attributes_for_data_handler(self, device_uuid: UUID, feature_id: str, command_id: str, active: bool,
                                                 meta: bool, polling_interval_non_meta: int, polling_interval_meta: int,
-                                                parameters):
+                                                parameters, recording_mode: str = None, deadband: float = None,
+                                                max_silence: int = None):
         """Set the attributes of the specified command to the specified values
         Args:
             device_uuid: The uuid of the device
@@ -1011,6 +1338,9 @@ class DeviceManager:
             polling_interval_non_meta: The new value of the 'polling_interval_non_meta' attribute
             polling_interval_meta: The new value of the 'polling_interval_meta' attribute
             parameters: The new values of the parameters of the command
+            recording_mode: The new recording mode, unchanged if None
+            deadband: The new deadband of the recording mode, unchanged if None
+            max_silence: The new number of seconds after which an unchanged value is recorded, unchanged if None
         """
         # Check if polling_interval_non_meta values are specified: if not, use defaults
         if polling_interval_non_meta is None:
@@ -1027,8 +1357,12 @@ class DeviceManager:
                         [parameter.value, parameter.name, 'parameter', 'command', command_id])
                 # Update the command
                 cursor.execute(
-                    'update commands_for_data_handler set activated = %s, meta = %s, polling_interval_non_meta = %s, polling_interval_meta = %s where id = %s',
-                    [active, meta, polling_interval_non_meta, polling_interval_meta, command_id])
+                    'update commands_for_data_handler set activated = %s, meta = %s, polling_interval_non_meta = %s, polling_interval_meta = %s, '
+                    'recording_mode = coalesce(%s, recording_mode), deadband = coalesce(%s, deadband), max_silence = coalesce(%s, max_silence) where id = %s '
+                    'returning id, recording_mode, deadband, max_silence',
+                    [active, meta, polling_interval_non_meta, polling_interval_meta, recording_mode, deadband, max_silence,
+                     command_id])
+                recording = cursor.fetchone()
                 # Retrieve the 'active' and 'meta' attributes of the commands and properties of the feature
                 cursor.execute(
                     'select activated, meta from commands_for_data_handler where feature = %s',
@@ -1069,10 +1403,14 @@ class DeviceManager:
                     'update devices set activated = %s where uuid = %s',
                     [device_active, device_uuid])
         release_database_connection(conn)
+        if recording is not None and (recording_mode, deadband, max_silence) != (None, None, None):
+            # The data handler runs in the scheduler process and applies the mode to the running experiments
+            _publish_scheduler_command('set_recording_mode', ['command', *recording])
 
     def set_property_attributes_for_data_handler(self, device_uuid: UUID, feature_id: str, property_id: str,
                                                  active: bool, meta: bool, polling_interval_non_meta: int,
-                                                 polling_interval_meta: int):
+                                                 polling_interval_meta: int, recording_mode: str = None,
+                                                 deadband: float = None, max_silence: int = None):
         """Set the attributes of the specified property to the specified values
         Args:
             device_uuid: The uuid of the device
@@ -1082,6 +1420,9 @@ class DeviceManager:
             meta: The new value of the 'meta' attribute
             polling_interval_non_meta: The new value of the 'polling_interval_non_meta' attribute
             polling_interval_meta: The new value of the 'polling_interval_meta' attribute
+            recording_mode: The new recording mode, unchanged if None
+            deadband: The new deadband of the recording mode, unchanged if None
+            max_silence: The new number of seconds after which an unchanged value is recorded, unchanged if None
         """
         # Check if polling_interval_non_meta values are specified: if not, use defaults
         if polling_interval_non_meta is None:
@@ -1093,8 +1434,12 @@ class DeviceManager:
             with conn.cursor() as cursor:
                 # Update the property
                 cursor.execute(
-                    'update properties_for_data_handler set activated = %s, meta = %s, polling_interval_non_meta = %s, polling_interval_meta = %s where id = %s',
-                    [active, meta, polling_interval_non_meta, polling_interval_meta, property_id])
+                    'update properties_for_data_handler set activated = %s, meta = %s, polling_interval_non_meta = %s, polling_interval_meta = %s, '
+                    'recording_mode = coalesce(%s, recording_mode), deadband = coalesce(%s, deadband), max_silence = coalesce(%s, max_silence) where id = %s '
+                    'returning id, recording_mode, deadband, max_silence',
+                    [active, meta, polling_interval_non_meta, polling_interval_meta, recording_mode, deadband, max_silence,
+                     property_id])
+                recording = cursor.fetchone()
                 # Retrieve the 'active' and 'meta' attributes of the commands and properties of the feature
                 cursor.execute(
                     'select activated, meta from commands_for_data_handler where feature = %s',
@@ -1135,6 +1480,9 @@ class DeviceManager:
                     'update devices set activated = %s where uuid = %s',
                     [device_active, device_uuid])
         release_database_connection(conn)
+        if recording is not None and (recording_mode, deadband, max_silence) != (None, None, None):
+            # The data handler runs in the scheduler process and applies the mode to the running experiments
+            _publish_scheduler_command('set_recording_mode', ['property', *recording])
 
     def discover_sila_devices(self):
         """Triggers the sila autodiscovery
@@ -1240,6 +1588,47 @@ class DeviceManager:
     def delete_experiment(self, experimentID: int):
         return experiment.delete_experiment(experimentID)
 
+    def get_experiment_data(self, experiment_id: int, format: str) -> Iterator[bytes]:
+        """Returns the recorded samples of an experiment, read lazily from the databases of its booked devices
+        Args:
+            experiment_id: The id of the experiment
+            format: experiment_data.EXPORT_CSV or experiment_data.EXPORT_ARROW
+        Returns:
+            The encoded samples in chunks, one row per field of a sample
+        """
+        databases = {}
+        for booking in experiment.get_experiment(experiment_id).deviceBookings:
+            database_id = self.get_device_info(booking.device).databaseId
+            if database_id is not None and database_id not in databases:
+                databases[database_id] = self.get_database_info(database_id)
+        # The samples are tagged with the experiment, so every database is read once for all of its devices
+        rows = itertools.chain.from_iterable(experiment_data.read_experiment_rows(info, experiment_id)
+                                             for info in databases.values())
+        if format == experiment_data.EXPORT_ARROW:
+            return experiment_data.encode_arrow(rows)
+        return experiment_data.encode_csv(rows)
+
+    def get_array_slice(self, uuid: UUID, feature: str, item: str, field: str, start: int, end: int,
+                        format: str) -> Iterator[bytes]:
+        """Returns the arrays the data handler stored for a list response of a device within a time range. The arrays
+        are memory mapped from the block files of the array store.
+        Args:
+            uuid (uuid.UUID): The unique id of the device
+            feature: The identifier of the feature
+            item: The identifier of the command or property
+            field: The response, as stored in the time-series sink
+            start: Nanoseconds since the epoch of the first sample
+            end: Nanoseconds since the epoch of the last sample
+            format: array_store.EXPORT_NPY or array_store.EXPORT_ARROW
+        Returns:
+            The encoded arrays in chunks
+        """
+        array_slice = array_store.get_array_store().read_slice(str(uuid), feature, item, field, start, end)
+        array_slice.check_shape()
+        if format == array_store.EXPORT_ARROW:
+            return array_slice.encode_arrow()
+        return array_slice.encode_npy()
+
     def get_user_scripts(self, user: int) -> List[script.Script]:
         return script.get_user_scripts(user)
 
@@ -0,0 +1,55 @@
+from typing import Optional
+from uuid import UUID
+import time
+import msgpack
+
+from source.device_manager.database import get_redis_pool
+from source.device_manager.device_layer.device_info import DeviceStatus
+
+#: Channel on which status transitions of the devices are published
+DEVICE_STATUS_CHANNEL = 'device_status'
+
+
+def get_device_status_key(uuid: UUID) -> str:
+    return f'device_status:{str(uuid)}'
+
+
+async def get_cached_device_status(uuid: UUID) -> Optional[DeviceStatus]:
+    """Returns the last status of the device stored by the device status monitor or None if there is none"""
+    pool = await get_redis_pool()
+    entry = await pool.get(get_device_status_key(uuid))
+    if entry is None:
+        return None
+    entry = msgpack.unpackb(entry, raw=False)
+    return DeviceStatus(entry['online'], entry['status'], entry['latency'])
+
+
+async def set_cached_device_status(uuid: UUID, status: DeviceStatus, expire: int) -> bool:
+    """Stores the status of a device and publishes it if it has changed
+
+    :param uuid: The uuid of the device
+    :param status: The probed status of the device
+    :param expire: Seconds after which the entry is removed if it is not refreshed
+    :return: True if the status changed
+    """
+    pool = await get_redis_pool()
+    entry = {
+        'uuid': str(uuid),
+        'online': status.online,
+        'status': status.status,
+        'latency': status.latency,
+        'timestamp': int(time.time())
+    }
+    previous = await pool.getset(get_device_status_key(uuid), msgpack.packb(entry))
+    await pool.expire(get_device_status_key(uuid), expire)
+    if previous is not None:
+        previous = msgpack.unpackb(previous, raw=False)
+        if previous['online'] == status.online and previous['status'] == status.status:
+            return False
+    await pool.publish(DEVICE_STATUS_CHANNEL, msgpack.packb(entry))
+    return True
+
+
+async def delete_cached_device_status(uuid: UUID):
+    pool = await get_redis_pool()
+    await pool.delete(get_device_status_key(uuid))
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from enum import IntEnum
 from uuid import UUID
@@ -9,6 +9,10 @@ from source.device_manager.database import get_database_connection, get_redis_po
 from source.device_manager.scheduler import BookingInfo, BookingInfoWithNames, get_device_bookings_for_experiment_inside_transaction, book_inside_transaction
 
 
+#: Channel on which the experiments table notifies inserted, updated and deleted experiments, see setup_db.py
+EXPERIMENT_CHANGES_CHANNEL = 'experiment_changes'
+
+
 class ExperimentStatus(IntEnum):
     WAITING_FOR_EXECUTION = 0
     SUBMITED_FOR_EXECUTION = 1
@@ -146,6 +150,28 @@ def get_scheduling_info() -> List[SchedulingInfo]:
     return info
     
 
+def has_experiment_change_trigger(cursor) -> bool:
+    """Returns whether the experiments table has the trigger that notifies its changes, see setup_db.py"""
+    cursor.execute("select exists(select 1 from pg_trigger where tgname='experiment_changes' "
+                   "and tgrelid='experiments'::regclass)")
+    return cursor.fetchone()[0]
+
+
+def get_experiment_scheduling_info(id: int) -> Optional[SchedulingInfo]:
+    """Returns the scheduling info of an experiment or None if it does not exist"""
+    conn = get_database_connection()
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute('select id, name, startTime, endTime, script from experiments where id=%s', [id])
+                row = cursor.fetchone()
+    finally:
+        release_database_connection(conn)
+    if row is None:
+        return None
+    return SchedulingInfo(row[0], row[1], row[2], row[3], row[4])
+
+
 def create_experiment(name: str, start: int, end: int, user: int,
                       devices: List[UUID], script: int) -> int:
     print(name, start, end, user, devices, script)
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator, Tuple
+
+import psycopg2
+from influxdb import InfluxDBClient
+
+from source.device_manager.device_layer.database_info import DatabaseInfo
+from source.device_manager.time_series_sink import INFLUX_SINK, TIMESCALE_SINK, TIMESCALE_TABLE, parse_sink_names
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+#: Comma separated values with a header row
+EXPORT_CSV = 'csv'
+#: Arrow IPC stream, requires pyarrow
+EXPORT_ARROW = 'arrow'
+#: The media type of every export format
+EXPORT_MEDIA_TYPES = {EXPORT_CSV: 'text/csv', EXPORT_ARROW: 'application/vnd.apache.arrow.stream'}
+#: Number of rows read from the database and sent to the client at once
+ROWS_PER_CHUNK = 10000
+#: The columns of an export, every row holds one field of one sample
+COLUMNS = ('time', 'booking', 'device', 'feature', 'item', 'field', 'value')
+
+#: time in nanoseconds since the epoch, booking, device, feature, item, field, value
+Row = Tuple[int, str, str, str, str, str, Any]
+
+
+class ExperimentDataError(Exception):
+    """Raised if the data of an experiment could not be read from a database"""
+
+
+def _get_item(tags: dict) -> str:
+    return tags.get('command') or tags.get('property') or ''
+
+
+def _read_influx(info: DatabaseInfo, experiment_id: int) -> Iterator[Row]:
+    """Reads the samples of an experiment from InfluxDB as a chunked response, one chunk at a time"""
+    client = InfluxDBClient(info.address, info.port, 'root', 'root', info.name)
+    query = f'select * from device_manager where "experiment" = \'{int(experiment_id)}\' group by *'
+    response = client.request('query', params={'q': query, 'db': info.name, 'epoch': 'ns', 'chunked': 'true',
+                                               'chunk_size': ROWS_PER_CHUNK},
+                              stream=True, headers={'Accept': 'application/json'})
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            for result in json.loads(line).get('results', []):
+                if 'error' in result:
+                    raise ExperimentDataError(f'Could not read experiment {experiment_id} from database {info.name}: '
+                                              f'{result["error"]}')
+                for series in result.get('series', []):
+                    tags = series.get('tags', {})
+                    booking, device, feature, item = tags.get('booking', ''), tags.get('device', ''), \
+                        tags.get('feature', ''), _get_item(tags)
+                    fields = series['columns'][1:]
+                    for values in series['values']:
+                        for field, value in zip(fields, values[1:]):
+                            if value is not None:
+                                yield values[0], booking, device, feature, item, field, value
+    finally:
+        response.close()
+        client.close()
+
+
+def _read_timescale(info: DatabaseInfo, experiment_id: int) -> Iterator[Row]:
+    """Reads the samples of an experiment from the table of the TimescaleDB sink with a server side cursor"""
+    connection = psycopg2.connect(host=info.address, port=info.port, user=info.username, password=info.password,
+                                  dbname=info.name)
+    try:
+        with connection:
+            with connection.cursor(name=f'experiment_{int(experiment_id)}_data') as cursor:
+                cursor.itersize = ROWS_PER_CHUNK
+                cursor.execute('select (extract(epoch from time) * 1000000)::bigint * 1000, tags, fields '
+                               f"from {TIMESCALE_TABLE} where tags->>'experiment' = %s order by time",
+                               [str(experiment_id)])
+                for time_ns, tags, fields in cursor:
+                    booking, device, feature, item = tags.get('booking', ''), tags.get('device', ''), \
+                        tags.get('feature', ''), _get_item(tags)
+                    for field, value in fields.items():
+                        if value is not None:
+                            yield time_ns, booking, device, feature, item, field, value
+    finally:
+        connection.close()
+
+
+def read_experiment_rows(info: DatabaseInfo, experiment_id: int) -> Iterator[Row]:
+    """Reads the samples of an experiment lazily from the first sink of a database that can be queried
+
+    :param info: The database the devices of the experiment are linked to
+    :param experiment_id: The id of the experiment
+    """
+    for sink in parse_sink_names(info.sinks):
+        if sink == INFLUX_SINK:
+            return _read_influx(info, experiment_id)
+        if sink == TIMESCALE_SINK:
+            return _read_timescale(info, experiment_id)
+    print(f'Database {info.name} has no sink the data of experiment {experiment_id} can be read from')
+    return iter(())
+
+
+def encode_csv(rows: Iterable[Row]) -> Iterator[bytes]:
+    """Encodes rows as CSV in chunks of ROWS_PER_CHUNK rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count == ROWS_PER_CHUNK:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    yield buffer.getvalue().encode()
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def encode_arrow(rows: Iterable[Row]) -> Iterator[bytes]:
+    """Encodes rows as an Arrow IPC stream with one record batch per ROWS_PER_CHUNK rows
+
+    Numeric values are stored in the number column, all other values as strings in the text column.
+    """
+    if pyarrow is None:
+        raise ExperimentDataError('The Arrow export requires pyarrow')
+    schema = pyarrow.schema([('time', pyarrow.timestamp('ns', tz='UTC')), ('booking', pyarrow.string()),
+                             ('device', pyarrow.string()), ('feature', pyarrow.string()), ('item', pyarrow.string()),
+                             ('field', pyarrow.string()), ('number', pyarrow.float64()), ('text', pyarrow.string())])
+    buffer = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(buffer, schema)
+
+    def flush(columns):
+        writer.write_batch(pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    columns = [[] for _ in schema]
+    for time_ns, booking, device, feature, item, field, value in rows:
+        number = _is_number(value)
+        for column, entry in zip(columns, (time_ns, booking, device, feature, item, field,
+                                           float(value) if number else None, None if number else str(value))):
+            column.append(entry)
+        if len(columns[0]) == ROWS_PER_CHUNK:
+            yield flush(columns)
+            columns = [[] for _ in schema]
+    if columns[0]:
+        yield flush(columns)
+    writer.close()
+    yield buffer.getvalue()
+
+
+def arrow_available() -> bool:
+    return pyarrow is not None
@@ -0,0 +1,80 @@
+import threading
+from typing import Dict, List
+
+from influxdb import InfluxDBClient
+
+from source.device_manager.device_layer.database_info import DatabaseInfo
+from source.device_manager.global_storage import get_global_storage
+
+
+class InfluxWriter:
+    """Writes points into one InfluxDB database over a persistent HTTP session
+
+    The database is created with the first write instead of before every write. Requests are gzip compressed.
+    """
+    def __init__(self, info: DatabaseInfo):
+        self.info = info
+        self.client = InfluxDBClient(info.address, info.port, 'root', 'root', info.name, gzip=True)
+        self._database_exists = False
+        # The HTTP session of the client must not be used by several threads at once
+        self._lock = threading.Lock()
+
+    def _ensure_database(self):
+        if not self._database_exists:
+            self.client.create_database(self.info.name)
+            self._database_exists = True
+
+    def write_points(self, points: List[dict]):
+        with self._lock:
+            self._ensure_database()
+            self.client.write_points(points)
+
+    def write_line_protocol(self, data: bytes):
+        """Writes points encoded in line protocol with nanosecond timestamps, every line ends with a line break"""
+        with self._lock:
+            self._ensure_database()
+            # Posted as it is, write() would join and encode the lines again
+            self.client.request('write', 'POST', params={'db': self.info.name}, data=data, expected_response_code=204,
+                                headers={'Content-Type': 'application/octet-stream'})
+
+    def close(self):
+        with self._lock:
+            self.client.close()
+
+
+_writers_lock = threading.Lock()
+
+
+def _get_writers() -> Dict[int, InfluxWriter]:
+    return get_global_storage().setdefault('influx_writers', {})
+
+
+def get_influx_writer(info: DatabaseInfo) -> InfluxWriter:
+    """Returns the writer of the database, a new one is created if the database has been changed since the last call
+    Args:
+        info: The database to write into
+    """
+    stale = None
+    with _writers_lock:
+        writers = _get_writers()
+        writer = writers.get(info.id)
+        if writer is not None and writer.info != info:
+            stale = writer
+            writer = None
+        if writer is None:
+            writer = InfluxWriter(info)
+            writers[info.id] = writer
+    if stale is not None:
+        stale.close()
+    return writer
+
+
+def invalidate_influx_writer(id: int):
+    """Closes the writer of a database, e.g. after it has been edited or deleted
+    Args:
+        id: The id of the database
+    """
+    with _writers_lock:
+        writer = _get_writers().pop(id, None)
+    if writer is not None:
+        writer.close()
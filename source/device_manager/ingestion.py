@@ -0,0 +1,387 @@
+import configparser
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+
+from source.device_manager.data_directories import DATA_DIRECTORY
+from source.device_manager.database import get_redis_connection
+from source.device_manager.device_layer.database_info import DatabaseInfo
+from source.device_manager.global_storage import get_global_storage
+from source.device_manager.time_series_sink import TimeSeriesSink, create_sink, parse_sink_names, INFLUX_SINK
+from source.device_manager.write_ahead_log import WriteAheadLog, WriteAheadLogError, CorruptRecordError, merge_range, \
+    SEGMENT_SIZE, MAX_SEGMENTS
+
+#: Maximum number of samples waiting to be written per database
+QUEUE_SIZE = 100000
+#: A batch is written as soon as it contains this many samples
+BATCH_SIZE = 5000
+#: Seconds after which a batch is written even if it is not full
+FLUSH_INTERVAL = 1.0
+#: Seconds to wait before a failed batch is written again
+RETRY_DELAY = 5.0
+#: Seconds between two updates of the statistics in Redis
+STATS_INTERVAL = 5.0
+#: Redis key under which the statistics of all databases are stored
+STATS_KEY = 'ingestion_stats'
+#: Directory of the write-ahead logs, every database has its own subdirectory
+WAL_DIRECTORY = os.path.join(DATA_DIRECTORY, 'wal')
+#: Seconds between two fsyncs of the write-ahead log
+WAL_SYNC_INTERVAL = 1.0
+#: Maximum number of logged points per second that are written after the database has been unavailable
+REPLAY_RATE = 20000
+
+#: submit() waits until there is space in the queue of the database
+OVERFLOW_BLOCK = 'block'
+#: submit() discards the oldest waiting sample of the database
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+
+# The outcomes of writing a batch into a sink
+_WRITTEN = 'written'
+_REJECTED = 'rejected'
+_FAILED = 'failed'
+
+
+class IngestionError(Exception):
+    """Raised if a sample could not be queued"""
+
+
+@dataclass
+class Sample:
+    measurement: str
+    tags: Dict[str, str]
+    fields: Dict[str, Any]
+    #: Nanoseconds since the epoch
+    time: int
+
+
+@dataclass
+class IngestionStats:
+    database_id: int
+    sink: str = INFLUX_SINK
+    queued: int = 0
+    written: int = 0
+    dropped: int = 0
+    failed_flushes: int = 0
+    #: Points written from the write-ahead log after the database has been unavailable
+    replayed: int = 0
+    #: Bytes of the write-ahead log that still have to be written into the database
+    pending_bytes: int = 0
+    #: Bytes of the write-ahead log that were deleted before they could be written, because the log was full
+    lost_bytes: int = 0
+    #: Points of batches the sink rejected as invalid, which are not written again
+    rejected: int = 0
+    #: Bytes of the write-ahead log that were skipped during replay, because a record was corrupt
+    corrupt_bytes: int = 0
+    #: Points per second written during the last statistics interval
+    throughput: float = 0
+    #: Seconds the last flush took
+    flush_latency: float = 0
+    #: Seconds the oldest sample of the last flush waited in the queue
+    queue_latency: float = 0
+
+
+class _DatabaseQueue:
+    """The queue, the write-ahead log and the writer threads of one sink of a database
+
+    Every sample is appended to the write-ahead log before it is queued. If a batch can not be written, its range of
+    the log is remembered and the database is not written to for RETRY_DELAY seconds; later batches are only logged in
+    the meantime. The replay thread writes the remembered ranges from the log once the database is reachable again,
+    limited to replay_rate points per second. The checkpoint of the log is the start of the oldest range that has not
+    been written yet, ranges behind the checkpoint are replayed after a restart.
+
+    A batch the sink rejects as invalid, e.g. because of a field type conflict, would fail again; it is logged and
+    skipped instead of being retried. The replay skips the rest of a segment after a corrupt record, because the start
+    of the next record is not known.
+    """
+    def __init__(self, info: DatabaseInfo, sink: TimeSeriesSink, queue_size: int, batch_size: int,
+                 flush_interval: float, policy: str, wal: WriteAheadLog, replay_rate: float):
+        self.info = info
+        self.sink = sink
+        self.stats = IngestionStats(info.id, sink.name)
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._policy = policy
+        self._condition = threading.Condition()
+        self._written_at_last_stats = 0
+        self._stats_time = time.monotonic()
+        self._wal = wal
+        self._replay_rate = replay_rate
+        # Sorted ranges [start, end) of the log that have not been written into the database
+        self._pending: List[List[int]] = []
+        if wal.start < wal.end:
+            self._pending.append([wal.start, wal.end])
+        # The log position up to which the writer thread has either written the batches or added them to _pending
+        self._handled = wal.end
+        # The monotonic time before which the database is considered unavailable
+        self._unavailable_until = 0
+        for target in (self._run, self._replay, self._sync):
+            threading.Thread(target=target, daemon=True).start()
+
+    def put(self, sample: Sample, timeout: Optional[float]):
+        record = msgpack.packb([sample.measurement, sample.tags, sample.fields, sample.time], default=str)
+        with self._condition:
+            if len(self._queue) >= self._queue_size:
+                if self._policy == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self.stats.dropped += 1
+                elif not self._condition.wait_for(lambda: len(self._queue) < self._queue_size, timeout):
+                    self.stats.dropped += 1
+                    raise IngestionError(f'Queue of the {self.sink.name} sink of database {self.info.name} is full')
+            try:
+                # Appending inside the lock keeps the log in the order of the queue
+                start, end = self._wal.append(record)
+            except WriteAheadLogError as e:
+                self.stats.dropped += 1
+                raise IngestionError(str(e))
+            self._queue.append((time.monotonic(), sample, start, end))
+            if len(self._queue) == 1 or len(self._queue) >= self._batch_size:
+                # The writer waits for the first sample or for a full batch
+                self._condition.notify_all()
+
+    def _take_batch(self) -> List[tuple]:
+        with self._condition:
+            while True:
+                if len(self._queue) >= self._batch_size:
+                    break
+                if self._queue:
+                    age = time.monotonic() - self._queue[0][0]
+                    if age >= self._flush_interval:
+                        break
+                    self._condition.wait(self._flush_interval - age)
+                else:
+                    self._condition.wait()
+            batch = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+            # Wake up producers waiting for space
+            self._condition.notify_all()
+            return batch
+
+    def _write(self, samples: List[Sample]) -> str:
+        """Returns _WRITTEN, _REJECTED if the batch must not be written again or _FAILED if it has to be retried"""
+        try:
+            self.sink.write(self.info, samples)
+            return _WRITTEN
+        except Exception as e:
+            self.stats.failed_flushes += 1
+            if self.sink.is_rejection(e):
+                self.stats.rejected += len(samples)
+                print(f'The {self.sink.name} sink of database {self.info.name} rejected {len(samples)} points, they '
+                      f'are skipped: {e}')
+                return _REJECTED
+            print(f'Could not write {len(samples)} points into the {self.sink.name} sink of database {self.info.name}: '
+                  f'{e}')
+            with self._condition:
+                self._unavailable_until = time.monotonic() + RETRY_DELAY
+            return _FAILED
+
+    def _update_checkpoint(self):
+        """Must be called with the lock of the condition held"""
+        self._wal.set_checkpoint(self._pending[0][0] if self._pending else self._handled)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            start = time.monotonic()
+            result = self._write([sample for _, sample, _, _ in batch]) if start >= self._unavailable_until else _FAILED
+            with self._condition:
+                if result == _FAILED:
+                    # The replay thread writes the batch from the log when the database is available again
+                    merge_range(self._pending, batch[0][2], batch[-1][3])
+                    self._condition.notify_all()
+                self._handled = batch[-1][3]
+                self._update_checkpoint()
+            if result == _WRITTEN:
+                now = time.monotonic()
+                self.stats.flush_latency = now - start
+                self.stats.queue_latency = start - batch[0][0]
+                self.stats.written += len(batch)
+
+    def _replay(self):
+        while True:
+            try:
+                self._replay_batch()
+            except Exception as e:
+                print(f'Could not replay the write-ahead log of the {self.sink.name} sink of database {self.info.name}: '
+                      f'{e}')
+                time.sleep(RETRY_DELAY)
+
+    def _replay_batch(self):
+        with self._condition:
+            while not self._pending or time.monotonic() < self._unavailable_until:
+                self._condition.wait(max(self._unavailable_until - time.monotonic(), 0) or None)
+            start, end = self._pending[0]
+        try:
+            records = list(self._wal.read(start, end, self._batch_size))
+        except CorruptRecordError as e:
+            # The records after a corrupt one can only be found again at the start of the next segment
+            skip_to = min((e.position // self._wal.segment_size + 1) * self._wal.segment_size, end)
+            print(f'Skipping {skip_to - e.position} bytes of the write-ahead log of the {self.sink.name} sink of '
+                  f'database {self.info.name}: {e}')
+            self.stats.corrupt_bytes += skip_to - e.position
+            self._advance_pending(skip_to)
+            return
+        samples = [Sample(*msgpack.unpackb(payload, raw=False)) for _, payload in records]
+        result = self._write(samples) if samples else _WRITTEN
+        if result == _FAILED:
+            return
+        self._advance_pending(records[-1][0] if records else end)
+        if result == _WRITTEN:
+            self.stats.replayed += len(samples)
+        # Limit the replay rate, so it does not delay the live batches of the database
+        time.sleep(len(samples) / self._replay_rate)
+
+    def _advance_pending(self, position: int):
+        """Removes the part of the first pending range before the position"""
+        with self._condition:
+            # Only the end of the last range grows while the lock is released, so the first range is still ours
+            if position < self._pending[0][1]:
+                self._pending[0][0] = position
+            else:
+                self._pending.pop(0)
+            self._update_checkpoint()
+
+    def _sync(self):
+        while True:
+            time.sleep(WAL_SYNC_INTERVAL)
+            try:
+                self._wal.sync()
+            except Exception as e:
+                print(f'Could not sync the write-ahead log of the {self.sink.name} sink of database {self.info.name}: '
+                      f'{e}')
+
+    def update_stats(self) -> IngestionStats:
+        now = time.monotonic()
+        written = self.stats.written
+        self.stats.throughput = (written - self._written_at_last_stats) / max(now - self._stats_time, 1e-9)
+        with self._condition:
+            self.stats.queued = len(self._queue)
+            self.stats.pending_bytes = sum(end - max(start, self._wal.start) for start, end in self._pending)
+        self.stats.lost_bytes = self._wal.lost_bytes
+        self._written_at_last_stats = written
+        self._stats_time = now
+        return self.stats
+
+
+class IngestionPipeline:
+    """Buffers samples in bounded per-database queues and writes them in batches
+
+    Every sink of a database link, e.g. InfluxDB and a local file, has its own queue, write-ahead log and writer thread,
+    so a slow database or sink does not delay the others, and a sink that was unavailable catches up on its own. A batch is written when it
+    is full or when its oldest sample has waited for flush_interval seconds. If the queue of a database is full, submit
+    either blocks or drops the oldest sample, depending on the overflow policy. Samples are stored in a write-ahead log
+    per database first, so samples which could not be written while the database was unavailable or before the
+    process stopped are written later.
+    """
+    def __init__(self, queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, policy: str = OVERFLOW_BLOCK,
+                 wal_directory: str = WAL_DIRECTORY, wal_segment_size: int = SEGMENT_SIZE,
+                 wal_max_segments: int = MAX_SEGMENTS, replay_rate: float = REPLAY_RATE):
+        """
+        :param queue_size: Maximum number of waiting samples per database
+        :param batch_size: Maximum number of samples per write
+        :param flush_interval: Seconds after which a sample is written at the latest
+        :param policy: OVERFLOW_BLOCK or OVERFLOW_DROP_OLDEST
+        :param wal_directory: Directory of the write-ahead logs
+        :param wal_segment_size: Size of one segment file of a write-ahead log in bytes
+        :param wal_max_segments: Maximum number of segment files per write-ahead log, limits its disk usage
+        :param replay_rate: Maximum number of logged points per second written after the database was unavailable
+        """
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._policy = policy
+        self._wal_directory = wal_directory
+        self._wal_segment_size = wal_segment_size
+        self._wal_max_segments = wal_max_segments
+        self._replay_rate = replay_rate
+        self._queues: Dict[Tuple[int, str], _DatabaseQueue] = {}
+        self._lock = threading.Lock()
+        self._stats_thread = threading.Thread(target=self._publish_stats, daemon=True)
+        self._stats_thread.start()
+
+    def _get_queue(self, info: DatabaseInfo, sink_name: str) -> _DatabaseQueue:
+        """Must be called with the lock held"""
+        queue = self._queues.get((info.id, sink_name))
+        if queue is None:
+            sink = create_sink(sink_name)
+            # The log of the InfluxDB sink keeps the directory used before there were several sinks
+            directory = str(info.id) if sink_name == INFLUX_SINK else f'{info.id}-{sink_name}'
+            wal = WriteAheadLog(os.path.join(self._wal_directory, directory), self._wal_segment_size,
+                                self._wal_max_segments)
+            queue = _DatabaseQueue(info, sink, self._queue_size, self._batch_size, self._flush_interval,
+                                   self._policy, wal, self._replay_rate)
+            self._queues[(info.id, sink_name)] = queue
+        # The queue writes with the latest database info, e.g. after the database has been moved
+        queue.info = info
+        return queue
+
+    def submit(self, info: DatabaseInfo, sample: Sample, timeout: Optional[float] = None) -> Dict[str, str]:
+        """Queue a sample to be written into every sink of a database
+
+        A sink that can not queue the sample does not keep it from the other sinks. The sample must not be submitted
+        again, the sinks that have queued it would store it twice.
+
+        :param info: The database to write into
+        :param sample: The sample to write
+        :param timeout: Seconds to wait for space in a queue with the block policy, None waits forever
+        :return: The error of every sink that could not queue the sample, counted as dropped in its statistics
+        """
+        with self._lock:
+            queues = [self._get_queue(info, sink_name) for sink_name in parse_sink_names(info.sinks)]
+        errors = {}
+        for queue in queues:
+            try:
+                queue.put(sample, timeout)
+            except IngestionError as e:
+                errors[queue.sink.name] = str(e)
+        return errors
+
+    def get_stats(self) -> List[IngestionStats]:
+        with self._lock:
+            queues = list(self._queues.values())
+        return [queue.update_stats() for queue in queues]
+
+    def _publish_stats(self):
+        while True:
+            time.sleep(STATS_INTERVAL)
+            try:
+                get_redis_connection().set(STATS_KEY, msgpack.packb([asdict(stats) for stats in self.get_stats()]))
+            except Exception as e:
+                print(f'Could not publish the ingestion statistics: {e}')
+
+
+_pipeline_lock = threading.Lock()
+
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    """Returns the ingestion pipeline of this process, configured by the Ingestion section of the config file"""
+    storage = get_global_storage()
+    with _pipeline_lock:
+        if storage.get('ingestion_pipeline') is None:
+            config = configparser.ConfigParser()
+            config.read(f'{DATA_DIRECTORY}/device-manager.conf')
+            section = config['Ingestion'] if config.has_section('Ingestion') else {}
+            storage['ingestion_pipeline'] = IngestionPipeline(
+                int(section.get('queue_size', QUEUE_SIZE)),
+                int(section.get('batch_size', BATCH_SIZE)),
+                float(section.get('flush_interval', FLUSH_INTERVAL)),
+                section.get('overflow_policy', OVERFLOW_BLOCK),
+                WAL_DIRECTORY,
+                int(section.get('wal_segment_size', SEGMENT_SIZE)),
+                int(section.get('wal_max_segments', MAX_SEGMENTS)),
+                float(section.get('replay_rate', REPLAY_RATE)))
+    return storage['ingestion_pipeline']
+
+
+def get_published_stats() -> List[dict]:
+    """Returns the statistics last published by the ingestion pipeline of the scheduler"""
+    stats = get_redis_connection().get(STATS_KEY)
+    if stats is None:
+        return []
+    return msgpack.unpackb(stats, raw=False)
@@ -0,0 +1,97 @@
+import threading
+import time
+from typing import Any, Dict, List
+from uuid import UUID
+
+import msgpack
+
+from source.device_manager.database import get_redis_connection, get_redis_pool
+from source.device_manager.global_storage import get_global_storage
+
+#: Seconds between two writes of the changed values to Redis, values updated in between are coalesced
+FLUSH_INTERVAL = 0.1
+
+
+def get_latest_values_key(uuid: UUID) -> str:
+    """The Redis hash with the last value of every recorded command and property of a device"""
+    return f'latest_values:{str(uuid)}'
+
+
+def get_latest_values_channel(uuid: UUID) -> str:
+    """The Redis channel on which the changed last values of a device are published"""
+    return f'latest_values:{str(uuid)}'
+
+
+class LastValueCache:
+    """The last value of every command and property of the data handler, stored in Redis for dashboards
+
+    Updates are kept in memory and written every flush interval, one pipeline for all devices, so a poll does not wait
+    for Redis. Per device, the entries are stored in a hash with one field per feature and item, and the changed
+    entries are published on the channel of the device.
+    """
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        """
+        :param flush_interval: Seconds between two writes to Redis
+        """
+        self._flush_interval = flush_interval
+        self._changed: Dict[str, Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def update(self, device_uuid: str, feature: str, item: str, values: Dict[str, Any], time_ns: int,
+               latency: float = None):
+        """Stores the last value of a command or property
+
+        :param device_uuid: The uuid of the device
+        :param feature: The identifier of the feature
+        :param item: The identifier of the command or property
+        :param values: The responses of the call
+        :param time_ns: Nanoseconds since the epoch at which the value was received
+        :param latency: Seconds the call took, None for values pushed by the device
+        """
+        entry = {'feature': feature, 'item': item, 'values': values, 'time': time_ns, 'latency': latency}
+        with self._lock:
+            self._changed.setdefault(device_uuid, {})[f'{feature}/{item}'] = entry
+
+    def _run(self):
+        while True:
+            time.sleep(self._flush_interval)
+            with self._lock:
+                changed, self._changed = self._changed, {}
+            if not changed:
+                continue
+            try:
+                pipeline = get_redis_connection().pipeline(transaction=False)
+                for device_uuid, entries in changed.items():
+                    pipeline.hset(get_latest_values_key(device_uuid),
+                                  mapping={field: msgpack.packb(entry, default=str) for field, entry in entries.items()})
+                    pipeline.publish(get_latest_values_channel(device_uuid),
+                                     msgpack.packb(list(entries.values()), default=str))
+                pipeline.execute()
+            except Exception as e:
+                print(f'Could not store the last values of {len(changed)} devices: {e}')
+
+
+_cache_lock = threading.Lock()
+
+
+def get_last_value_cache() -> LastValueCache:
+    """Returns the last value cache of this process"""
+    storage = get_global_storage()
+    with _cache_lock:
+        if storage.get('last_value_cache') is None:
+            storage['last_value_cache'] = LastValueCache()
+    return storage['last_value_cache']
+
+
+async def get_latest_values(uuid: UUID) -> List[dict]:
+    """Returns the last values of the recorded commands and properties of a device stored by the data handler"""
+    pool = await get_redis_pool()
+    entries = await pool.hgetall(get_latest_values_key(uuid))
+    return [msgpack.unpackb(entry, raw=False) for entry in entries.values()]
+
+
+async def delete_latest_values(uuid: UUID):
+    pool = await get_redis_pool()
+    await pool.delete(get_latest_values_key(uuid))
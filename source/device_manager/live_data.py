@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aioredis
+import msgpack
+
+from source.device_manager.database import get_redis_connection
+from source.device_manager.global_storage import get_global_storage
+
+#: Seconds between two messages with the recorded samples of an experiment
+FLUSH_INTERVAL = 0.1
+#: Samples waiting for a websocket client, above this only the newest sample of every item is kept
+MAX_PENDING_SAMPLES = 1000
+
+
+def get_experiment_data_channel(experiment_id: int) -> str:
+    """The Redis channel on which the recorded samples of an experiment are published in batches"""
+    return f'experiment_data:{int(experiment_id)}'
+
+
+class LiveSamplePublisher:
+    """Publishes the samples recorded by the data handler for the live charts of the experiments
+
+    The samples are collected in memory and published every flush interval, one message per experiment with all of its
+    samples, so a poll does not wait for Redis and the websockets receive a few messages per second per experiment.
+    """
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        """
+        :param flush_interval: Seconds between two messages of an experiment
+        """
+        self._flush_interval = flush_interval
+        self._samples: Dict[int, List[dict]] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, experiment_id: int, booking_id: Optional[int], device_uuid: str, feature: str, item: str,
+                values: Dict[str, Any], time_ns: int):
+        """Queues a recorded sample for the next message of the experiment
+
+        :param experiment_id: The id of the experiment the sample is recorded for
+        :param booking_id: The id of the booking of the device
+        :param device_uuid: The uuid of the device
+        :param feature: The identifier of the feature
+        :param item: The identifier of the command or property
+        :param values: The responses of the call
+        :param time_ns: Nanoseconds since the epoch at which the sample was taken
+        """
+        sample = {'booking': booking_id, 'device': device_uuid, 'feature': feature, 'item': item, 'values': values,
+                  'time': time_ns}
+        with self._lock:
+            self._samples.setdefault(experiment_id, []).append(sample)
+
+    def _run(self):
+        while True:
+            time.sleep(self._flush_interval)
+            with self._lock:
+                samples, self._samples = self._samples, {}
+            if not samples:
+                continue
+            try:
+                pipeline = get_redis_connection().pipeline(transaction=False)
+                for experiment_id, experiment_samples in samples.items():
+                    pipeline.publish(get_experiment_data_channel(experiment_id),
+                                     msgpack.packb(experiment_samples, default=str))
+                pipeline.execute()
+            except Exception as e:
+                print(f'Could not publish the samples of {len(samples)} experiments: {e}')
+
+
+_publisher_lock = threading.Lock()
+
+
+def get_live_sample_publisher() -> LiveSamplePublisher:
+    """Returns the live sample publisher of this process"""
+    storage = get_global_storage()
+    with _publisher_lock:
+        if storage.get('live_sample_publisher') is None:
+            storage['live_sample_publisher'] = LiveSamplePublisher()
+    return storage['live_sample_publisher']
+
+
+def parse_filter(names: Optional[Iterable[str]]) -> Optional[Set[str]]:
+    """Returns the names of a filter, None if everything passes
+
+    :param names: A comma separated string or a list of names
+    """
+    if names is None:
+        return None
+    if isinstance(names, str):
+        names = names.split(',')
+    names = {str(name).strip() for name in names if str(name).strip()}
+    return names or None
+
+
+class LiveDataClient:
+    """The samples of an experiment waiting to be sent to one websocket client
+
+    Only the samples of the devices and items of the filter are kept, an item passes by its identifier or as
+    feature/item. A client that does not keep up gets the newest sample of every item instead of all samples, so a
+    slow client neither delays the others nor makes the backend buffer without limit.
+    """
+    def __init__(self, devices: Optional[Set[str]] = None, items: Optional[Set[str]] = None,
+                 max_pending: int = MAX_PENDING_SAMPLES):
+        """
+        :param devices: The uuids of the devices to send, None for all
+        :param items: The commands and properties to send, None for all
+        :param max_pending: Number of waiting samples above which they are coalesced
+        """
+        self.devices = devices
+        self.items = items
+        self._max_pending = max_pending
+        self._pending: List[dict] = []
+        self._dropped = 0
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def set_filter(self, devices: Optional[Set[str]], items: Optional[Set[str]]):
+        self.devices = devices
+        self.items = items
+
+    def matches(self, sample: dict) -> bool:
+        if self.devices is not None and sample['device'] not in self.devices:
+            return False
+        if self.items is not None and sample['item'] not in self.items and \
+                f'{sample["feature"]}/{sample["item"]}' not in self.items:
+            return False
+        return True
+
+    def put(self, samples: List[dict]):
+        """Adds the samples passing the filter"""
+        self._pending.extend(sample for sample in samples if self.matches(sample))
+        if len(self._pending) > self._max_pending:
+            newest: Dict[Tuple[str, str, str], dict] = {}
+            for sample in self._pending:
+                newest[(sample['device'], sample['feature'], sample['item'])] = sample
+            self._dropped += len(self._pending) - len(newest)
+            self._pending = list(newest.values())
+        if self._pending:
+            self._event.set()
+
+    async def get(self) -> Optional[Tuple[List[dict], int]]:
+        """Waits for samples and returns them with the number of samples dropped since the last call, None once the
+        client is closed"""
+        await self._event.wait()
+        self._event.clear()
+        if self._closed:
+            return None
+        samples, self._pending = self._pending, []
+        dropped, self._dropped = self._dropped, 0
+        return samples, dropped
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+
+class _ExperimentSubscription:
+    """One Redis subscription to the samples of an experiment, shared by all of its websocket clients
+
+    If the Redis connection is lost, the clients are closed, so their websockets are closed and can connect again.
+    """
+    def __init__(self, experiment_id: int, on_lost: Callable[['_ExperimentSubscription'], None]):
+        """
+        :param experiment_id: The id of the experiment
+        :param on_lost: Called with the subscription after its connection was lost
+        """
+        self.experiment_id = experiment_id
+        self.clients: Set[LiveDataClient] = set()
+        self._on_lost = on_lost
+        self._connection = None
+        self._task = None
+
+    async def start(self):
+        self._connection = await aioredis.create_redis('redis://localhost')
+        channels = await self._connection.subscribe(get_experiment_data_channel(self.experiment_id))
+        self._task = asyncio.ensure_future(self._forward(channels[0]))
+
+    async def _forward(self, channel):
+        try:
+            while await channel.wait_message():
+                samples = msgpack.unpackb(await channel.get(), raw=False)
+                for client in list(self.clients):
+                    client.put(samples)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f'Live data subscription of experiment {self.experiment_id} failed: {e}')
+        print(f'Lost the live data subscription of experiment {self.experiment_id}')
+        self._on_lost(self)
+        for client in list(self.clients):
+            client.close()
+        self._connection.close()
+
+    async def stop(self):
+        self._task.cancel()
+        self._connection.close()
+        await self._connection.wait_closed()
+
+
+class LiveDataHub:
+    """Fans the samples of the experiments out to the websocket clients of this process"""
+    def __init__(self):
+        self._subscriptions: Dict[int, _ExperimentSubscription] = {}
+        self._lock = asyncio.Lock()
+
+    async def add_client(self, experiment_id: int, client: LiveDataClient):
+        async with self._lock:
+            subscription = self._subscriptions.get(experiment_id)
+            if subscription is None:
+                subscription = _ExperimentSubscription(experiment_id, self._discard)
+                await subscription.start()
+                self._subscriptions[experiment_id] = subscription
+            subscription.clients.add(client)
+
+    def _discard(self, subscription: _ExperimentSubscription):
+        # A new subscription is started by the next client
+        if self._subscriptions.get(subscription.experiment_id) is subscription:
+            del self._subscriptions[subscription.experiment_id]
+
+    async def remove_client(self, experiment_id: int, client: LiveDataClient):
+        client.close()
+        async with self._lock:
+            subscription = self._subscriptions.get(experiment_id)
+            if subscription is None:
+                return
+            subscription.clients.discard(client)
+            if not subscription.clients:
+                del self._subscriptions[experiment_id]
+                await subscription.stop()
+
+
+def get_live_data_hub() -> LiveDataHub:
+    """Returns the live data hub of the event loop of this process"""
+    storage = get_global_storage()
+    if storage.get('live_data_hub') is None:
+        storage['live_data_hub'] = LiveDataHub()
+    return storage['live_data_hub']
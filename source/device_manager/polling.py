@@ -0,0 +1,204 @@
+import configparser
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List
+
+import msgpack
+
+from source.device_manager.data_directories import DATA_DIRECTORY
+from source.device_manager.database import get_redis_connection
+from source.device_manager.device_layer.call_deadline import call_deadline
+from source.device_manager.global_storage import get_global_storage
+
+#: Maximum number of devices that are polled at the same time
+MAX_WORKERS = 32
+#: Seconds a single command or property call of the data handler may take
+CALL_TIMEOUT = 10
+#: Maximum number of ticks that wait for a device with the queue policy, further ticks are skipped
+MAX_QUEUED_TICKS = 10
+#: Weight of the latest period in the smoothed sampling period
+PERIOD_SMOOTHING = 0.2
+#: Seconds between two updates of the statistics in Redis
+STATS_INTERVAL = 5.0
+#: Redis key under which the statistics of all polled items are stored
+STATS_KEY = 'polling_stats'
+
+#: A tick is skipped if the previous tick of the device is still running
+OVERRUN_SKIP = 'skip'
+#: All ticks that occur while the previous tick of the device is running are merged into one tick that runs after it
+OVERRUN_COALESCE = 'coalesce'
+#: Ticks that occur while the previous tick of the device is running are run one after the other
+OVERRUN_QUEUE = 'queue'
+
+
+@dataclass
+class PollingStats:
+    device: str
+    feature: str
+    item: str
+    #: Seconds between two polls, the smallest interval of all subscriptions of the item
+    interval: float
+    samples: int = 0
+    failures: int = 0
+    skipped: int = 0
+    #: Smoothed seconds between the starts of two calls, i.e. the achieved sampling period
+    period: float = 0
+    #: Seconds the last call took
+    latency: float = 0
+
+
+class PolledItem:
+    """A command or property of a device that is polled by the data handler"""
+    def __init__(self, device_uuid: str, feature: str, item: str, interval: float, poll: Callable[[], None]):
+        """
+        :param device_uuid: The uuid of the device
+        :param feature: The identifier of the feature
+        :param item: The identifier of the command or property
+        :param interval: Seconds between two polls
+        :param poll: Polls the item and stores the sample
+        """
+        self.device_uuid = device_uuid
+        self.poll = poll
+        self.stats = PollingStats(device_uuid, feature, item, interval)
+        self.last_start = None
+
+
+class DevicePoller:
+    """Polls the due items of one device
+
+    The items of one tick are polled one after the other in a worker thread, each call limited by the call timeout. If a
+    tick occurs while the previous one is still running, it is skipped, coalesced or queued, depending on the overrun
+    policy.
+    """
+    def __init__(self, device_uuid: str, executor: ThreadPoolExecutor, call_timeout: float, policy: str):
+        """
+        :param device_uuid: The uuid of the device
+        :param executor: The executor which runs the ticks
+        :param call_timeout: Seconds a single call may take
+        :param policy: OVERRUN_SKIP, OVERRUN_COALESCE or OVERRUN_QUEUE
+        """
+        self.device_uuid = device_uuid
+        self._executor = executor
+        self._call_timeout = call_timeout
+        self._policy = policy
+        self._running = False
+        self._pending: Deque[List[PolledItem]] = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, items: List[PolledItem]):
+        """Polls the items as soon as the previous tick is done
+
+        :param items: The items that are due
+        """
+        with self._lock:
+            if self._running:
+                if self._policy == OVERRUN_QUEUE and len(self._pending) < MAX_QUEUED_TICKS:
+                    self._pending.append(list(items))
+                    return
+                if self._policy == OVERRUN_COALESCE:
+                    if not self._pending:
+                        self._pending.append([])
+                    for item in items:
+                        if item in self._pending[0]:
+                            item.stats.skipped += 1
+                        else:
+                            self._pending[0].append(item)
+                    return
+                for item in items:
+                    item.stats.skipped += 1
+                return
+            self._running = True
+        self._executor.submit(self._run, list(items))
+
+    def _run(self, items: List[PolledItem]):
+        while True:
+            for item in items:
+                self._poll_item(item)
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                items = self._pending.popleft()
+
+    def _poll_item(self, item: PolledItem):
+        stats = item.stats
+        start = time.monotonic()
+        if item.last_start is not None:
+            period = start - item.last_start
+            stats.period = period if stats.period == 0 else \
+                (1 - PERIOD_SMOOTHING) * stats.period + PERIOD_SMOOTHING * period
+        item.last_start = start
+        try:
+            with call_deadline(self._call_timeout):
+                item.poll()
+            stats.samples += 1
+        except Exception as e:
+            stats.failures += 1
+            print(f'Could not poll {stats.feature}/{stats.item} of device {self.device_uuid}: {type(e).__name__} {e}')
+        stats.latency = time.monotonic() - start
+
+
+class PollingExecutor:
+    """Polls the items of the data handler concurrently across devices
+
+    Every device has its own DevicePoller, so a slow or hung device only delays its own samples.
+    """
+    def __init__(self, max_workers: int = MAX_WORKERS, call_timeout: float = CALL_TIMEOUT,
+                 policy: str = OVERRUN_SKIP):
+        """
+        :param max_workers: Maximum number of devices that are polled at the same time
+        :param call_timeout: Seconds a single call may take
+        :param policy: OVERRUN_SKIP, OVERRUN_COALESCE or OVERRUN_QUEUE
+        """
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='data-handler')
+        self._call_timeout = call_timeout
+        self._policy = policy
+        self._pollers: Dict[str, DevicePoller] = {}
+        self._lock = threading.Lock()
+
+    def tick(self, device_uuid: str, items: List[PolledItem]):
+        """Polls due items of a device
+
+        :param device_uuid: The uuid of the device
+        :param items: The items that are due
+        """
+        with self._lock:
+            poller = self._pollers.get(device_uuid)
+            if poller is None:
+                poller = DevicePoller(device_uuid, self._executor, self._call_timeout, self._policy)
+                self._pollers[device_uuid] = poller
+        poller.tick(items)
+
+
+_executor_lock = threading.Lock()
+
+
+def read_data_handler_config():
+    """Returns the DataHandler section of the config file, an empty dict if there is none"""
+    config = configparser.ConfigParser()
+    config.read(f'{DATA_DIRECTORY}/device-manager.conf')
+    return config['DataHandler'] if config.has_section('DataHandler') else {}
+
+
+def get_polling_executor() -> PollingExecutor:
+    """Returns the polling executor of this process, configured by the DataHandler section of the config file"""
+    storage = get_global_storage()
+    with _executor_lock:
+        if storage.get('polling_executor') is None:
+            section = read_data_handler_config()
+            storage['polling_executor'] = PollingExecutor(
+                int(section.get('max_workers', MAX_WORKERS)),
+                float(section.get('call_timeout', CALL_TIMEOUT)),
+                section.get('overrun_policy', OVERRUN_SKIP))
+    return storage['polling_executor']
+
+
+def get_published_stats() -> List[dict]:
+    """Returns the statistics last published by the data handler of the scheduler"""
+    stats = get_redis_connection().get(STATS_KEY)
+    if stats is None:
+        return []
+    return msgpack.unpackb(stats, raw=False)
@@ -0,0 +1,283 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import msgpack
+
+from source.device_manager.database import get_redis_connection
+from source.device_manager.polling import PolledItem, PollingExecutor, PollingStats, STATS_INTERVAL, STATS_KEY
+
+#: Seconds between two ticks of the timer wheel, i.e. the precision of the polling times
+RESOLUTION = 0.1
+#: Number of slots of the timer wheel, polls further in the future than one revolution wait for several revolutions
+WHEEL_SLOTS = 1024
+#: Fraction of the interval by which every poll is moved randomly
+JITTER = 0.0
+
+
+def get_phase(key: Hashable) -> float:
+    """Returns a fraction between 0 and 1 derived from the key, which is the same in every process
+
+    :param key: The key, its string representation must not depend on the process
+    """
+    digest = hashlib.sha1(repr(key).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+class TimerWheel:
+    """A hashed timer wheel
+
+    Every slot covers one tick of resolution seconds; an entry is stored in the slot of its due tick modulo the number
+    of slots. Scheduling and advancing by one tick cost O(1) plus the entries of the visited slot, independent of the
+    number of scheduled entries.
+    """
+    def __init__(self, resolution: float, slots: int, now: float):
+        """
+        :param resolution: Seconds per tick
+        :param slots: Number of slots
+        :param now: The current time, the first tick of the wheel
+        """
+        self.resolution = resolution
+        self._slots: List[List[Tuple[int, Any]]] = [[] for _ in range(slots)]
+        self._tick = int(now / resolution)
+
+    def schedule(self, due: float, entry: Any):
+        """Adds an entry which is returned by advance() once its due time has passed
+
+        :param due: The due time on the same clock as the now arguments, entries in the past are due with the next tick
+        :param entry: The entry
+        """
+        tick = max(math.ceil(due / self.resolution), self._tick + 1)
+        self._slots[tick % len(self._slots)].append((tick, entry))
+
+    def advance(self, now: float) -> List[Any]:
+        """Moves the wheel to the current time
+
+        :param now: The current time
+        :return: The entries which have become due
+        """
+        due = []
+        target = int(now / self.resolution)
+        while self._tick < target:
+            self._tick += 1
+            index = self._tick % len(self._slots)
+            slot = self._slots[index]
+            if slot:
+                self._slots[index] = [(tick, entry) for tick, entry in slot if tick > self._tick]
+                due.extend(entry for tick, entry in slot if tick <= self._tick)
+        return due
+
+    def next_tick_time(self) -> float:
+        return (self._tick + 1) * self.resolution
+
+
+@dataclass
+class Subscription:
+    experiment_id: int
+    #: Seconds between two samples
+    interval: float
+    #: Seconds since the epoch after which the subscription ends
+    end: float
+    #: The id of the device booking of the experiment
+    booking_id: Optional[int] = None
+
+
+class _PlannedItem(PolledItem):
+    def __init__(self, key: Hashable, device_uuid: str, feature: str, item: str, poll: Callable[[], None]):
+        super().__init__(device_uuid, feature, item, 0, poll)
+        self.key = key
+        self.subscriptions: List[Subscription] = []
+        self.interval = 0
+        # The poll times of the item without jitter, the jitter does not accumulate
+        self.next_due = 0
+        # Fraction of the interval by which the polls of the item are offset
+        self.phase = 0.0
+        # Entries of the timer wheel with an older generation have been replaced
+        self.generation = 0
+        # The subscription of an item whose values are pushed by the device instead of being polled
+        self.stream = None
+
+
+class PollingPlanner:
+    """Polls every subscribed command and property of the data handler once per interval, however many experiments
+    subscribe to it
+
+    All subscriptions of the same device, feature, item and, for commands, parameters share one item, which is polled
+    with the smallest interval of its subscriptions. The items are scheduled in one timer wheel; the due items of a tick
+    are handed to the polling executor per device. Subscriptions are added and removed while the planner is running.
+
+    Items with the same interval are not polled at the same time: every item is polled at a fixed phase within its
+    interval, derived from a hash of the device and the item. The phases are the same after a restart, because they
+    refer to the wall clock. Additionally every poll can be moved by a random jitter.
+
+    Items of a kind with a stream function are not polled: the stream function opens a subscription when the first
+    experiment subscribes to the item, which is stopped when the last subscription has been removed or has ended.
+    """
+    def __init__(self, executor: PollingExecutor,
+                 poll_functions: Dict[str, Callable[[str, Any, List[Subscription]], None]],
+                 resolution: float = RESOLUTION, jitter: float = JITTER, spread_phases: bool = True,
+                 stream_functions: Dict[str, Callable[[str, Any, PollingStats, Callable[[], List[Subscription]]],
+                                                      Any]] = None):
+        """
+        :param executor: Polls the due items
+        :param poll_functions: The function that polls and stores an item per kind of item, i.e. 'command' and
+            'property'; it is called with the uuid of the device, the item and its current subscriptions
+        :param resolution: Seconds between two ticks of the timer wheel
+        :param jitter: Fraction of the interval by which every poll is moved randomly
+        :param spread_phases: Spread the polls over the interval, otherwise items are polled first when they are
+            subscribed
+        :param stream_functions: The function that starts a subscription per kind of item whose values are pushed; it
+            is called with the uuid of the device, the item, its statistics and a function returning its current
+            subscriptions and returns an object with a stop method
+        """
+        self._executor = executor
+        self._poll_functions = poll_functions
+        self._stream_functions = stream_functions or {}
+        self._jitter = jitter
+        self._spread_phases = spread_phases
+        self._items: Dict[Hashable, _PlannedItem] = {}
+        self._wheel = TimerWheel(resolution, WHEEL_SLOTS, time.monotonic())
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._stats_thread = threading.Thread(target=self._publish_stats, daemon=True)
+        self._stats_thread.start()
+
+    def subscribe(self, experiment_id: int, device_uuid: str, kind: str, key: Hashable, feature: str, item: str,
+                  argument: Any, interval: float, end: float, booking_id: Optional[int] = None):
+        """Adds a subscription of an experiment to a command or property
+
+        :param experiment_id: The id of the experiment
+        :param device_uuid: The uuid of the device
+        :param kind: The kind of the item, a key of the poll functions
+        :param key: Identifies the item within the device together with the kind, e.g. the feature and command
+            identifiers and the parameters
+        :param feature: The identifier of the feature, used in the statistics
+        :param item: The identifier of the command or property, used in the statistics
+        :param argument: Passed to the poll function
+        :param interval: Seconds between two samples
+        :param end: Seconds since the epoch after which the subscription ends
+        :param booking_id: The id of the device booking of the experiment
+        """
+        with self._lock:
+            planned = self._items.get((device_uuid, kind, key))
+            if planned is None:
+                planned = _PlannedItem((device_uuid, kind, key), device_uuid, feature, item, None)
+                # The subscriptions are passed as they are at the time of the poll, the list is replaced on changes
+                poll_function = self._poll_functions.get(kind)
+                if poll_function is not None:
+                    planned.poll = lambda: poll_function(device_uuid, argument, planned.subscriptions)
+                planned.phase = get_phase(planned.key) if self._spread_phases else 0.0
+                if kind in self._stream_functions:
+                    planned.stream = self._stream_functions[kind](device_uuid, argument, planned.stats,
+                                                                  lambda: planned.subscriptions)
+                self._items[planned.key] = planned
+            planned.subscriptions = planned.subscriptions + [Subscription(experiment_id, interval, end, booking_id)]
+            self._update_interval(planned, time.monotonic())
+
+    def unsubscribe(self, experiment_id: int):
+        """Removes all subscriptions of an experiment
+
+        :param experiment_id: The id of the experiment
+        """
+        with self._lock:
+            now = time.monotonic()
+            for planned in list(self._items.values()):
+                subscriptions = [s for s in planned.subscriptions if s.experiment_id != experiment_id]
+                if len(subscriptions) != len(planned.subscriptions):
+                    planned.subscriptions = subscriptions
+                    self._update_interval(planned, now)
+
+    def _update_interval(self, planned: _PlannedItem, now: float):
+        """Must be called with the lock held"""
+        if not planned.subscriptions:
+            del self._items[planned.key]
+            if planned.stream is not None:
+                planned.stream.stop()
+            return
+        interval = min(subscription.interval for subscription in planned.subscriptions)
+        if interval == planned.interval:
+            return
+        first = planned.interval == 0
+        planned.interval = interval
+        planned.stats.interval = interval
+        # With spread phases the polls move to the grid of the new interval, which is not the grid of the old one
+        if first or self._spread_phases or planned.next_due > now + interval:
+            planned.next_due = self._get_first_due(planned, now)
+            planned.generation += 1
+            self._schedule(planned, planned.generation)
+
+    def _get_first_due(self, planned: _PlannedItem, now: float) -> float:
+        """The next poll time on the grid of the phase of the item"""
+        if not self._spread_phases:
+            return now
+        # The grid refers to the wall clock, so it does not depend on the start time of the process
+        offset = time.time() - now
+        grid = (now + offset - planned.phase * planned.interval) / planned.interval
+        return math.ceil(grid) * planned.interval + planned.phase * planned.interval - offset
+
+    def _schedule(self, planned: _PlannedItem, generation: int):
+        due = planned.next_due
+        if self._jitter:
+            due += random.uniform(-self._jitter, self._jitter) * planned.interval
+        self._wheel.schedule(due, (planned, generation))
+
+    def _expire(self, planned: _PlannedItem, now: float):
+        """Removes the ended subscriptions of an item, must be called with the lock held"""
+        wall_time = time.time()
+        subscriptions = [s for s in planned.subscriptions if s.end > wall_time]
+        if len(subscriptions) != len(planned.subscriptions):
+            planned.subscriptions = subscriptions
+            self._update_interval(planned, now)
+
+    def _run(self):
+        while not self._stopped.wait(max(self._wheel.next_tick_time() - time.monotonic(), 0)):
+            self._tick()
+
+    def _tick(self):
+        """Polls the items that have become due since the last tick"""
+        due_by_device = defaultdict(list)
+        with self._lock:
+            now = time.monotonic()
+            for planned, generation in self._wheel.advance(now):
+                if generation != planned.generation or self._items.get(planned.key) is not planned:
+                    continue
+                self._expire(planned, now)
+                if self._items.get(planned.key) is not planned:
+                    continue
+                # Streamed items are only scheduled to check whether their subscriptions have ended
+                if planned.stream is None:
+                    due_by_device[planned.device_uuid].append(planned)
+                # Stay on the grid of the first poll, even if the planner has fallen behind
+                planned.next_due += planned.interval * max(math.ceil((now - planned.next_due) / planned.interval), 1)
+                self._schedule(planned, generation)
+        for device_uuid, items in due_by_device.items():
+            self._executor.tick(device_uuid, items)
+
+    def get_stats(self) -> List[PollingStats]:
+        with self._lock:
+            return [planned.stats for planned in self._items.values()]
+
+    def stop(self):
+        """Stops polling and publishing the statistics, and stops the streams of the subscribed items"""
+        self._stopped.set()
+        self._thread.join()
+        self._stats_thread.join()
+        with self._lock:
+            for planned in self._items.values():
+                if planned.stream is not None:
+                    planned.stream.stop()
+            self._items.clear()
+
+    def _publish_stats(self):
+        while not self._stopped.wait(STATS_INTERVAL):
+            try:
+                get_redis_connection().set(STATS_KEY, msgpack.packb([asdict(stats) for stats in self.get_stats()]))
+            except Exception as e:
+                print(f'Could not publish the polling statistics: {e}')
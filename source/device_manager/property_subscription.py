@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from source.device_manager.polling import PollingStats, PERIOD_SMOOTHING
+
+#: Seconds to wait before a failed subscription is opened again, doubled after every failure
+RESUBSCRIBE_DELAY = 1.0
+#: Maximum number of seconds to wait before a failed subscription is opened again
+MAX_RESUBSCRIBE_DELAY = 60.0
+
+
+class PropertySubscription:
+    """A long-lived subscription to an observable property, which records the values pushed by the device
+
+    The subscription runs in its own thread. If the stream fails or is closed by the device, it is opened again after a
+    delay that grows with every failure and is reset by the next received value. With a minimum interval, values that
+    arrive sooner than that after the last recorded value are dropped.
+    """
+    def __init__(self, name: str, open_stream: Callable[[], Tuple[Any, Callable[[Any], Dict[str, Any]]]],
+                 record: Callable[[Dict[str, Any]], None], on_error: Callable[[], None], stats: PollingStats,
+                 min_interval: float = 0):
+        """
+        :param name: Describes the property in log messages
+        :param open_stream: Opens the stream and returns it together with a function that converts its messages
+        :param record: Stores the values of a message
+        :param on_error: Called after the stream has failed, e.g. to reconnect the device
+        :param stats: Counts the recorded values
+        :param min_interval: Minimum number of seconds between two recorded values, 0 records every value
+        """
+        self.name = name
+        self.stats = stats
+        self._open_stream = open_stream
+        self._record = record
+        self._on_error = on_error
+        self._min_interval = min_interval
+        self._stream = None
+        self._last_recorded: Optional[float] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Cancels the subscription"""
+        with self._lock:
+            self._stopped.set()
+            stream = self._stream
+        if stream is not None:
+            stream.cancel()
+
+    def _run(self):
+        delay = RESUBSCRIBE_DELAY
+        while not self._stopped.is_set():
+            try:
+                stream, parse = self._open_stream()
+                with self._lock:
+                    if self._stopped.is_set():
+                        stream.cancel()
+                        return
+                    self._stream = stream
+                for message in stream:
+                    self._receive(parse(message))
+                    delay = RESUBSCRIBE_DELAY
+                print(f'The subscription to {self.name} has been closed by the device')
+            except Exception as e:
+                if self._stopped.is_set():
+                    return
+                self.stats.failures += 1
+                print(f'The subscription to {self.name} failed: {type(e).__name__} {e}')
+                self._on_error()
+            with self._lock:
+                self._stream = None
+            self._stopped.wait(delay)
+            delay = min(2 * delay, MAX_RESUBSCRIBE_DELAY)
+
+    def _receive(self, values: Dict[str, Any]):
+        now = time.monotonic()
+        if self._last_recorded is not None:
+            if now - self._last_recorded < self._min_interval:
+                self.stats.skipped += 1
+                return
+            period = now - self._last_recorded
+            self.stats.period = period if self.stats.period == 0 else \
+                (1 - PERIOD_SMOOTHING) * self.stats.period + PERIOD_SMOOTHING * period
+        self._last_recorded = now
+        try:
+            self._record(values)
+            self.stats.samples += 1
+        except Exception as e:
+            self.stats.failures += 1
+            print(f'Could not record a value of {self.name}: {type(e).__name__} {e}')
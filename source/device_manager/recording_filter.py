@@ -0,0 +1,94 @@
+import numbers
+import threading
+import time
+from typing import Any, Dict, Optional
+
+#: Every sample is recorded
+RECORD_ALWAYS = 'always'
+#: A sample is recorded if any of its values differs from the last recorded sample
+RECORD_ON_CHANGE = 'on_change'
+#: A sample is recorded if a numeric value has moved by more than the deadband since the last recorded sample
+RECORD_ABSOLUTE_DEADBAND = 'absolute_deadband'
+#: A sample is recorded if a numeric value has moved by more than the deadband times the last recorded value
+RECORD_RELATIVE_DEADBAND = 'relative_deadband'
+#: The valid recording modes
+RECORDING_MODES = (RECORD_ALWAYS, RECORD_ON_CHANGE, RECORD_ABSOLUTE_DEADBAND, RECORD_RELATIVE_DEADBAND)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+class RecordingFilter:
+    """Decides which samples of a command or property of the data handler are written to the database
+
+    Samples are compared with the last recorded sample of the same item, field by field. Non-numeric values, e.g.
+    strings, booleans or lists, are recorded whenever they change in every mode but RECORD_ALWAYS; the deadband only
+    applies to numbers. With a maximum silence, an unchanged sample is recorded anyway once that many seconds have
+    passed since the last recorded one, so a slow signal still shows up in every query window.
+
+    A filter belongs to one item. It is used by the worker polling the device or the subscription of the item, and is
+    reconfigured from other threads when the recording mode of the item is edited.
+    """
+    def __init__(self, mode: str = RECORD_ALWAYS, deadband: float = 0, max_silence: float = 0):
+        """
+        :param mode: One of RECORDING_MODES
+        :param deadband: The absolute change, or the change relative to the last recorded value, that is recorded
+        :param max_silence: Seconds after which an unchanged sample is recorded, 0 never records unchanged samples
+        """
+        self._lock = threading.Lock()
+        self.configure(mode, deadband, max_silence)
+
+    def configure(self, mode: str, deadband: float = 0, max_silence: float = 0):
+        """Changes the recording mode, the next sample is recorded whatever its values
+
+        :param mode: One of RECORDING_MODES
+        :param deadband: The absolute change, or the change relative to the last recorded value, that is recorded
+        :param max_silence: Seconds after which an unchanged sample is recorded, 0 never records unchanged samples
+        """
+        if mode not in RECORDING_MODES:
+            raise ValueError(f'Unknown recording mode {mode}, expected one of {", ".join(RECORDING_MODES)}')
+        with self._lock:
+            self.mode = mode
+            self.deadband = deadband or 0
+            self.max_silence = max_silence or 0
+            self._last_values: Optional[Dict[str, Any]] = None
+            self._last_recorded = 0.0
+
+    def should_record(self, values: Dict[str, Any], now: float = None) -> bool:
+        """Returns whether a sample is recorded; it becomes the last recorded sample only with record(), once it has
+        been stored
+
+        :param values: The values of the sample by field
+        :param now: The current time of the monotonic clock, read if it is not given
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self.mode == RECORD_ALWAYS or self._last_values is None or self._has_changed(values) or \
+                (self.max_silence > 0 and now - self._last_recorded >= self.max_silence)
+
+    def record(self, values: Dict[str, Any], now: float = None):
+        """Remembers a stored sample as the last recorded sample
+
+        :param values: The values of the sample by field
+        :param now: The time of the monotonic clock passed to should_record, read if it is not given
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_values = dict(values)
+            self._last_recorded = now
+
+    def _has_changed(self, values: Dict[str, Any]) -> bool:
+        if values.keys() != self._last_values.keys():
+            return True
+        for field, value in values.items():
+            last = self._last_values[field]
+            if self.mode == RECORD_ON_CHANGE or not _is_number(value) or not _is_number(last):
+                if value != last:
+                    return True
+            elif self.mode == RECORD_ABSOLUTE_DEADBAND:
+                if abs(value - last) > self.deadband:
+                    return True
+            elif abs(value - last) > self.deadband * abs(last):
+                return True
+        return False
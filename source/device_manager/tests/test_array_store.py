@@ -0,0 +1,93 @@
+import io
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy
+
+from source.device_manager.array_store import ArrayStore, ArrayStoreError, arrow_available, get_array_fields, to_array
+
+
+class TestArrayStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ArrayStore(self.directory.name, block_size=3 * 4 * 8)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def append(self, time_ns, values):
+        return self.store.append('device', 'Spectrometer', 'Spectrum', 'spectrum/list', time_ns,
+                                 numpy.array(values, dtype=numpy.float64))
+
+    def read(self, start, end):
+        return self.store.read_slice('device', 'Spectrometer', 'Spectrum', 'spectrum/list', start, end)
+
+    def test_slice_across_blocks(self):
+        references = [self.append(time_ns, [time_ns] * 4) for time_ns in range(1, 6)]
+        # Three rows of four values fit into a block
+        self.assertEqual(references, ['array:0:0', 'array:0:1', 'array:0:2', 'array:1:0', 'array:1:1'])
+        array_slice = self.read(2, 4)
+        self.assertEqual(list(array_slice.times), [2, 3, 4])
+        self.assertEqual([segment.shape for segment in array_slice.segments], [(2, 4), (1, 4)])
+        array = numpy.load(io.BytesIO(b''.join(array_slice.encode_npy())))
+        numpy.testing.assert_array_equal(array, [[2] * 4, [3] * 4, [4] * 4])
+
+    def test_writer_continues_after_restart(self):
+        self.append(1, [1, 2])
+        self.store.close()
+        self.store = ArrayStore(self.directory.name)
+        self.assertEqual(self.append(2, [3, 4]), 'array:0:1')
+        self.assertEqual(len(self.read(0, 10).segments), 1)
+
+    def test_torn_index_record_after_crash(self):
+        self.append(1, [1, 2])
+        self.append(2, [3, 4])
+        self.store.close()
+        series = os.path.join(self.directory.name, 'device', 'Spectrometer', 'Spectrum', 'spectrum.list')
+        # The second row and its index record were only partly written
+        for name, size in (('block-000000.bin', 24), ('index.bin', 24)):
+            with open(os.path.join(series, name), 'r+b') as file:
+                file.truncate(size)
+        self.store = ArrayStore(self.directory.name)
+        self.assertEqual(self.append(3, [5, 6]), 'array:0:1')
+        array_slice = self.read(0, 10)
+        self.assertEqual(list(array_slice.times), [1, 3])
+        numpy.testing.assert_array_equal(array_slice.segments[0], [[1, 2], [5, 6]])
+
+    def test_different_shapes_cannot_be_combined(self):
+        self.append(1, [1, 2])
+        self.append(2, [1, 2, 3])
+        self.read(2, 2).check_shape()
+        with self.assertRaises(ArrayStoreError):
+            self.read(1, 2).check_shape()
+
+    @unittest.skipUnless(arrow_available(), 'requires pyarrow')
+    def test_arrow(self):
+        import pyarrow
+        self.append(1, [1, 2])
+        self.append(2, [3, 4])
+        table = pyarrow.ipc.open_stream(b''.join(self.read(0, 2).encode_arrow())).read_all()
+        self.assertEqual(table.column('values').to_pylist(), [[1.0, 2.0], [3.0, 4.0]])
+
+
+class TestArrayDetection(unittest.TestCase):
+
+    def test_list_response_types(self):
+        responses = [SimpleNamespace(identifier='Spectrum', data_type='list/Real'),
+                     SimpleNamespace(identifier='Name', data_type='String')]
+        self.assertEqual(get_array_fields(responses), {'spectrum': numpy.float64})
+
+    def test_to_array(self):
+        self.assertEqual(to_array([SimpleNamespace(value=1), SimpleNamespace(value=2)], numpy.float64).dtype,
+                         numpy.float64)
+        self.assertIsNone(to_array(['a', 'b']))
+        self.assertIsNone(to_array([]))
+        self.assertIsNone(to_array(1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+
+from source.device_manager.container_stats import StartLatencyHistogram
+
+
+class TestStartLatencyHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = StartLatencyHistogram((0.5, 2.0))
+        histogram.record(0.2, True)
+        histogram.record(0.5, True)
+        histogram.record(1.0, False)
+        histogram.record(9.0, False)
+        stats = histogram.to_dict()
+        self.assertEqual(stats['buckets'], [0.5, 2.0])
+        self.assertEqual(stats['warm']['counts'], [2, 0, 0])
+        self.assertEqual(stats['cold']['counts'], [0, 1, 1])
+        self.assertEqual(stats['cold']['count'], 2)
+        self.assertAlmostEqual(stats['cold']['sum'], 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
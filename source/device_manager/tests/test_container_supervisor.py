@@ -0,0 +1,76 @@
+import io
+import unittest
+from unittest import mock
+
+from container_supervisor import ContainerSupervisor, FRAME_HEADER, _WatchedContainer
+
+STDOUT = 1
+STDERR = 2
+
+
+def frame(stream, payload):
+    return FRAME_HEADER.pack(stream, len(payload)) + payload
+
+
+class TestParseFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = ContainerSupervisor(mock.Mock(), mock.Mock(), mock.Mock())
+        self.addCleanup(self.supervisor._loop.close)
+        self.watched = _WatchedContainer('container', 1, io.StringIO())
+
+    def feed(self, *reads):
+        for data in reads:
+            self.watched.buffer += data
+            self.supervisor._parse_frames(self.watched)
+
+    def lines(self):
+        # The messages start with a timestamp
+        return [message.split(' ', 1)[1] for message in self.watched.messages]
+
+    def test_complete_frames(self):
+        self.feed(frame(STDOUT, b'first\nsecond\n') + frame(STDERR, b'error\n'))
+        self.assertEqual(self.lines(), ['first\n', 'second\n', 'error\n'])
+        self.assertEqual(self.watched.buffer, b'')
+
+    def test_frame_split_across_reads(self):
+        data = frame(STDOUT, b'first\n') + frame(STDOUT, b'second\n')
+        # The header of the second frame is split as well
+        self.feed(data[:3], data[3:12], data[12:17])
+        self.assertEqual(self.lines(), ['first\n'])
+        self.feed(data[17:])
+        self.assertEqual(self.lines(), ['first\n', 'second\n'])
+        self.assertEqual(self.watched.buffer, b'')
+
+    def test_line_split_across_frames(self):
+        self.feed(frame(STDOUT, b'one '), frame(STDOUT, b'line\nnext'))
+        self.assertEqual(self.lines(), ['one line\n'])
+        self.feed(frame(STDOUT, b' line\n'))
+        self.assertEqual(self.lines(), ['one line\n', 'next line\n'])
+
+    def test_streams_are_joined_separately(self):
+        self.feed(frame(STDOUT, b'out'), frame(STDERR, b'err'), frame(STDOUT, b'put\n'), frame(STDERR, b'or\n'))
+        self.assertEqual(self.lines(), ['output\n', 'error\n'])
+
+    def test_unterminated_lines_are_flushed_at_the_end(self):
+        self.feed(frame(STDOUT, b'done\nlast'), frame(STDERR, b'partial'))
+        self.supervisor._flush_lines(self.watched)
+        self.assertEqual(self.lines(), ['done\n', 'last\n', 'partial\n'])
+
+    def test_invalid_utf8_is_replaced(self):
+        self.feed(frame(STDOUT, b'\xff\n'))
+        self.assertEqual(self.lines(), ['\ufffd\n'])
+
+    def test_batch_is_written_and_forwarded(self):
+        self.feed(frame(STDOUT, b'first\nsecond\n'))
+        messages = self.watched.messages
+        with mock.patch('builtins.print'):
+            self.supervisor._write_messages(self.watched)
+            self.supervisor._log_writer.shutdown()
+        self.assertEqual(self.watched.messages, [])
+        self.supervisor._on_log.assert_called_once_with(1, messages)
+        self.assertEqual(self.watched.log_file.getvalue(), ''.join(messages))
+
+
+if __name__ == '__main__':
+    unittest.main()
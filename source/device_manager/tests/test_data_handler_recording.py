@@ -0,0 +1,72 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import data_handler
+from source.device_manager.recording_filter import RecordingFilter, RECORD_ALWAYS, RECORD_ON_CHANGE
+
+
+def make_property(item_id, recording_mode=RECORD_ON_CHANGE):
+    response = SimpleNamespace(identifier='Value', data_type='Real')
+    return SimpleNamespace(id=item_id, identifier='Temperature', observable=False, response=response,
+                           recording_mode=recording_mode, deadband=0, max_silence=0)
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = mock.Mock()
+        self.pipeline.submit.return_value = {}
+        self.planner = mock.Mock()
+        patches = [
+            mock.patch.object(data_handler, 'get_ingestion_pipeline', return_value=self.pipeline),
+            mock.patch.object(data_handler, 'get_last_value_cache', mock.Mock()),
+            mock.patch.object(data_handler, 'get_live_sample_publisher', mock.Mock()),
+            mock.patch.object(data_handler, 'planner', self.planner),
+            mock.patch.dict(data_handler._recording_filters, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.feature = SimpleNamespace(identifier='TemperatureController')
+
+    def store(self, property, recording_filter, value):
+        data_handler._store_property('device', mock.Mock(), self.feature, property, recording_filter,
+                                     {'value/real': value}, [])
+
+    def test_dropped_sample_is_recorded_again(self):
+        property = make_property(1)
+        recording_filter = RecordingFilter(RECORD_ON_CHANGE)
+        self.pipeline.submit.return_value = {'influx': 'The queue is full'}
+        with mock.patch('builtins.print'):
+            self.store(property, recording_filter, 20.0)
+        self.pipeline.submit.return_value = {}
+        self.store(property, recording_filter, 20.0)
+        self.store(property, recording_filter, 20.0)
+        self.assertEqual(self.pipeline.submit.call_count, 2)
+
+    def subscribe(self, experiment_id, property):
+        data_handler.subscribe_property(experiment_id, 'device', (property, self.feature), 1, time.time() + 3600)
+        return self.planner.subscribe.call_args[0][6][2]
+
+    def test_edited_recording_mode_applies_to_subscribed_items(self):
+        recording_filter = self.subscribe(1, make_property(1))
+        self.assertIs(self.subscribe(2, make_property(1)), recording_filter)
+        other_filter = self.subscribe(1, make_property(2))
+        self.assertEqual(recording_filter.mode, RECORD_ON_CHANGE)
+        data_handler.set_recording_mode('property', 1, RECORD_ALWAYS, 0, 0)
+        self.assertEqual(recording_filter.mode, RECORD_ALWAYS)
+        self.assertEqual(other_filter.mode, RECORD_ON_CHANGE)
+        # Items stored before the recording modes existed have no mode
+        data_handler.set_recording_mode('property', 2, None, None, None)
+        self.assertEqual(other_filter.mode, RECORD_ALWAYS)
+
+    def test_new_subscription_applies_the_current_recording_mode(self):
+        recording_filter = self.subscribe(1, make_property(1))
+        self.subscribe(2, make_property(1, RECORD_ALWAYS))
+        self.assertEqual(recording_filter.mode, RECORD_ALWAYS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+from unittest import mock
+from uuid import uuid4
+
+import source.device_manager.device_manager as device_manager
+from source.device_manager.device_layer.device_call import DeviceCall, DeviceCallType
+from source.device_manager.device_layer.device_info import DeviceInfo
+from source.device_manager.device_layer.device_interface import AsyncDeviceInterface, DeviceType
+
+
+class RecordingDevice(AsyncDeviceInterface):
+    """Records how many calls are in flight at once and the deadlines they are sent with"""
+
+    def __init__(self, read_duration=0.05):
+        super().__init__('localhost', 50052, uuid4(), 'device', DeviceType.SILA)
+        self.read_duration = read_duration
+        self.reads_in_flight = 0
+        self.max_reads_in_flight = 0
+        self.reads_in_flight_at_commands = []
+        self.timeouts = []
+        self.cancelled = []
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def get_status(self):
+        return ''
+
+    def is_online(self):
+        return True
+
+    async def ping(self, timeout=None):
+        pass
+
+    def get_feature_names(self):
+        return ['Feature']
+
+    async def call_command(self, feature_id, command_id, parameters, timeout=None):
+        self.timeouts.append(timeout)
+        self.reads_in_flight_at_commands.append(self.reads_in_flight)
+        await asyncio.sleep(0.01)
+        return {'command': command_id}
+
+    async def call_property(self, feature_id, property_id, timeout=None):
+        self.timeouts.append(timeout)
+        self.reads_in_flight += 1
+        self.max_reads_in_flight = max(self.max_reads_in_flight, self.reads_in_flight)
+        try:
+            await asyncio.sleep(self.read_duration)
+        except asyncio.CancelledError:
+            self.cancelled.append(property_id)
+            raise
+        finally:
+            self.reads_in_flight -= 1
+        return {'property': property_id}
+
+
+def read(identifier):
+    return DeviceCall(DeviceCallType.PROPERTY, 'Feature', identifier)
+
+
+def command(identifier):
+    return DeviceCall(DeviceCallType.COMMAND, 'Feature', identifier, {})
+
+
+class TestCallBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.info = DeviceInfo(uuid4(), uuid4(), 'device', DeviceType.SILA, 'localhost', 50052)
+        self.manager = device_manager.DeviceManager()
+        patch = mock.patch.object(self.manager, 'get_device_info', return_value=self.info)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def call_batch(self, device, calls, timeout):
+        async def get_async_device(info):
+            return device
+
+        with mock.patch.object(device_manager, 'get_async_device', get_async_device):
+            return self.loop.run_until_complete(self.manager.call_batch_async(self.info.uuid, calls, timeout))
+
+    def test_reads_between_commands_are_concurrent(self):
+        device = RecordingDevice()
+        results = self.call_batch(device, [read('a'), read('b'), read('c'), command('x'), read('d')], 5)
+        self.assertEqual([result.response for result in results],
+                         [{'property': 'a'}, {'property': 'b'}, {'property': 'c'}, {'command': 'x'},
+                          {'property': 'd'}])
+        self.assertEqual(device.max_reads_in_flight, 3)
+        # The command waits for the reads before it
+        self.assertEqual(device.reads_in_flight_at_commands, [0])
+        self.assertTrue(all(0 < timeout <= 5 for timeout in device.timeouts))
+
+    def test_reads_are_cancelled_at_the_timeout(self):
+        device = RecordingDevice(read_duration=10)
+        results = self.call_batch(device, [read('a'), read('b')], 0.1)
+        self.assertEqual([result.error for result in results], ['Timeout', 'Timeout'])
+        self.assertEqual(sorted(device.cancelled), ['a', 'b'])
+        self.assertEqual(device.reads_in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import time
+import unittest
+from collections import deque
+from unittest import mock
+
+from source.device_manager.experiment import ExperimentStatus, SchedulingInfo
+
+# The scheduler creates its docker client on import, which would look up the API version of a running daemon
+with mock.patch('docker.from_env'):
+    import scheduler
+
+
+class TestUpdateScheduledExperiment(unittest.TestCase):
+
+    def setUp(self):
+        self.now = int(time.time())
+        self.scheduler = mock.Mock()
+        patches = [
+            mock.patch.object(scheduler, 'scheduler', self.scheduler),
+            mock.patch.object(scheduler, 'redis_connection', mock.Mock()),
+            mock.patch.object(scheduler, 'schedule_experiment', mock.Mock()),
+            mock.patch.dict(scheduler.experiments, clear=True),
+            mock.patch.dict(scheduler.job_to_experiment, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def add_waiting(self, start):
+        scheduler.experiments[1] = scheduler.ExperimentState(1, 'experiment', 'job', '0', start, start + 3600,
+                                                             ExperimentStatus.WAITING_FOR_EXECUTION, deque())
+        scheduler.job_to_experiment['job'] = 1
+
+    def test_start_moved_into_the_future(self):
+        self.add_waiting(self.now + 600)
+        scheduler.update_scheduled_experiment(SchedulingInfo(1, 'experiment', self.now + 1200, self.now + 4800, 1))
+        self.scheduler.reschedule_job.assert_called_once()
+        self.assertEqual(scheduler.experiments[1].start_time, self.now + 1200)
+
+    def test_start_moved_into_the_past_removes_the_job(self):
+        self.add_waiting(self.now + 600)
+        scheduler.update_scheduled_experiment(SchedulingInfo(1, 'experiment', self.now - 600, self.now + 3000, 1))
+        self.scheduler.remove_job.assert_called_once_with('job')
+        self.scheduler.reschedule_job.assert_not_called()
+        self.assertNotIn(1, scheduler.experiments)
+        self.assertNotIn('job', scheduler.job_to_experiment)
+
+    def test_rename_after_the_start_keeps_the_job(self):
+        # The start has just passed, the job is about to run
+        self.add_waiting(self.now - 1)
+        scheduler.update_scheduled_experiment(SchedulingInfo(1, 'renamed', self.now - 1, self.now + 3599, 1))
+        self.scheduler.modify_job.assert_called_once_with('job', name='experiment:renamed')
+        self.scheduler.reschedule_job.assert_not_called()
+        self.scheduler.remove_job.assert_not_called()
+        self.assertEqual(scheduler.experiments[1].name, 'renamed')
+
+    def test_new_experiment_in_the_past_is_not_scheduled(self):
+        scheduler.update_scheduled_experiment(SchedulingInfo(1, 'experiment', self.now - 600, self.now + 3000, 1))
+        scheduler.schedule_experiment.assert_not_called()
+        scheduler.update_scheduled_experiment(SchedulingInfo(2, 'experiment', self.now + 600, self.now + 3000, 1))
+        scheduler.schedule_experiment.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
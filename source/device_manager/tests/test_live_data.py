@@ -0,0 +1,45 @@
+import asyncio
+import unittest
+
+from source.device_manager.live_data import LiveDataClient, parse_filter
+
+
+def make_sample(device, item, time_ns):
+    return {'booking': 1, 'device': device, 'feature': 'F', 'item': item, 'values': {'value': time_ns},
+            'time': time_ns}
+
+
+class TestLiveDataClient(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_filter(self):
+        client = LiveDataClient(parse_filter('a, b'), parse_filter(['F/x', 'y']))
+        client.put([make_sample('a', 'x', 1), make_sample('a', 'y', 2), make_sample('a', 'z', 3),
+                    make_sample('c', 'x', 4)])
+        samples, dropped = self.loop.run_until_complete(client.get())
+        self.assertEqual([sample['time'] for sample in samples], [1, 2])
+        self.assertEqual(dropped, 0)
+
+    def test_slow_client_gets_newest_sample_per_item(self):
+        client = LiveDataClient(max_pending=3)
+        client.put([make_sample('a', 'x', 1), make_sample('a', 'y', 2), make_sample('a', 'x', 3)])
+        client.put([make_sample('a', 'x', 4)])
+        samples, dropped = self.loop.run_until_complete(client.get())
+        self.assertEqual(sorted(sample['time'] for sample in samples), [2, 4])
+        self.assertEqual(dropped, 2)
+
+    def test_closed_client(self):
+        client = LiveDataClient()
+        client.put([make_sample('a', 'x', 1)])
+        client.close()
+        self.assertIsNone(self.loop.run_until_complete(client.get()))
+
+
+if __name__ == '__main__':
+    unittest.main()
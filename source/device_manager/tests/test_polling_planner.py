@@ -0,0 +1,229 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import source.device_manager.polling_planner as polling_planner
+from source.device_manager.polling_planner import PollingPlanner, TimerWheel, get_phase
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_entries_beyond_one_revolution_wait(self):
+        wheel = TimerWheel(1, 8, 0)
+        wheel.schedule(20, 'late')
+        wheel.schedule(3, 'early')
+        # Both entries share slot 4 of the 8 slots
+        wheel.schedule(12, 'second revolution')
+        self.assertEqual(wheel.advance(4), ['early'])
+        self.assertEqual(wheel.advance(11), [])
+        self.assertEqual(wheel.advance(12), ['second revolution'])
+        self.assertEqual(wheel.advance(19), [])
+        self.assertEqual(wheel.advance(20), ['late'])
+
+    def test_entries_in_the_past_are_due_with_the_next_tick(self):
+        wheel = TimerWheel(1, 8, 10)
+        wheel.schedule(2, 'past')
+        self.assertEqual(wheel.advance(10.5), [])
+        self.assertEqual(wheel.advance(11), ['past'])
+
+
+class RecordingExecutor:
+
+    def __init__(self):
+        self.polls = []
+        self._lock = threading.Lock()
+
+    def tick(self, device_uuid, items):
+        with self._lock:
+            self.polls.extend((time.monotonic(), item.key) for item in items)
+
+    def count(self, since=0.0):
+        with self._lock:
+            return len([t for t, _ in self.polls if t >= since])
+
+
+class StoppableStream:
+
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class TestPollingPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = RecordingExecutor()
+        self.streams = []
+
+        def stream(device_uuid, argument, stats, get_subscriptions):
+            self.streams.append(StoppableStream())
+            return self.streams[-1]
+
+        self.planner = PollingPlanner(self.executor, {'property': lambda *args: None}, resolution=0.01,
+                                      spread_phases=False, stream_functions={'observable': stream})
+
+    def tearDown(self):
+        self.planner.stop()
+
+    def subscribe(self, experiment_id, interval, end=None, kind='property'):
+        self.planner.subscribe(experiment_id, 'device', kind, 'Temperature', 'Feature', 'Temperature', None, interval,
+                               time.time() + 3600 if end is None else end)
+
+    def test_shorter_interval_replaces_the_scheduled_poll(self):
+        self.subscribe(1, 0.3)
+        time.sleep(0.05)
+        self.assertEqual(self.executor.count(), 1)
+        self.subscribe(2, 0.1)
+        time.sleep(0.6)
+        times = [t for t, _ in self.executor.polls[1:]]
+        self.assertGreaterEqual(len(times), 5)
+        # The entry of the old generation, due 0.3 s after the first poll, must not cause an additional poll
+        self.assertGreaterEqual(min(b - a for a, b in zip(times, times[1:])), 0.08)
+
+    def test_longer_interval_after_unsubscribe(self):
+        self.subscribe(1, 0.5)
+        self.subscribe(2, 0.05)
+        time.sleep(0.2)
+        self.planner.unsubscribe(2)
+        time.sleep(0.1)
+        start = time.monotonic()
+        time.sleep(0.6)
+        self.assertLessEqual(self.executor.count(start), 2)
+        self.assertEqual(self.planner.get_stats()[0].interval, 0.5)
+
+    def test_ended_subscriptions_expire(self):
+        self.subscribe(1, 0.05, end=time.time() + 0.2)
+        time.sleep(0.4)
+        self.assertEqual(self.planner.get_stats(), [])
+        polls = self.executor.count()
+        time.sleep(0.2)
+        self.assertEqual(self.executor.count(), polls)
+
+    def test_stream_is_stopped_when_its_subscriptions_end(self):
+        self.subscribe(1, 0.05, end=time.time() + 0.2, kind='observable')
+        self.assertTrue(self.streams[0].stopped.wait(2))
+        self.assertEqual(self.executor.count(), 0)
+
+    def test_stop_ends_the_threads_and_streams(self):
+        self.subscribe(1, 0.05)
+        self.subscribe(2, 0.05, kind='observable')
+        self.planner.stop()
+        self.assertFalse(self.planner._thread.is_alive())
+        self.assertFalse(self.planner._stats_thread.is_alive())
+        self.assertTrue(self.streams[0].stopped.is_set())
+        polls = self.executor.count()
+        time.sleep(0.1)
+        self.assertEqual(self.executor.count(), polls)
+
+
+class FakeClock:
+    """Replaces the time module of the planner, the monotonic clock and the wall clock advance together"""
+
+    def __init__(self, monotonic, wall):
+        self.monotonic_time = monotonic
+        self.wall_time = wall
+
+    def monotonic(self):
+        return self.monotonic_time
+
+    def time(self):
+        return self.wall_time
+
+    def advance(self, seconds):
+        self.monotonic_time += seconds
+        self.wall_time += seconds
+
+
+class ClockExecutor:
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.polls = []
+
+    def tick(self, device_uuid, items):
+        self.polls.extend((self.clock.time(), item.key) for item in items)
+
+
+class TestPollingPhases(unittest.TestCase):
+    """Drives the timer wheel of a stopped planner with a fake clock"""
+
+    resolution = 0.01
+
+    def setUp(self):
+        self.clock = FakeClock(time.monotonic() + 1, 1600000000.123)
+        self.executor = ClockExecutor(self.clock)
+        self.planner = PollingPlanner(self.executor, {'property': lambda *args: None}, resolution=self.resolution)
+        self.planner.stop()
+        patch = mock.patch.object(polling_planner, 'time', self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def subscribe(self, experiment_id, item, interval):
+        self.planner.subscribe(experiment_id, 'device', 'property', item, 'Feature', item, None, interval,
+                               self.clock.time() + 3600)
+
+    def run_for(self, seconds):
+        for _ in range(round(seconds / self.resolution)):
+            self.clock.advance(self.resolution)
+            self.planner._tick()
+
+    def poll_times(self, item, since=0.0):
+        return [t for t, key in self.executor.polls if key == ('device', 'property', item) and t >= since]
+
+    def assertOnGrid(self, times, item, interval):
+        offset = get_phase(('device', 'property', item)) * interval
+        for t in times:
+            # The due time is rounded up to a tick of the wheel, which is reached with the next step of the clock
+            self.assertLess((t - offset) % interval, 2 * self.resolution, f'{t} is not on the grid of {interval} s')
+
+    def test_phase_is_stable_and_within_the_interval(self):
+        keys = [('device', 'property', f'Property{i}') for i in range(100)]
+        phases = [get_phase(key) for key in keys]
+        self.assertEqual(phases, [get_phase(key) for key in keys])
+        self.assertTrue(all(0 <= phase < 1 for phase in phases))
+        # The phases of different items are spread over the interval
+        self.assertEqual(len(set(phases)), len(phases))
+        self.assertLess(min(phases), 0.1)
+        self.assertGreater(max(phases), 0.9)
+
+    def test_first_poll_is_on_the_grid(self):
+        for i in range(10):
+            self.subscribe(1, f'Property{i}', 2)
+        for key, planned in self.planner._items.items():
+            wall_due = planned.next_due + self.clock.time() - self.clock.monotonic()
+            self.assertGreaterEqual(wall_due, self.clock.time())
+            self.assertLess(wall_due, self.clock.time() + 2)
+            remainder = (wall_due - get_phase(key) * 2) % 2
+            self.assertAlmostEqual(min(remainder, 2 - remainder), 0, delta=1e-6)
+        self.run_for(4)
+        for i in range(10):
+            times = self.poll_times(f'Property{i}')
+            self.assertEqual(len(times), 2)
+            self.assertOnGrid(times, f'Property{i}', 2)
+
+    def test_polls_stay_on_the_grid_after_the_interval_changes(self):
+        for i in range(10):
+            self.subscribe(1, f'Property{i}', 5)
+            self.subscribe(2, f'Property{i}', 0.3)
+        self.run_for(3)
+        for i in range(10):
+            self.assertOnGrid(self.poll_times(f'Property{i}'), f'Property{i}', 0.3)
+        self.planner.unsubscribe(2)
+        since = self.clock.time()
+        self.run_for(20)
+        for i in range(10):
+            times = self.poll_times(f'Property{i}', since)
+            self.assertEqual(len(times), 4)
+            self.assertOnGrid(times, f'Property{i}', 5)
+        self.planner.subscribe(3, 'device', 'property', 'Property0', 'Feature', 'Property0', None, 0.3,
+                               self.clock.time() + 3600)
+        since = self.clock.time()
+        self.run_for(3)
+        self.assertOnGrid(self.poll_times('Property0', since), 'Property0', 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from source.device_manager.recording_filter import RecordingFilter, RECORD_ALWAYS, RECORD_ON_CHANGE, \
+    RECORD_ABSOLUTE_DEADBAND, RECORD_RELATIVE_DEADBAND
+
+
+def record(recording_filter, values, now):
+    """Records a sample like the data handler after it has been stored"""
+    recorded = recording_filter.should_record(values, now)
+    if recorded:
+        recording_filter.record(values, now)
+    return recorded
+
+
+class TestRecordingFilter(unittest.TestCase):
+
+    def test_always(self):
+        recording_filter = RecordingFilter(RECORD_ALWAYS)
+        self.assertTrue(record(recording_filter, {'value': 1}, 0))
+        self.assertTrue(record(recording_filter, {'value': 1}, 1))
+
+    def test_on_change(self):
+        recording_filter = RecordingFilter(RECORD_ON_CHANGE)
+        self.assertTrue(record(recording_filter, {'value': 'idle'}, 0))
+        self.assertFalse(record(recording_filter, {'value': 'idle'}, 1))
+        self.assertTrue(record(recording_filter, {'value': 'running'}, 2))
+        self.assertTrue(record(recording_filter, {'value': 'running', 'error': ''}, 3))
+
+    def test_absolute_deadband(self):
+        recording_filter = RecordingFilter(RECORD_ABSOLUTE_DEADBAND, deadband=0.5)
+        self.assertTrue(record(recording_filter, {'value': 20.0}, 0))
+        self.assertFalse(record(recording_filter, {'value': 20.4}, 1))
+        # The change is measured from the last recorded value, so slow drifts are recorded eventually
+        self.assertTrue(record(recording_filter, {'value': 20.6}, 2))
+        self.assertFalse(record(recording_filter, {'value': 20.2}, 3))
+
+    def test_relative_deadband(self):
+        recording_filter = RecordingFilter(RECORD_RELATIVE_DEADBAND, deadband=0.1)
+        self.assertTrue(record(recording_filter, {'value': 100}, 0))
+        self.assertFalse(record(recording_filter, {'value': 109}, 1))
+        self.assertTrue(record(recording_filter, {'value': 89}, 2))
+
+    def test_deadband_compares_non_numeric_values(self):
+        recording_filter = RecordingFilter(RECORD_ABSOLUTE_DEADBAND, deadband=5)
+        self.assertTrue(record(recording_filter, {'value': False}, 0))
+        self.assertTrue(record(recording_filter, {'value': True}, 1))
+
+    def test_max_silence(self):
+        recording_filter = RecordingFilter(RECORD_ON_CHANGE, max_silence=60)
+        self.assertTrue(record(recording_filter, {'value': 1}, 0))
+        self.assertFalse(record(recording_filter, {'value': 1}, 59))
+        self.assertTrue(record(recording_filter, {'value': 1}, 60))
+        self.assertFalse(record(recording_filter, {'value': 1}, 119))
+
+    def test_sample_that_was_not_stored_is_not_remembered(self):
+        recording_filter = RecordingFilter(RECORD_ON_CHANGE)
+        self.assertTrue(recording_filter.should_record({'value': 1}, 0))
+        # The sample was dropped by the write path, so the next one is still compared with nothing
+        self.assertTrue(recording_filter.should_record({'value': 1}, 1))
+        recording_filter.record({'value': 1}, 1)
+        self.assertFalse(recording_filter.should_record({'value': 1}, 2))
+
+    def test_configure_changes_the_mode(self):
+        recording_filter = RecordingFilter(RECORD_ON_CHANGE)
+        self.assertTrue(record(recording_filter, {'value': 20.0}, 0))
+        recording_filter.configure(RECORD_ABSOLUTE_DEADBAND, deadband=0.5)
+        # The first sample after the change is recorded, then the new mode applies
+        self.assertTrue(record(recording_filter, {'value': 20.0}, 1))
+        self.assertFalse(record(recording_filter, {'value': 20.4}, 2))
+        recording_filter.configure(RECORD_ALWAYS)
+        self.assertTrue(record(recording_filter, {'value': 20.0}, 3))
+        self.assertTrue(record(recording_filter, {'value': 20.0}, 4))
+        with self.assertRaises(ValueError):
+            recording_filter.configure('sometimes')
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            RecordingFilter('sometimes')
+
+
+if __name__ == '__main__':
+    unittest.main()
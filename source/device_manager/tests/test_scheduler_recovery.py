@@ -0,0 +1,148 @@
+import unittest
+from collections import deque
+from unittest import mock
+
+import docker
+
+from source.device_manager.experiment import ExperimentStatus
+
+# The scheduler creates its docker client on import, which would look up the API version of a running daemon
+with mock.patch('docker.from_env'):
+    import scheduler
+
+
+class FakeRedis:
+    """The hash and publish commands of Redis used by the scheduler"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.published = []
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[str(field).encode()] = value
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(str(field).encode() if not isinstance(field, bytes) else field, None)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+def make_state(experiment_id, container_id='0', status=ExperimentStatus.RUNNING):
+    return scheduler.ExperimentState(experiment_id, f'experiment {experiment_id}', f'job {experiment_id}', container_id,
+                                     1600000000, 1600003600, status, deque())
+
+
+class TestExperimentStateRecovery(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.docker_client = mock.Mock()
+        self.containers = {}
+
+        def get_container(container_id):
+            if container_id not in self.containers:
+                raise docker.errors.NotFound('No such container')
+            return self.containers[container_id]
+
+        self.docker_client.containers.get.side_effect = get_container
+        self.scheduler = mock.Mock()
+        self.scheduler.get_job.return_value = None
+        patches = [
+            mock.patch.object(scheduler, 'redis_connection', self.redis),
+            mock.patch.object(scheduler, 'docker_client', self.docker_client),
+            mock.patch.object(scheduler, 'scheduler', self.scheduler),
+            mock.patch.object(scheduler, 'container_supervisor', mock.Mock()),
+            mock.patch.object(scheduler, 'data_handler', mock.Mock()),
+            mock.patch.object(scheduler, 'start_data_handling_for_experiment', mock.Mock()),
+            mock.patch.object(scheduler.experiment, 'get_experiment', mock.Mock()),
+            mock.patch.dict(scheduler.experiments, clear=True),
+            mock.patch.dict(scheduler.job_to_experiment, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def add_container(self, container_id, status):
+        container = mock.Mock(id=container_id, status=status)
+        container.name = container_id
+        self.containers[container_id] = container
+        return container
+
+    def stored_ids(self):
+        return sorted(int(key) for key in self.redis.hgetall(scheduler.EXPERIMENT_STATE_KEY))
+
+    def test_state_round_trip(self):
+        scheduler.save_experiment_state(make_state(1, 'abc', ExperimentStatus.WAITING_FOR_EXECUTION))
+        scheduler.save_experiment_state(make_state(2))
+        scheduler.save_experiment_state(make_state(2, status=ExperimentStatus.FINISHED_SUCCESSFUL))
+        states = scheduler.load_experiment_states()
+        self.assertEqual(len(states), 1)
+        state = states[0]
+        self.assertEqual((state.experiment_id, state.name, state.job_id, state.container_id, state.start_time,
+                          state.end_time, state.status),
+                         (1, 'experiment 1', 'job 1', 'abc', 1600000000, 1600003600,
+                          ExperimentStatus.WAITING_FOR_EXECUTION))
+
+    def test_unreadable_state_is_discarded(self):
+        scheduler.save_experiment_state(make_state(1))
+        self.redis.hset(scheduler.EXPERIMENT_STATE_KEY, 2, b'\xc1')
+        self.assertEqual([state.experiment_id for state in scheduler.load_experiment_states()], [1])
+        self.assertEqual(self.stored_ids(), [1])
+
+    def test_exited_container_is_watched_again(self):
+        self.add_container('exited', 'exited')
+        scheduler.save_experiment_state(make_state(1, 'exited'))
+        scheduler.recover_experiments()
+        scheduler.container_supervisor.watch.assert_called_once_with('exited', 1)
+        scheduler.start_data_handling_for_experiment.assert_called_once()
+        self.assertEqual(scheduler.experiments[1].status, ExperimentStatus.RUNNING)
+        self.assertEqual(self.stored_ids(), [1])
+
+    def test_container_that_was_never_started_is_removed(self):
+        container = self.add_container('created', 'created')
+        scheduler.save_experiment_state(make_state(1, 'created'))
+        scheduler.recover_experiments()
+        container.remove.assert_called_once_with(force=True)
+        scheduler.container_supervisor.watch.assert_not_called()
+        self.assertEqual(scheduler.experiments[1].status, ExperimentStatus.FINISHED_ERROR)
+        self.assertEqual(self.stored_ids(), [])
+
+    def test_missing_container_fails_the_experiment(self):
+        scheduler.save_experiment_state(make_state(1, 'gone'))
+        scheduler.recover_experiments()
+        self.assertEqual(scheduler.experiments[1].status, ExperimentStatus.FINISHED_ERROR)
+        self.assertEqual(self.stored_ids(), [])
+
+    def test_waiting_experiment_keeps_its_job(self):
+        self.scheduler.get_job.return_value = mock.Mock()
+        scheduler.save_experiment_state(make_state(1, status=ExperimentStatus.WAITING_FOR_EXECUTION))
+        scheduler.recover_experiments()
+        self.scheduler.get_job.assert_called_once_with('job 1')
+        self.assertEqual(scheduler.experiments[1].status, ExperimentStatus.WAITING_FOR_EXECUTION)
+        self.assertEqual(self.stored_ids(), [1])
+
+    def test_deleted_experiment_does_not_stop_the_recovery(self):
+        self.add_container('deleted', 'running')
+        self.add_container('running', 'running')
+        scheduler.save_experiment_state(make_state(1, 'deleted'))
+        scheduler.save_experiment_state(make_state(2, 'running'))
+
+        def get_experiment(experiment_id):
+            if experiment_id == 1:
+                # Raised by get_experiment for the missing row of a deleted experiment
+                raise TypeError("'NoneType' object is not subscriptable")
+            return mock.Mock()
+
+        scheduler.experiment.get_experiment.side_effect = get_experiment
+        scheduler.recover_experiments()
+        self.assertEqual(scheduler.experiments[1].status, ExperimentStatus.FINISHED_ERROR)
+        self.assertEqual(scheduler.experiments[2].status, ExperimentStatus.RUNNING)
+        self.assertEqual(self.stored_ids(), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from influxdb.line_protocol import make_line
+
+from source.device_manager.ingestion import Sample
+from source.device_manager.time_series_sink import LineProtocolEncoder, TimescaleSink, parse_sink_names
+
+
+class TestLineProtocolEncoder(unittest.TestCase):
+
+    def test_same_lines_as_influxdb_client(self):
+        samples = [
+            Sample('device_manager', {'device': 'a b', 'feature': 'x,y', 'property': 'k=v'},
+                   {'temperature/real': 37.5, 'count/integer': 3, 'on/boolean': True, 'unit/string': 'deg "C"\n'},
+                   1600000000123456789),
+            Sample('device_manager', {'feature': 'F', 'device': 'd', 'command': ''}, {'value': -1.0}, 1),
+        ]
+        encoder = LineProtocolEncoder()
+        expected = ''.join(make_line(s.measurement, s.tags, s.fields, s.time) + '\n' for s in samples)
+        self.assertEqual(encoder.encode(samples).decode(), expected)
+        # The second call uses the cached tag strings
+        self.assertEqual(encoder.encode(samples).decode(), expected)
+
+    def test_samples_without_fields_are_skipped(self):
+        samples = [Sample('m', {'device': 'd'}, {'value': None}, 1), Sample('m', {'device': 'd'}, {'value': 1}, 2)]
+        self.assertEqual(LineProtocolEncoder().encode(samples), b'm,device=d value=1i 2\n')
+
+    def test_other_values_are_quoted(self):
+        samples = [Sample('m', {}, {'values': [1, 2]}, 1)]
+        self.assertEqual(LineProtocolEncoder().encode(samples), b'm values="[1, 2]" 1\n')
+
+    def test_non_finite_floats_are_left_out(self):
+        samples = [Sample('m', {}, {'a': float('nan'), 'b': float('inf'), 'c': 1.5}, 1),
+                   Sample('m', {}, {'value': float('-inf')}, 2)]
+        self.assertEqual(LineProtocolEncoder().encode(samples), b'm c=1.5 1\n')
+
+
+class TestTimescaleSink(unittest.TestCase):
+
+    def test_copy_rows(self):
+        samples = [Sample('device_manager', {'device': 'd'}, {'text': 'a\tb\\c'}, 1600000000123456789)]
+        self.assertEqual(TimescaleSink().encode(samples),
+                         b'2020-09-13 12:26:40.123456+00\tdevice_manager\t{"device": "d"}\t'
+                         b'{"text": "a\\\\tb\\\\\\\\c"}\n')
+
+    def test_non_finite_floats_are_left_out(self):
+        samples = [Sample('m', {}, {'a': float('nan'), 'b': 2.0}, 1600000000000000000)]
+        self.assertEqual(TimescaleSink().encode(samples), b'2020-09-13 12:26:40.000000+00\tm\t{}\t{"b": 2.0}\n')
+
+
+class TestSinkNames(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_sink_names(None), ['influx'])
+        self.assertEqual(parse_sink_names('influx, file'), ['influx', 'file'])
+
+
+if __name__ == '__main__':
+    unittest.main()
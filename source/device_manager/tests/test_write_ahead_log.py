@@ -0,0 +1,218 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import List
+
+import msgpack
+
+import source.device_manager.ingestion as ingestion
+from source.device_manager.device_layer.database_info import DatabaseInfo
+from source.device_manager.ingestion import Sample, _DatabaseQueue, OVERFLOW_BLOCK
+from source.device_manager.time_series_sink import TimeSeriesSink
+from source.device_manager.write_ahead_log import WriteAheadLog, CorruptRecordError, merge_range
+
+# A record of this payload fills half of a segment of 64 bytes together with its header
+PAYLOAD = b'x' * 24
+SEGMENT_SIZE = 64
+
+
+class TestWriteAheadLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.wal = WriteAheadLog(self.directory.name, SEGMENT_SIZE, 3)
+
+    def tearDown(self):
+        self.wal.close()
+        self.directory.cleanup()
+
+    def reopen(self):
+        self.wal.close()
+        self.wal = WriteAheadLog(self.directory.name, SEGMENT_SIZE, 3)
+
+    def segment_files(self):
+        return sorted(name for name in os.listdir(self.directory.name) if name.endswith('.log'))
+
+    def test_segment_rollover(self):
+        positions = [self.wal.append(PAYLOAD) for _ in range(3)]
+        self.assertEqual(positions, [(0, 32), (32, 64), (64, 96)])
+        self.assertEqual(len(self.segment_files()), 2)
+        self.assertEqual([end for end, _ in self.wal.read(0, self.wal.end, 10)], [32, 64, 96])
+
+    def test_oldest_segment_is_lost_when_full(self):
+        for _ in range(7):
+            self.wal.append(PAYLOAD)
+        self.assertEqual(len(self.segment_files()), 3)
+        self.assertEqual(self.wal.lost_bytes, SEGMENT_SIZE)
+        self.assertEqual(self.wal.start, SEGMENT_SIZE)
+
+    def test_checkpoint_deletes_processed_segments(self):
+        for _ in range(5):
+            self.wal.append(PAYLOAD)
+        self.wal.set_checkpoint(160)
+        self.assertEqual(len(self.segment_files()), 1)
+        self.reopen()
+        self.assertEqual(self.wal.checkpoint, 160)
+        self.assertEqual(self.wal.start, 160)
+        self.assertEqual(list(self.wal.read(self.wal.start, self.wal.end, 10)), [])
+
+    def test_records_after_checkpoint_survive_restart(self):
+        for payload in (b'a' * 24, b'b' * 24, b'c' * 24):
+            self.wal.append(payload)
+        self.wal.set_checkpoint(32)
+        self.reopen()
+        self.assertEqual(self.wal.end, 96)
+        self.assertEqual([payload for _, payload in self.wal.read(self.wal.start, self.wal.end, 10)],
+                         [b'b' * 24, b'c' * 24])
+        self.assertEqual(self.wal.append(PAYLOAD), (96, 128))
+
+    def test_torn_record_ends_the_log(self):
+        self.wal.append(PAYLOAD)
+        self.wal.append(PAYLOAD)
+        self.wal.close()
+        # Only part of the second record reached the disk
+        with open(os.path.join(self.directory.name, self.segment_files()[0]), 'r+b') as file:
+            file.seek(50)
+            file.write(b'\0' * 14)
+        self.wal = WriteAheadLog(self.directory.name, SEGMENT_SIZE, 3)
+        self.assertEqual(self.wal.end, 32)
+
+    def test_read_stops_before_corrupt_record(self):
+        for _ in range(3):
+            self.wal.append(PAYLOAD)
+        segment = self.wal._segments[0]
+        segment.map[40] ^= 0xff
+        self.assertEqual([end for end, _ in self.wal.read(0, self.wal.end, 10)], [32])
+        with self.assertRaises(CorruptRecordError) as context:
+            list(self.wal.read(32, self.wal.end, 10))
+        self.assertEqual(context.exception.position, 32)
+
+    def test_merge_range(self):
+        ranges = []
+        merge_range(ranges, 0, 10)
+        merge_range(ranges, 10, 20)
+        merge_range(ranges, 30, 40)
+        self.assertEqual(ranges, [[0, 20], [30, 40]])
+
+
+class RecordingSink(TimeSeriesSink):
+    name = 'recording'
+
+    def __init__(self, failures: int = 0, rejections: int = 0):
+        super().__init__()
+        self.failures = failures
+        self.rejections = rejections
+        self.batches: List[List[Sample]] = []
+        self.write_times: List[float] = []
+        self.written = threading.Event()
+
+    def encode(self, samples):
+        return b''
+
+    def send(self, info, data):
+        pass
+
+    def write(self, info, samples):
+        if self.rejections > 0:
+            self.rejections -= 1
+            raise ValueError('invalid')
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('unavailable')
+        self.batches.append(list(samples))
+        self.write_times.append(time.monotonic())
+        self.written.set()
+
+    def is_rejection(self, error):
+        return isinstance(error, ValueError)
+
+    def samples(self):
+        return [sample for batch in self.batches for sample in batch]
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.info = DatabaseInfo(1, 'db', 'localhost', 8086, '', '')
+        self.retry_delay = ingestion.RETRY_DELAY
+        ingestion.RETRY_DELAY = 0.1
+
+    def tearDown(self):
+        ingestion.RETRY_DELAY = self.retry_delay
+        self.directory.cleanup()
+
+    def create_queue(self, sink, batch_size=10, replay_rate=100000):
+        wal = WriteAheadLog(self.directory.name, 4096, 4)
+        return _DatabaseQueue(self.info, sink, 1000, batch_size, 0.01, OVERFLOW_BLOCK, wal, replay_rate), wal
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_failed_batch_is_replayed(self):
+        sink = RecordingSink(failures=1)
+        queue, wal = self.create_queue(sink)
+        for i in range(5):
+            queue.put(Sample('m', {'device': 'd'}, {'value': i}, i), None)
+        self.wait_for(lambda: len(sink.samples()) == 5)
+        self.assertEqual([sample.time for sample in sink.samples()], list(range(5)))
+        self.wait_for(lambda: wal.checkpoint == wal.end)
+        self.assertEqual(queue.stats.replayed, 5)
+
+    def test_log_is_replayed_after_restart(self):
+        wal = WriteAheadLog(self.directory.name, 4096, 4)
+        for i in range(3):
+            wal.append(msgpack.packb(['m', {'device': 'd'}, {'value': i}, i]))
+        wal.close()
+        sink = RecordingSink()
+        queue, wal = self.create_queue(sink)
+        self.wait_for(lambda: len(sink.samples()) == 3)
+        self.assertEqual([sample.fields['value'] for sample in sink.samples()], [0, 1, 2])
+        self.wait_for(lambda: wal.checkpoint == wal.end)
+
+    def test_rejected_batch_is_skipped(self):
+        sink = RecordingSink(rejections=1)
+        queue, wal = self.create_queue(sink, batch_size=2)
+        for i in range(2):
+            queue.put(Sample('m', {'device': 'd'}, {'value': i}, i), None)
+        self.wait_for(lambda: queue.stats.rejected == 2 and wal.checkpoint == wal.end)
+        # The database is not considered unavailable, the next batch is written right away
+        for i in range(2, 4):
+            queue.put(Sample('m', {'device': 'd'}, {'value': i}, i), None)
+        self.wait_for(lambda: len(sink.samples()) == 2)
+        self.assertEqual([sample.time for sample in sink.samples()], [2, 3])
+        self.assertEqual(queue.stats.replayed, 0)
+
+    def test_replay_skips_corrupt_records(self):
+        wal = WriteAheadLog(self.directory.name, 4096, 4)
+        records = [wal.append(msgpack.packb(['m', {'device': 'd'}, {'value': i}, i])) for i in range(3)]
+        # The second record is corrupt, the third one is in the next segment
+        wal._start_segment(1)
+        wal.append(msgpack.packb(['m', {'device': 'd'}, {'value': 3}, 3]))
+        wal._segments[0].map[records[1][0] + 8] ^= 0xff
+        wal.close()
+        sink = RecordingSink()
+        queue, wal = self.create_queue(sink)
+        self.wait_for(lambda: wal.checkpoint == wal.end)
+        self.assertEqual([sample.fields['value'] for sample in sink.samples()], [0, 3])
+        self.assertEqual(queue.stats.corrupt_bytes, 4096 - records[1][0])
+
+    def test_replay_rate_is_limited(self):
+        wal = WriteAheadLog(self.directory.name, 4096, 4)
+        for i in range(20):
+            wal.append(msgpack.packb(['m', {'device': 'd'}, {'value': i}, i]))
+        wal.close()
+        sink = RecordingSink()
+        self.create_queue(sink, batch_size=10, replay_rate=50)
+        self.wait_for(lambda: len(sink.samples()) == 20)
+        # 10 points at 50 points per second delay the second batch by 0.2 s
+        self.assertGreaterEqual(sink.write_times[1] - sink.write_times[0], 0.18)
+
+
+if __name__ == '__main__':
+    unittest.main()
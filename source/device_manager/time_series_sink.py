@@ -0,0 +1,322 @@
+import json
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import psycopg2
+from influxdb.exceptions import InfluxDBClientError
+
+from source.device_manager.data_directories import DATA_DIRECTORY
+from source.device_manager.device_layer.database_info import DatabaseInfo
+from source.device_manager.influx_writer import get_influx_writer
+
+#: Writes into the InfluxDB database of the database link
+INFLUX_SINK = 'influx'
+#: Appends line protocol to daily files below FILE_SINK_DIRECTORY
+FILE_SINK = 'file'
+#: Copies into a table of the TimescaleDB or PostgreSQL database of the database link
+TIMESCALE_SINK = 'timescale'
+#: The valid sink names
+SINKS = (INFLUX_SINK, FILE_SINK, TIMESCALE_SINK)
+
+#: Directory of the file sink, every database has its own subdirectory
+FILE_SINK_DIRECTORY = os.path.join(DATA_DIRECTORY, 'time_series')
+#: Table of the TimescaleDB sink, created with the first write
+TIMESCALE_TABLE = 'device_manager_samples'
+#: Maximum number of cached tag strings per encoder, the cache is cleared when it is full
+MAX_SERIES = 100000
+
+
+def _escape_key(key: Any) -> str:
+    return str(key).replace('\\', '\\\\').replace(' ', '\\ ').replace(',', '\\,').replace('=', '\\=') \
+        .replace('\n', '\\n')
+
+
+def _escape_string(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+def encode_field_value(value: Any) -> Optional[str]:
+    """Returns a field value in line protocol, None for values without a representation, which are left out"""
+    value_type = type(value)
+    if value_type is float:
+        # Line protocol has no representation of nan and infinity, InfluxDB would reject the whole batch
+        return repr(value) if math.isfinite(value) else None
+    if value_type is str:
+        return _escape_string(value)
+    if value_type is bool:
+        return 'True' if value else 'False'
+    if value_type is int:
+        return f'{value}i'
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return _escape_string(value.decode('utf-8'))
+    # Lists, structures and other values are stored as strings, unquoted they would make the whole batch invalid
+    return _escape_string(str(value))
+
+
+def parse_sink_names(sinks: Optional[str]) -> List[str]:
+    """Returns the sink names of a database link, which are stored comma separated"""
+    if not sinks:
+        return [INFLUX_SINK]
+    return [name.strip() for name in sinks.split(',') if name.strip()]
+
+
+class LineProtocolEncoder:
+    """Encodes samples in InfluxDB line protocol with nanosecond timestamps
+
+    The escaped measurement and tags of a series and the escaped field keys are computed once and cached, since the
+    data handler writes the same few series over and over. Fields without a value are left out and samples without
+    fields are skipped, because InfluxDB rejects the whole batch for a single invalid line.
+    """
+    def __init__(self, max_series: int = MAX_SERIES):
+        self._max_series = max_series
+        self._series: Dict[Hashable, str] = {}
+        self._field_keys: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, measurement: str, tags: Dict[str, str]) -> str:
+        key = (measurement, tuple(tags.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = _escape_key(measurement) + ''.join(
+                f',{_escape_key(name)}={_escape_key(value)}' for name, value in sorted(tags.items())
+                if name != '' and value != '' and value is not None)
+            with self._lock:
+                if len(self._series) >= self._max_series:
+                    self._series.clear()
+                self._series[key] = series
+        return series
+
+    def _get_field_key(self, key: str) -> str:
+        escaped = self._field_keys.get(key)
+        if escaped is None:
+            escaped = _escape_key(key)
+            with self._lock:
+                if len(self._field_keys) >= self._max_series:
+                    self._field_keys.clear()
+                self._field_keys[key] = escaped
+        return escaped
+
+    def encode_line(self, measurement: str, tags: Dict[str, str], fields: Dict[str, Any], time_ns: int) -> str:
+        """Returns the line of a sample without the line break, an empty string if it has no fields"""
+        encoded = []
+        for key in sorted(fields):
+            value = encode_field_value(fields[key])
+            if value is not None:
+                encoded.append(f'{self._get_field_key(key)}={value}')
+        if not encoded:
+            return ''
+        return f'{self._get_series(measurement, tags)} {",".join(encoded)} {time_ns}'
+
+    def encode(self, samples: List[Any]) -> bytes:
+        """Returns the lines of samples with the measurement, tags, fields and time attributes of ingestion.Sample"""
+        lines = [self.encode_line(sample.measurement, sample.tags, sample.fields, sample.time) for sample in samples]
+        return ('\n'.join(line for line in lines if line) + '\n').encode()
+
+
+class TimeSeriesSink(ABC):
+    """Stores batches of samples of the data handler in one kind of time-series storage
+
+    The writer thread and the replay thread of the ingestion pipeline write into the same sink, write() and close()
+    are serialized by a lock of the sink. Encoding and sending are separate, so the encoding cost can be measured on its
+    own.
+    """
+    name = ''
+
+    def __init__(self):
+        # Reentrant, a sink may close itself while sending
+        self._lock = threading.RLock()
+
+    @abstractmethod
+    def encode(self, samples: List[Any]) -> bytes:
+        """Returns the samples in the format of the storage
+
+        :param samples: Objects with the measurement, tags, fields and time attributes of ingestion.Sample
+        """
+
+    @abstractmethod
+    def send(self, info: DatabaseInfo, data: bytes):
+        """Stores encoded samples, raises an exception if they could not be stored
+
+        :param info: The database link
+        :param data: The samples returned by encode
+        """
+
+    def write(self, info: DatabaseInfo, samples: List[Any]):
+        with self._lock:
+            self.send(info, self.encode(samples))
+
+    def is_rejection(self, error: Exception) -> bool:
+        """Whether an error of write() means that the storage rejected the samples, so writing them again would fail
+        again, as opposed to the storage being unavailable
+
+        :param error: The exception raised by write()
+        """
+        return False
+
+    def close(self):
+        pass
+
+
+class InfluxSink(TimeSeriesSink):
+    """Writes batches of line protocol into InfluxDB over the persistent session of the influx writer"""
+    name = INFLUX_SINK
+
+    def __init__(self):
+        super().__init__()
+        self._encoder = LineProtocolEncoder()
+
+    def encode(self, samples: List[Any]) -> bytes:
+        return self._encoder.encode(samples)
+
+    def send(self, info: DatabaseInfo, data: bytes):
+        get_influx_writer(info).write_line_protocol(data)
+
+    def is_rejection(self, error: Exception) -> bool:
+        # 4xx, e.g. a field type conflict; authentication, a missing database and rate limits can change
+        return isinstance(error, InfluxDBClientError) and 400 <= error.code < 500 and \
+            error.code not in (401, 403, 404, 408, 429)
+
+
+class FileSink(TimeSeriesSink):
+    """Appends batches of line protocol to one file per database and UTC day, which can be imported into InfluxDB"""
+    name = FILE_SINK
+
+    def __init__(self, directory: str = FILE_SINK_DIRECTORY):
+        """
+        :param directory: The directory of the files, every database has its own subdirectory
+        """
+        super().__init__()
+        self.directory = directory
+        self._encoder = LineProtocolEncoder()
+
+    def encode(self, samples: List[Any]) -> bytes:
+        return self._encoder.encode(samples)
+
+    def send(self, info: DatabaseInfo, data: bytes):
+        directory = os.path.join(self.directory, str(info.id))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, time.strftime('%Y-%m-%d.lp', time.gmtime())), 'ab') as file:
+            file.write(data)
+
+
+def _finite_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Leaves out nan and infinity, which are not valid JSON and rejected by jsonb"""
+    return {key: value for key, value in fields.items() if type(value) is not float or math.isfinite(value)}
+
+
+def _escape_copy(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class TimescaleSink(TimeSeriesSink):
+    """Copies batches into a table of a TimescaleDB or PostgreSQL database
+
+    Every sample is one row with its time, measurement, tags and fields, the tags and fields as jsonb. The rows of a batch
+    are sent with a single COPY in text format. The table is created with the first write and turned into a hypertable
+    if the TimescaleDB extension is installed.
+    """
+    name = TIMESCALE_SINK
+
+    def __init__(self, table: str = TIMESCALE_TABLE):
+        """
+        :param table: The name of the table
+        """
+        super().__init__()
+        self.table = table
+        self._connection = None
+        self._info: Optional[DatabaseInfo] = None
+        self._tags: Dict[Hashable, str] = {}
+        # The formatted second of the last sample, consecutive samples mostly share it
+        self._second: Tuple[int, str] = (-1, '')
+
+    def _format_time(self, time_ns: int) -> str:
+        second, nanoseconds = divmod(time_ns, 10 ** 9)
+        if second != self._second[0]:
+            self._second = (second, datetime.utcfromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S'))
+        return f'{self._second[1]}.{nanoseconds // 1000:06d}+00'
+
+    def _format_tags(self, tags: Dict[str, str]) -> str:
+        key = tuple(tags.items())
+        formatted = self._tags.get(key)
+        if formatted is None:
+            if len(self._tags) >= MAX_SERIES:
+                self._tags.clear()
+            formatted = _escape_copy(json.dumps(tags, default=str))
+            self._tags[key] = formatted
+        return formatted
+
+    def encode(self, samples: List[Any]) -> bytes:
+        rows = [f'{self._format_time(sample.time)}\t{_escape_copy(sample.measurement)}\t{self._format_tags(sample.tags)}'
+                f'\t{_escape_copy(json.dumps(_finite_fields(sample.fields), default=str))}\n' for sample in samples]
+        return ''.join(rows).encode()
+
+    def _connect(self, info: DatabaseInfo):
+        if self._connection is not None and self._info != info:
+            self.close()
+        if self._connection is None:
+            connection = psycopg2.connect(host=info.address, port=info.port, user=info.username,
+                                          password=info.password, dbname=info.name)
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'create table if not exists {self.table} (time timestamptz not null, '
+                                   'measurement text, tags jsonb, fields jsonb)')
+                    # The export of an experiment selects its samples by tag
+                    cursor.execute(f'create index if not exists {self.table}_experiment on {self.table} '
+                                   "((tags->>'experiment'), time)")
+            try:
+                with connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute("select 1 from pg_extension where extname = 'timescaledb'")
+                        if cursor.fetchone() is not None:
+                            cursor.execute('select create_hypertable(%s, %s, if_not_exists => true)',
+                                           [self.table, 'time'])
+            except psycopg2.Error as e:
+                print(f'Could not create the hypertable {self.table} in database {info.name}: {e}')
+            self._connection = connection
+            self._info = info
+        return self._connection
+
+    def send(self, info: DatabaseInfo, data: bytes):
+        connection = self._connect(info)
+        try:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(f'copy {self.table} (time, measurement, tags, fields) from stdin', BytesIO(data))
+        except psycopg2.Error:
+            # The connection may be broken, the next batch connects again
+            self.close()
+            raise
+
+    def is_rejection(self, error: Exception) -> bool:
+        return isinstance(error, (psycopg2.DataError, psycopg2.IntegrityError))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.close()
+                finally:
+                    self._connection = None
+                    self._info = None
+
+
+def create_sink(name: str) -> TimeSeriesSink:
+    """Returns a new sink
+
+    :param name: One of SINKS
+    """
+    if name == INFLUX_SINK:
+        return InfluxSink()
+    if name == FILE_SINK:
+        return FileSink()
+    if name == TIMESCALE_SINK:
+        return TimescaleSink()
+    raise ValueError(f'Unknown sink {name}, expected one of {", ".join(SINKS)}')
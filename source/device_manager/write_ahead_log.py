@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Tuple
+
+import filelock
+
+#: Size of one segment file in bytes
+SEGMENT_SIZE = 16 * 1024 * 1024
+#: Maximum number of segment files, the oldest segment is deleted when a new one would exceed it
+MAX_SEGMENTS = 64
+
+# Every record starts with the length and the crc32 of its payload
+_HEADER = struct.Struct('<II')
+_CHECKPOINT_FILE = 'checkpoint'
+_LOCK_FILE = 'lock'
+
+
+class WriteAheadLogError(Exception):
+    """Raised if a record can not be stored in the log"""
+
+
+class CorruptRecordError(WriteAheadLogError):
+    """Raised if the checksum of a record does not match its payload"""
+    def __init__(self, position: int):
+        super().__init__(f'Corrupt record at position {position}')
+        #: The position of the corrupt record
+        self.position = position
+
+
+class _Segment:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        with open(path, 'a+b') as file:
+            if os.path.getsize(path) < size:
+                file.truncate(size)
+        self._file = open(path, 'r+b')
+        self.map = mmap.mmap(self._file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self._file.close()
+
+
+class WriteAheadLog:
+    """An append-only log of records in memory-mapped segment files
+
+    Positions are byte offsets over all segments, i.e. segment index * segment size + offset in the segment. append()
+    only writes into the memory map, sync() makes the appended records durable, so the cost of fsync can be shared by
+    many records. The checkpoint is the position up to which the records have been processed; segments below the
+    checkpoint are deleted. If the log grows beyond max_segments, the oldest segment is deleted even if its records
+    have not been processed. Only one instance at a time can open a directory.
+    """
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE, max_segments: int = MAX_SEGMENTS):
+        """
+        :param directory: The directory of the segment files, created if it does not exist
+        :param segment_size: Size of one segment file in bytes
+        :param max_segments: Maximum number of segment files
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.lost_bytes = 0
+        self._lock = threading.RLock()
+        self._segments = {}
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        self._file_lock = filelock.FileLock(os.path.join(directory, _LOCK_FILE))
+        try:
+            self._file_lock.acquire(timeout=0)
+        except filelock.Timeout:
+            raise WriteAheadLogError(f'The write-ahead log in {directory} is used by another process')
+        indices = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.log'))
+        for index in indices:
+            self._segments[index] = _Segment(self._segment_path(index), segment_size)
+        if not indices:
+            self._segments[0] = _Segment(self._segment_path(0), segment_size)
+            indices = [0]
+        self._checkpoint = max(self._read_checkpoint(), indices[0] * segment_size)
+        self._end = self._find_end(indices[-1])
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f'{index:012d}.log')
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT_FILE), 'r') as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _read_record(self, position: int) -> Tuple[int, bytes]:
+        """Returns the position after the record and its payload, an empty payload marks the end of a segment"""
+        segment = self._segments[position // self.segment_size]
+        offset = position % self.segment_size
+        if offset + _HEADER.size > self.segment_size:
+            return (position // self.segment_size + 1) * self.segment_size, b''
+        length, crc = _HEADER.unpack_from(segment.map, offset)
+        if length == 0 or offset + _HEADER.size + length > self.segment_size:
+            return (position // self.segment_size + 1) * self.segment_size, b''
+        payload = segment.map[offset + _HEADER.size:offset + _HEADER.size + length]
+        if zlib.crc32(payload) != crc:
+            raise CorruptRecordError(position)
+        return position + _HEADER.size + length, payload
+
+    def _find_end(self, index: int) -> int:
+        """Scans the last segment for the end of the valid records, e.g. after a crash"""
+        position = index * self.segment_size
+        while position < (index + 1) * self.segment_size:
+            try:
+                next_position, payload = self._read_record(position)
+            except WriteAheadLogError:
+                break
+            if not payload:
+                break
+            position = next_position
+        return position
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    @property
+    def checkpoint(self) -> int:
+        return self._checkpoint
+
+    @property
+    def start(self) -> int:
+        """The position of the oldest record that is still stored"""
+        with self._lock:
+            return max(self._checkpoint, min(self._segments) * self.segment_size)
+
+    def append(self, payload: bytes) -> Tuple[int, int]:
+        """Appends a record
+
+        :param payload: The content of the record
+        :return: The position of the record and the position after it
+        """
+        size = _HEADER.size + len(payload)
+        if size > self.segment_size or not payload:
+            raise WriteAheadLogError(f'Record of {len(payload)} bytes can not be stored')
+        with self._lock:
+            index = self._end // self.segment_size
+            if index not in self._segments:
+                self._start_segment(index)
+            elif self._end % self.segment_size + size > self.segment_size:
+                self._start_segment(index + 1)
+            offset = self._end % self.segment_size
+            segment = self._segments[self._end // self.segment_size]
+            _HEADER.pack_into(segment.map, offset, len(payload), zlib.crc32(payload))
+            segment.map[offset + _HEADER.size:offset + size] = payload
+            start = self._end
+            self._end += size
+            self._dirty = True
+            return start, self._end
+
+    def _start_segment(self, index: int):
+        # The unused rest of the previous segment is zero, which reads as the end of the segment
+        if index - 1 in self._segments:
+            self._segments[index - 1].map.flush()
+        while len(self._segments) >= self.max_segments:
+            oldest = min(self._segments)
+            oldest_end = (oldest + 1) * self.segment_size
+            if self._checkpoint < oldest_end:
+                self.lost_bytes += oldest_end - self._checkpoint
+                self._checkpoint = oldest_end
+            self._delete_segment(oldest)
+        self._segments[index] = _Segment(self._segment_path(index), self.segment_size)
+        self._end = index * self.segment_size
+
+    def _last_segment_index(self) -> int:
+        """The index of the segment that contains the last record"""
+        return max(self._end - 1, 0) // self.segment_size
+
+    def _delete_segment(self, index: int):
+        segment = self._segments.pop(index)
+        segment.close()
+        os.remove(segment.path)
+
+    def read(self, start: int, end: int, max_records: int) -> Iterator[Tuple[int, bytes]]:
+        """Reads the records between two positions
+
+        :param start: Position of the first record
+        :param end: Position after the last record
+        :param max_records: Maximum number of records to read
+        :return: Tuples of the position after the record and the payload of the record; the records before a corrupt
+            record if there are any, otherwise CorruptRecordError is raised
+        """
+        with self._lock:
+            records = []
+            position = max(start, self.start)
+            while position < min(end, self._end) and len(records) < max_records:
+                try:
+                    position, payload = self._read_record(position)
+                except CorruptRecordError:
+                    if records:
+                        break
+                    raise
+                if payload:
+                    records.append((position, payload))
+            return iter(records)
+
+    def sync(self):
+        """Writes the appended records to the disk"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._segments[self._last_segment_index()].map.flush()
+            self._dirty = False
+
+    def set_checkpoint(self, position: int):
+        """Marks all records before the position as processed, segments that only contain processed records are
+        deleted"""
+        with self._lock:
+            if position <= self._checkpoint:
+                return
+            self._checkpoint = position
+            path = os.path.join(self.directory, _CHECKPOINT_FILE)
+            with open(f'{path}.tmp', 'w') as file:
+                file.write(str(position))
+            os.replace(f'{path}.tmp', path)
+            for index in sorted(self._segments):
+                if (index + 1) * self.segment_size <= position and index != self._last_segment_index():
+                    self._delete_segment(index)
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+            self._file_lock.release()
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int):
+    """Adds the range [start, end) to a sorted list of ranges, merging it with the last range if they touch"""
+    if ranges and ranges[-1][1] >= start:
+        ranges[-1][1] = max(ranges[-1][1], end)
+    else:
+        ranges.append([start, end])
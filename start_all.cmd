@@ -2,4 +2,5 @@ docker start postgres
 docker start redis
 start "Backend" run_backend_server.bat
 start "Scheduler" python scheduler.py
+start "Device Status Monitor" python device_status_monitor.py
 start "Frontend" /d frontend npm start